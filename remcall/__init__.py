@@ -29,8 +29,13 @@ from .codec.write import SchemaWriter, write_schema, schema_to_bytes
 from .communication.bridge import Bridge
 from .communication.receive import Receiver
 from .communication.send import Sender
+from .communication.runtime import SchemaRuntime
+from .communication.asyncio_bridge import AsyncBridge
+from .communication.registry import SchemaRegistry, Listener
+from .cache import SchemaCache
 
 __all__ = ['schema', 'RemcallError',
            'SchemaReader', 'read_schema', 'schema_from_bytes',
            'SchemaWriter', 'write_schema', 'schema_to_bytes',
-           'Bridge', 'Receiver', 'Sender']
+           'Bridge', 'AsyncBridge', 'Receiver', 'Sender', 'SchemaRuntime',
+           'SchemaCache', 'SchemaRegistry', 'Listener']
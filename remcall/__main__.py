@@ -1,9 +1,10 @@
 '''IPC using remote method calls and object proxying
    between different programming languages'''
 
+import os
 from argparse import ArgumentParser
 
-from . import read_schema, schema_to_bytes
+from . import read_schema, schema_to_bytes, SchemaCache
 from .schema import Schema
 from .generate import CSharphCodeGenerator
 
@@ -33,14 +34,28 @@ def load_schema_from_file(fname):
             return read_schema(f)
 
 
+def load_schema(args):
+    '''Loads the schema file given in args, using the cache directory
+       from --cache-dir or REMCALL_CACHE_DIR if set
+    '''
+    cache_dir = args.cache_dir or os.environ.get('REMCALL_CACHE_DIR')
+    if cache_dir:
+        return SchemaCache(cache_dir).load_schema(args.schema,
+                                                  load_schema_from_file)
+    return load_schema_from_file(args.schema)
+
+
 parser = ArgumentParser(prog='remcall', description=__doc__)
+parser.add_argument('--cache-dir',
+                    help='Directory caching loaded schemas '
+                         '(default: $REMCALL_CACHE_DIR, no caching if unset)')
 subparsers = parser.add_subparsers(dest='command')
 subparsers.required = True
 
 
 # Pretty print
 def print_schema(args):
-    schema = load_schema_from_file(args.schema)
+    schema = load_schema(args)
     if args.base64:
         import base64
         print(base64.encodebytes(schema_to_bytes(schema)).decode('ascii'))
@@ -64,7 +79,7 @@ print_parser.set_defaults(func=print_schema)
 
 # Generate code
 def generate(args):
-    schema = load_schema_from_file(args.schema)
+    schema = load_schema(args)
     if args.language == 'csharp':
         generator = CSharphCodeGenerator(schema, args.namespace)
     else:
@@ -0,0 +1,148 @@
+'''On-disk cache for schemas and code derived from them.
+
+Schemas are stored in their validated binary form keyed by their sha256
+digest, schema files (e.g. ``.py`` schemas) are indexed by path such that
+loading them again only requires reading the binary schema; the index
+also keeps the oneway flags of the methods, which the binary form lacks.
+Compiled proxy code is stored as marshalled code object keyed by schema
+digest.
+'''
+
+import os
+import json
+import marshal
+from hashlib import sha256
+from binascii import hexlify
+from importlib.util import MAGIC_NUMBER
+from logging import log, DEBUG, WARN
+
+from . import __version__
+from .codec.read import schema_from_bytes
+from .codec.write import schema_to_bytes
+
+
+class SchemaCache:
+    '''Cache directory for schemas and compiled code. An entry for a
+       schema file is valid as long as its modification time and size are
+       unchanged or, if they have changed, its content hash is unchanged.
+       Cache files are replaced atomically; failures to write the cache
+       are logged and otherwise ignored.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, kind, name):
+        return os.path.join(self.directory, kind, name)
+
+    def _read(self, path):
+        try:
+            with open(path, mode='rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data: bytes):
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, mode='wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            log(WARN, 'Writing cache file {} failed: {}'.format(path, ex))
+
+    def get_schema(self, digest: bytes):
+        '''Returns the cached schema with sha256 digest or None'''
+        data = self._read(self._path('schemas', hexlify(digest).decode()))
+        if data is None:
+            return None
+        try:
+            schema = schema_from_bytes(data)
+        except Exception as ex:
+            log(WARN, 'Ignoring invalid cached schema: {!r}'.format(ex))
+            return None
+        return schema if schema.sha256_digest == digest else None
+
+    def put_schema(self, schema):
+        '''Stores schema and returns its sha256 digest'''
+        data = schema_to_bytes(schema)
+        digest = data[-32:]
+        self._write(self._path('schemas', hexlify(digest).decode()), data)
+        return digest
+
+    def _read_index(self, path):
+        '''Returns the index entry in path with its digest as bytes, an
+           empty dict if there is no valid entry
+        '''
+        data = self._read(path)
+        if not data:
+            return {}
+        try:
+            entry = json.loads(data.decode())
+            entry['digest'] = bytes.fromhex(entry['digest'])
+            entry['oneway'] = frozenset(tuple(name)
+                                        for name in entry['oneway'])
+        except Exception as ex:
+            log(WARN, 'Ignoring invalid cache index {}: {!r}'.format(path, ex))
+            return {}
+        return entry
+
+    def _get_indexed_schema(self, entry):
+        schema = self.get_schema(entry['digest'])
+        if schema is not None:
+            schema.set_oneway_methods(entry['oneway'])
+        return schema
+
+    def load_schema(self, fname, load):
+        '''Returns the schema in file fname, calling load(fname) only if
+           the file has no valid cache entry
+        '''
+        fname = os.path.abspath(fname)
+        stat = os.stat(fname)
+        index_path = self._path('sources',
+                                sha256(fname.encode()).hexdigest())
+        entry = self._read_index(index_path)
+        schema = None
+        if entry.get('mtime_ns') == stat.st_mtime_ns \
+                and entry.get('size') == stat.st_size:
+            schema = self._get_indexed_schema(entry)
+        if schema is not None:
+            log(DEBUG, 'Loaded schema for {} from cache'.format(fname))
+            return schema
+        with open(fname, mode='rb') as f:
+            source_hash = sha256(f.read()).hexdigest()
+        if entry.get('source_sha256') == source_hash:
+            schema = self._get_indexed_schema(entry)
+        if schema is None:
+            schema = load(fname)
+            digest = self.put_schema(schema)
+        else:
+            digest = schema.sha256_digest
+        entry = dict(path=fname, mtime_ns=stat.st_mtime_ns,
+                     size=stat.st_size, source_sha256=source_hash,
+                     digest=hexlify(digest).decode(),
+                     oneway=sorted(schema.oneway_methods))
+        self._write(index_path, json.dumps(entry).encode())
+        return schema
+
+    def _code_path(self, digest, name):
+        return self._path('code', '{}-{}-{}-{}'.format(
+            hexlify(digest).decode(), name, __version__,
+            hexlify(MAGIC_NUMBER).decode()))
+
+    def get_code(self, digest: bytes, name):
+        '''Returns the code object cached for schema digest and name or
+           None; code is only valid for the Python and remcall version
+           which compiled it
+        '''
+        data = self._read(self._code_path(digest, name))
+        if data is None:
+            return None
+        try:
+            return marshal.loads(data)
+        except (EOFError, ValueError, TypeError) as ex:
+            log(WARN, 'Ignoring invalid cached code: {}'.format(ex))
+            return None
+
+    def put_code(self, digest: bytes, name, code):
+        self._write(self._code_path(digest, name), marshal.dumps(code))
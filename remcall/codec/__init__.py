@@ -1,4 +1,5 @@
 from .read import SchemaReader
 from .write import SchemaWriter
+from .compile import CompiledSchema
 
-__all__ = ['SchemaReader', 'SchemaWriter']
+__all__ = ['SchemaReader', 'SchemaWriter', 'CompiledSchema']
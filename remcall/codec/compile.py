@@ -0,0 +1,395 @@
+'''Compiles the methods of a schema into specialized encoders and decoders.
+
+Consecutive fixed-width values (integers, floats, enums and object
+references) are combined into a single precomputed ``struct.Struct`` such
+that a method call is packed into one buffer and read back using one read
+per run of fixed-width values instead of one read per value.
+'''
+
+import sys
+from array import array
+from struct import Struct
+
+from ..schema import Interface, Enum, Record, Array, string, void, int8, \
+                     int16, int32, int64, uint8, uint16, uint32, uint64, \
+                     float32, float64
+from ..error import UnknownType
+
+FIXED_WIDTH_FORMATS = {
+    int8: 'b',
+    uint8: 'B',
+    int16: 'h',
+    uint16: 'H',
+    int32: 'i',
+    uint32: 'I',
+    int64: 'q',
+    uint64: 'Q',
+    float32: 'f',
+    float64: 'd'
+}
+SIGNED_INTEGER_FORMATS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+UNSIGNED_INTEGER_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+UINT32 = Struct('!I')
+BATCH_HEADER = Struct('!II')
+NEEDS_BYTESWAP = sys.byteorder == 'little'
+
+
+def _array_typecode(fmt):
+    '''array.array typecode with the same item size as struct format fmt'''
+    size = Struct('!' + fmt).size
+    candidates = {'i': 'il', 'I': 'IL'}.get(fmt, fmt)
+    for typecode in candidates:
+        if array(typecode).itemsize == size:
+            return typecode
+    raise ValueError('No array typecode for struct format {}'.format(fmt))
+
+
+class FixedWidthRun:
+    '''Consecutive fixed-width values packed using a single struct'''
+    def __init__(self, start):
+        self.start = start
+        self.stop = start
+        self.formats = []
+        self.encoders = []
+        self.decoders = []
+
+    def append(self, fmt, encode_value=None, decode_value=None):
+        idx = self.stop - self.start
+        self.formats.append(fmt)
+        if encode_value:
+            self.encoders.append((idx, encode_value))
+        if decode_value:
+            self.decoders.append((idx, decode_value))
+        self.stop += 1
+
+    def finish(self):
+        self.struct = Struct('!' + ''.join(self.formats))
+        self.size = self.struct.size
+
+    def encode(self, context, values, out):
+        vals = values[self.start:self.stop]
+        for idx, encode_value in self.encoders:
+            vals[idx] = encode_value(context, vals[idx])
+        out += self.struct.pack(*vals)
+
+    def decode(self, context, values):
+        vals = context.read_struct(self.struct)
+        if self.decoders:
+            vals = list(vals)
+            for idx, decode_value in self.decoders:
+                vals[idx] = decode_value(context, vals[idx])
+        values.extend(vals)
+
+
+class StringValue:
+    def __init__(self, index):
+        self.index = index
+
+    def encode(self, context, values, out):
+        b = values[self.index].encode('utf8')
+        out += UINT32.pack(len(b))
+        out += b
+
+    def decode(self, context, values):
+        size, = context.read_struct(UINT32)
+        values.append(context.read_from_stream(size).decode('utf8'))
+
+
+class BytesArrayValue:
+    '''Array of uint8, represented as bytes'''
+    def __init__(self, index):
+        self.index = index
+
+    def encode(self, context, values, out):
+        b = values[self.index]
+        out += UINT32.pack(len(b))
+        out += b
+
+    def decode(self, context, values):
+        size, = context.read_struct(UINT32)
+        values.append(context.read_from_stream(size))
+
+
+class FixedWidthArrayValue:
+    '''Array of fixed-width values, packed and unpacked in bulk using
+       array.array; numeric arrays are decoded to array.array instances,
+       arrays of enums or objects to lists
+    '''
+    def __init__(self, index, fmt, encode_value, decode_value):
+        self.index = index
+        self.typecode = _array_typecode(fmt)
+        self.itemsize = array(self.typecode).itemsize
+        self.encode_value = encode_value
+        self.decode_value = decode_value
+
+    def encode(self, context, values, out):
+        vals = values[self.index]
+        if self.encode_value:
+            encode_value = self.encode_value
+            vals = [encode_value(context, val) for val in vals]
+        arr = array(self.typecode, vals)
+        if NEEDS_BYTESWAP:
+            arr.byteswap()
+        out += UINT32.pack(len(arr))
+        out += arr
+
+    def decode(self, context, values):
+        size, = context.read_struct(UINT32)
+        arr = array(self.typecode)
+        arr.frombytes(context.read_from_stream(size * self.itemsize))
+        if NEEDS_BYTESWAP:
+            arr.byteswap()
+        if self.decode_value:
+            decode_value = self.decode_value
+            arr = [decode_value(context, val) for val in arr]
+        values.append(arr)
+
+
+class ArrayValue:
+    '''Array of variable-width values, encoded element by element'''
+    def __init__(self, index, element_codec):
+        self.index = index
+        self.element_codec = element_codec
+
+    def encode(self, context, values, out):
+        vals = values[self.index]
+        out += UINT32.pack(len(vals))
+        encode = self.element_codec.encode
+        for val in vals:
+            encode(context, [val], out)
+
+    def decode(self, context, values):
+        size, = context.read_struct(UINT32)
+        decode = self.element_codec.decode
+        values.append([decode(context)[0] for i in range(size)])
+
+
+class RecordValue:
+    '''Record encoded as the sequence of its fields; records consisting of
+       fixed-width fields only are packed using a single struct. Fields are
+       compiled on first use to allow for recursive record types.
+    '''
+    def __init__(self, index, typ, bytes_object_ref):
+        self.index = index
+        self.typ = typ
+        self.bytes_object_ref = bytes_object_ref
+        self.field_codec = None
+
+    def compile(self):
+        if self.field_codec is None:
+            self.field_codec = ValuesCodec(
+                (tp for tp, name in self.typ.fields), self.bytes_object_ref)
+        return self.field_codec
+
+    @property
+    def is_fixed_width(self):
+        steps = self.compile().steps
+        return len(steps) == 1 and isinstance(steps[0], FixedWidthRun)
+
+    def encode(self, context, values, out):
+        field_codec = self.field_codec or self.compile()
+        field_codec.encode(context, list(values[self.index]._field_values()),
+                           out)
+
+    def decode(self, context, values):
+        field_codec = self.field_codec or self.compile()
+        fields = field_codec.decode(context)
+        values.append(context.get_enum_implementation(self.typ)
+                      ._from_field_values(fields))
+
+
+class VoidValue:
+    def __init__(self, index):
+        self.index = index
+
+    def encode(self, context, values, out):
+        pass
+
+    def decode(self, context, values):
+        values.append(None)
+
+
+class UnsupportedValue:
+    '''Placeholder for types without a binary representation (yet);
+       fails only when actually used to allow compilation of all methods
+    '''
+    def __init__(self, index, typ):
+        self.index = index
+        self.typ = typ
+
+    def encode(self, context, values, out):
+        raise UnknownType(self.typ)
+
+    def decode(self, context, values):
+        raise UnknownType(self.typ)
+
+
+def _object_encoder(typ):
+    def encode_object(context, obj):
+        return context.get_id_for_object(obj, typ)
+    return encode_object
+
+
+def _encode_enum(context, enum_value):
+    return enum_value.value
+
+
+def _object_decoder(typ):
+    def decode_object(context, oid):
+        return context.get_object(oid, typ)
+    return decode_object
+
+
+def _enum_decoder(typ):
+    def decode_enum(context, enum_value):
+        return context.get_enum_implementation(typ)(enum_value)
+    return decode_enum
+
+
+def _fixed_width(typ, object_ref_format):
+    '''Struct format and optional value converters for fixed-width types,
+       None for variable-width types
+    '''
+    if typ in FIXED_WIDTH_FORMATS:
+        return FIXED_WIDTH_FORMATS[typ], None, None
+    elif isinstance(typ, Interface):
+        return object_ref_format, _object_encoder(typ), _object_decoder(typ)
+    elif isinstance(typ, Enum):
+        return 'B', _encode_enum, _enum_decoder(typ)
+    return None
+
+
+class ValuesCodec:
+    '''Encoder and decoder for a fixed sequence of types.
+
+       Values are passed as a list with one entry per type; ``header``
+       contains struct format characters for raw values (e.g. command and
+       request ID) preceding the typed values which are only encoded, never
+       decoded.
+    '''
+    def __init__(self, types, bytes_object_ref, header=''):
+        self.types = list(types)
+        self.steps = []
+        run = None
+        idx = 0
+        for fmt in header:
+            if run is None:
+                run = FixedWidthRun(idx)
+            run.append(fmt)
+            idx += 1
+        object_ref_format = SIGNED_INTEGER_FORMATS[bytes_object_ref]
+        for typ in self.types:
+            fixed = _fixed_width(typ, object_ref_format)
+            if fixed:
+                if run is None:
+                    run = FixedWidthRun(idx)
+                run.append(*fixed)
+            else:
+                if run is not None:
+                    self._add_run(run)
+                    run = None
+                self.steps.append(self._variable_width_value(
+                                    idx, typ, bytes_object_ref))
+            idx += 1
+        if run is not None:
+            self._add_run(run)
+
+    def _variable_width_value(self, idx, typ, bytes_object_ref):
+        if typ == string:
+            return StringValue(idx)
+        elif typ == void:
+            return VoidValue(idx)
+        elif isinstance(typ, Record):
+            return RecordValue(idx, typ, bytes_object_ref)
+        elif isinstance(typ, Array):
+            if typ.typ == uint8:
+                return BytesArrayValue(idx)
+            object_ref_format = SIGNED_INTEGER_FORMATS[bytes_object_ref]
+            fixed = _fixed_width(typ.typ, object_ref_format)
+            if fixed:
+                return FixedWidthArrayValue(idx, *fixed)
+            element_codec = ValuesCodec([typ.typ], bytes_object_ref)
+            if not any(isinstance(step, UnsupportedValue)
+                       for step in element_codec.steps):
+                return ArrayValue(idx, element_codec)
+        return UnsupportedValue(idx, typ)
+
+    def _add_run(self, run):
+        run.finish()
+        self.steps.append(run)
+
+    def encode(self, context, values, out):
+        for step in self.steps:
+            step.encode(context, values, out)
+        return out
+
+    def decode(self, context):
+        values = []
+        for step in self.steps:
+            step.decode(context, values)
+        return values
+
+
+class MethodCodec:
+    def __init__(self, method, method_ref, interface,
+                 bytes_method_ref, bytes_object_ref):
+        self.method = method
+        self.method_ref = method_ref
+        self.interface = interface
+        self.argument_names = [name for typ, name in method.arguments]
+        types = [interface] + [typ for typ, name in method.arguments]
+        header = 'cI' + UNSIGNED_INTEGER_FORMATS[bytes_method_ref]
+        self.call_encoder = ValuesCodec(types, bytes_object_ref, header)
+        self.call_decoder = ValuesCodec(types, bytes_object_ref)
+        argument_types = types[1:]
+        pipelined_header = 'cIIB' + UNSIGNED_INTEGER_FORMATS[bytes_method_ref]
+        self.pipelined_call_encoder = ValuesCodec(argument_types,
+                                                  bytes_object_ref,
+                                                  pipelined_header)
+        self.arguments_decoder = ValuesCodec(argument_types, bytes_object_ref)
+
+
+class CompiledSchema:
+    '''Specialized encoders and decoders for all methods of a schema;
+       freezes the schema
+    '''
+    def __init__(self, schema):
+        self.schema = schema.freeze()
+        self.call_header = Struct('!I' + UNSIGNED_INTEGER_FORMATS[
+                                                    schema.bytes_method_ref])
+        self.pipelined_call_header = Struct('!IIB' + UNSIGNED_INTEGER_FORMATS[
+                                                    schema.bytes_method_ref])
+        self.by_ref = {}
+        self.by_method = {}
+        method_to_interface = schema.method_to_interface
+        for method_ref, method in schema.method_lookup.items():
+            codec = MethodCodec(method, method_ref,
+                                method_to_interface[method_ref],
+                                schema.bytes_method_ref,
+                                schema.bytes_object_ref)
+            self.by_ref[method_ref] = codec
+            self.by_method[method] = codec
+        self.release_entry = Struct('!' + SIGNED_INTEGER_FORMATS[
+                                        schema.bytes_object_ref] + 'I')
+        self.error_encoder = ValuesCodec([uint8, string],
+                                         schema.bytes_object_ref, 'cI')
+        self.error_decoder = ValuesCodec([uint8, string],
+                                         schema.bytes_object_ref)
+        self.batch_error_encoder = ValuesCodec([uint8, string],
+                                               schema.bytes_object_ref, 'c')
+        self._value_codecs = {}
+        self._return_encoders = {}
+
+    def value_codec(self, typ):
+        codec = self._value_codecs.get(typ)
+        if codec is None:
+            codec = ValuesCodec([typ], self.schema.bytes_object_ref)
+            self._value_codecs[typ] = codec
+        return codec
+
+    def return_encoder(self, typ):
+        encoder = self._return_encoders.get(typ)
+        if encoder is None:
+            encoder = ValuesCodec([typ], self.schema.bytes_object_ref, 'cI')
+            self._return_encoders[typ] = encoder
+        return encoder
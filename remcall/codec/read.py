@@ -10,6 +10,94 @@ from ..schema import *
 from ..schema.typeref import TypeRef
 from .write import SchemaWriter
 
+INT8 = struct.Struct('!b')
+UINT8 = struct.Struct('!B')
+INT16 = struct.Struct('!h')
+UINT16 = struct.Struct('!H')
+INT32 = struct.Struct('!i')
+UINT32 = struct.Struct('!I')
+INT64 = struct.Struct('!q')
+UINT64 = struct.Struct('!Q')
+FLOAT32 = struct.Struct('!f')
+FLOAT64 = struct.Struct('!d')
+
+
+class StreamBuffer:
+    '''Buffered input layer reading large chunks from a stream using
+       readinto (or read if unavailable) into a reusable buffer;
+       short reads are retried until the requested number of bytes
+       is available or the stream is exhausted
+    '''
+    def __init__(self, stream, size=1 << 16):
+        self._stream = stream
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._pos = 0
+        self._end = 0
+        self._readinto = getattr(stream, 'readinto1', None) \
+            or getattr(stream, 'readinto', None)
+
+    @property
+    def available(self):
+        return self._end - self._pos
+
+    def _read_chunk(self, view, bytes_min):
+        if self._readinto:
+            return self._readinto(view)
+        data = self._stream.read(bytes_min)
+        view[:len(data)] = data
+        return len(data)
+
+    def _fill(self, bytes_count: int):
+        available = self._end - self._pos
+        if self._pos + bytes_count > len(self._buffer):
+            if bytes_count > len(self._buffer):
+                self._buffer = bytearray(bytes_count)
+                self._buffer[:available] = self._view[self._pos:self._end]
+                self._view = memoryview(self._buffer)
+            else:
+                self._buffer[:available] = self._buffer[self._pos:self._end]
+            self._pos = 0
+            self._end = available
+        while available < bytes_count:
+            n = self._read_chunk(self._view[self._end:],
+                                 bytes_count - available)
+            if not n:
+                raise WrongNumberOfBytesRead(bytes_count, available, None)
+            self._end += n
+            available += n
+
+    def read(self, bytes_count: int) -> bytes:
+        if bytes_count > len(self._buffer):
+            return self._read_large(bytes_count)
+        if self._end - self._pos < bytes_count:
+            self._fill(bytes_count)
+        pos = self._pos
+        self._pos += bytes_count
+        return bytes(self._view[pos:self._pos])
+
+    def _read_large(self, bytes_count: int) -> bytes:
+        '''Reads large payloads directly into their target buffer'''
+        result = bytearray(bytes_count)
+        view = memoryview(result)
+        available = self._end - self._pos
+        view[:available] = self._view[self._pos:self._end]
+        self._pos = self._end = 0
+        while available < bytes_count:
+            n = self._read_chunk(view[available:], bytes_count - available)
+            if not n:
+                raise WrongNumberOfBytesRead(bytes_count, available, None)
+            available += n
+        return bytes(result)
+
+    def unpack(self, s: struct.Struct) -> tuple:
+        if self._end - self._pos < s.size:
+            self._fill(s.size)
+        pos = self._pos
+        self._pos += s.size
+        return s.unpack_from(self._buffer, pos)
+
+
 class ReaderBase:
     def __init__(self, stream):
         super().__init__()
@@ -35,6 +123,9 @@ class ReaderBase:
         self._hsh.update(b)
         return b
 
+    def read_struct(self, s: struct.Struct) -> tuple:
+        return s.unpack(self.read_from_stream(s.size))
+
     def read_constant(self, bytes_const: bytes):
         bts = self.read_from_stream(len(bytes_const))
         assert bts == bytes_const, 'Expecting {} at offset 0x{:x}, got {}'.format(bytes_const, self._idx - len(bytes_const), bts)
@@ -47,28 +138,28 @@ class ReaderBase:
         return tpl[0]
 
     def read_int8(self):
-        return self.read_struct_format('!b')
+        return self.read_struct(INT8)[0]
 
     def read_uint8(self):
-        return self.read_struct_format('!B')
+        return self.read_struct(UINT8)[0]
 
     def read_int16(self):
-        return self.read_struct_format('!h')
+        return self.read_struct(INT16)[0]
 
     def read_uint16(self):
-        return self.read_struct_format('!H')
+        return self.read_struct(UINT16)[0]
 
     def read_int32(self):
-        return self.read_struct_format('!i')
+        return self.read_struct(INT32)[0]
 
     def read_uint32(self):
-        return self.read_struct_format('!I')
+        return self.read_struct(UINT32)[0]
 
     def read_int64(self):
-        return self.read_struct_format('!q')
+        return self.read_struct(INT64)[0]
 
     def read_uint64(self):
-        return self.read_struct_format('!Q')
+        return self.read_struct(UINT64)[0]
 
     def read_signed_integer(self, nbytes: int):
         assert nbytes in (1, 2, 4, 8), 'Integers have to be 1, 2, 4 or 8 bytes long, got {}'.format(nbytes)
@@ -81,10 +172,10 @@ class ReaderBase:
         return fn()
 
     def read_float32(self):
-        return self.read_struct_format('!f')
+        return self.read_struct(FLOAT32)[0]
 
     def read_float64(self):
-        return self.read_struct_format('!d')
+        return self.read_struct(FLOAT64)[0]
 
     def read_string(self):
         size = self.read_uint32()
@@ -1 +1,3 @@
 from .bridge import Bridge
+from .runtime import SchemaRuntime
+from .asyncio_bridge import AsyncBridge
@@ -0,0 +1,357 @@
+'''Bridge running on an asyncio event loop instead of threads.
+
+Incoming data is collected in a FrameBuffer and decoded using the same
+compiled decoders as the threaded Receiver; if a frame is not complete
+yet, decoding is aborted, more data is awaited and the frame is decoded
+again from its start. Proxies decoded by an aborted attempt are kept alive
+and their receipt is not counted until the frame is decoded completely.
+'''
+
+import asyncio
+from inspect import isawaitable
+from logging import log, DEBUG, INFO, ERROR
+
+from .bridge import Bridge
+from .receive import Receiver
+from .proxy import ProxyType
+from .send import Sender
+from ..error import WrongNumberOfBytesRead, SchemaMismatch
+
+
+class IncompleteFrame(Exception):
+    def __init__(self, required):
+        super().__init__('Frame requires {} bytes'.format(required))
+        self.required = required
+
+
+class FrameBuffer:
+    '''Input buffer for a single frame raising IncompleteFrame on reads
+       beyond the data received so far
+    '''
+    def __init__(self):
+        self.data = bytearray()
+        self.start = 0
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.data) - self.start
+
+    def rewind(self):
+        self.pos = self.start
+
+    def consume(self):
+        self.start = self.pos
+        if self.start > len(self.data) // 2:
+            del self.data[:self.start]
+            self.start = self.pos = 0
+
+    def feed(self, data):
+        self.data += data
+
+    def read(self, bytes_count: int) -> bytes:
+        end = self.pos + bytes_count
+        if end > len(self.data):
+            raise IncompleteFrame(end - self.start)
+        b = bytes(self.data[self.pos:end])
+        self.pos = end
+        return b
+
+    def unpack(self, s):
+        end = self.pos + s.size
+        if end > len(self.data):
+            raise IncompleteFrame(end - self.start)
+        values = s.unpack_from(self.data, self.pos)
+        self.pos = end
+        return values
+
+
+class StreamWriterAdapter:
+    '''Provides the write/flush interface expected by Sender
+       for an asyncio.StreamWriter
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data: bytes):
+        self.writer.write(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class AsyncReceiver(Receiver):
+    '''Receiver decoding frames from a FrameBuffer and executing calls on
+       the event loop (there is no executor); if drain is set, it is
+       awaited after each message such that no further messages are
+       processed while the replies cannot be written
+    '''
+    incomplete_errors = (IncompleteFrame,)
+
+    def __init__(self, schema, reader, get_object, return_method_result,
+                 acknowledge_disconnect, name_converter, runtime=None,
+                 chunk_size=1 << 16, return_batch_result=None,
+                 raise_method_error=None):
+        super().__init__(schema, reader, get_object, return_method_result,
+                         acknowledge_disconnect, name_converter, runtime,
+                         return_batch_result=return_batch_result,
+                         raise_method_error=raise_method_error)
+        self.chunk_size = chunk_size
+        self._tasks = set()
+        self._frame_proxies = []
+        self.uncount_import = None
+        self.drain = None
+        self._oneway_tail = None
+        self._oneway_tasks = set()
+        self._oneway_calling_out = None
+
+    def create_executor(self):
+        return None
+
+    def create_input(self, reader, buffer_size):
+        return FrameBuffer()
+
+    def track_imports(self, store):
+        '''Decodes objects using store and remembers the proxies decoded
+           from the current frame such that their receipt can be uncounted
+           if decoding the frame is aborted
+        '''
+        get_object = store.get_object
+
+        def get_object_in_frame(key, typ):
+            obj = get_object(key, typ)
+            if isinstance(obj, ProxyType):
+                self._frame_proxies.append(obj)
+            return obj
+        self.lookup_object = get_object_in_frame
+        self.uncount_import = store.uncount_import
+
+    def create_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def register_call(self, return_type):
+        task = asyncio.current_task()
+        if task in self._oneway_tasks:
+            self._oneway_calling_out = task
+        return super().register_call(return_type)
+
+    def call_in_order(self, fn, args, oneway=False):
+        '''Calls fn(*args) right away unless a oneway call received before
+           is still running, then an awaitable calling fn after it is
+           returned; calls other than oneway calls are not held back
+           while a oneway call is calling the other side (they might be
+           callbacks it is waiting for)
+        '''
+        tail = self._oneway_tail
+        if tail is None or tail.done() \
+                or (not oneway and self._oneway_calling_out is not None):
+            return fn(*args)
+        return self._call_after(tail, fn, args)
+
+    async def _call_after(self, previous, fn, args):
+        await asyncio.wait([previous])
+        return_value = fn(*args)
+        if isawaitable(return_value):
+            return_value = await return_value
+        return return_value
+
+    def _track_oneway_task(self, task):
+        self._oneway_tail = task
+        self._oneway_tasks.add(task)
+
+        def untrack(task):
+            self._oneway_tasks.discard(task)
+            if self._oneway_calling_out is task:
+                self._oneway_calling_out = None
+            if self._oneway_tail is task:
+                self._oneway_tail = None
+        task.add_done_callback(untrack)
+
+    def execute_method_call(self, request_id, method, method_impl, args,
+                            oneway=False):
+        '''Calls the implementation on the event loop; oneway calls and
+           the calls received after them are started in order, see
+           call_in_order
+        '''
+        log(DEBUG, 'Calling method implementation {} with arguments {}'
+                   .format(method_impl, args))
+        try:
+            return_value = self.call_in_order(method_impl, args, oneway)
+        except Exception as ex:
+            log(ERROR, 'Method implementation {} for request ID {} raised {!r}'
+                       .format(method_impl, request_id, ex), exc_info=ex)
+            self.fail_method_call(request_id, ex, not oneway)
+            return
+        if not isawaitable(return_value):
+            if not oneway:
+                self.complete_method_call(request_id, method, return_value)
+            return
+        task = asyncio.ensure_future(return_value)
+        self._tasks.add(task)
+        if oneway:
+            self._track_oneway_task(task)
+
+        def return_method_result(task):
+            self._tasks.discard(task)
+            if task.cancelled():
+                return
+            ex = task.exception()
+            if ex is not None:
+                log(ERROR, 'Method implementation {} for request ID {} '
+                           'raised {!r}'.format(method_impl, request_id, ex),
+                    exc_info=ex)
+                self.fail_method_call(request_id, ex, not oneway)
+                return
+            if not oneway:
+                self.complete_method_call(request_id, method, task.result())
+        task.add_done_callback(return_method_result)
+
+    def execute_batch_call(self, request_id, calls):
+        async def execute_batch():
+            return_values = []
+            errors = {}
+            for idx, (_, method, this, args) in enumerate(calls):
+                try:
+                    method_impl = self.get_method_implementation(this, method)
+                    return_value = method_impl(*args)
+                    if isawaitable(return_value):
+                        return_value = await return_value
+                except Exception as ex:
+                    log(ERROR, 'Call {} of batch with request ID {} '
+                               'raised {!r}'.format(idx, request_id, ex),
+                        exc_info=ex)
+                    return_value = None
+                    errors[idx] = ex
+                return_values.append(return_value)
+            return return_values, errors
+        task = asyncio.ensure_future(self.call_in_order(execute_batch, ()))
+        self._tasks.add(task)
+
+        def return_batch_result(task):
+            self._tasks.discard(task)
+            if task.cancelled():
+                return
+            ex = task.exception()
+            if ex is not None:
+                log(ERROR, 'Batch call with request ID {} raised {!r}'
+                           .format(request_id, ex), exc_info=ex)
+                self.fail_method_call(request_id, ex)
+                return
+            return_types = [method.return_type for idx, method, _, _ in calls]
+            self.complete_batch_call(request_id, return_types,
+                                     *task.result())
+        task.add_done_callback(return_batch_result)
+
+    async def receive(self, required):
+        '''Reads until required bytes are buffered,
+           False at the end of the stream between two messages
+        '''
+        while len(self._input) < required:
+            chunk = await self._instream.read(max(self.chunk_size,
+                                                  required - len(self._input)))
+            if not chunk:
+                if not len(self._input):
+                    return False
+                raise WrongNumberOfBytesRead(required, len(self._input), None)
+            self._input.feed(chunk)
+        return True
+
+    async def mainloop_async(self):
+        self.exit_mainloop = False
+        try:
+            while not self.exit_mainloop:
+                self._input.rewind()
+                try:
+                    self.process_next()
+                except IncompleteFrame as ex:
+                    for proxy in self._frame_proxies:
+                        self.uncount_import(proxy)
+                    self._frame_proxies.clear()
+                    if not await self.receive(ex.required):
+                        log(INFO, 'End of stream, exiting mainloop')
+                        break
+                else:
+                    self._frame_proxies.clear()
+                    self._input.consume()
+                    if self.drain is not None:
+                        await self.drain()
+        finally:
+            self.close()
+
+
+class AsyncBridge(Bridge):
+    '''Bridge communicating over an asyncio.StreamReader and StreamWriter.
+
+       Proxies are shared with threaded bridges, their methods return
+       awaitables when bound to an AsyncBridge; implementation methods may
+       be coroutine functions which are awaited inside the event loop
+       while regular functions are called directly on the event loop.
+       Promise pipelining is not supported as promise proxies cannot be
+       awaited.
+    '''
+    def __init__(self, schema, reader, writer, main,
+                 enum_record_implementation=None, generation_bits=0):
+        self.writer = writer
+        super().__init__(schema, reader, StreamWriterAdapter(writer), main,
+                         enum_record_implementation,
+                         generation_bits=generation_bits)
+        self.receiver.track_imports(self.store)
+        self.receiver.drain = writer.drain
+
+    def create_receiver(self, reader, executor):
+        return AsyncReceiver(self.runtime.schema, reader, None,
+                             self.return_method, self.acknowledge_disconnect,
+                             self.runtime.name_converter, self.runtime,
+                             return_batch_result=self.return_batch,
+                             raise_method_error=self.raise_method_error)
+
+    def create_sender(self, outstream, cork_interval):
+        return Sender(self.runtime.schema, outstream, None, self.runtime,
+                      cork_interval)
+
+    def create_mainloop(self):
+        self.mainloop = self.receiver.mainloop_async
+        self.mainloop_task = None
+
+    def start(self):
+        self.mainloop_task = asyncio.ensure_future(self.mainloop())
+        return self.mainloop_task
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+        await self.writer.drain()
+        await self.mainloop_task
+
+    def call_method_promise(self, method, this, args):
+        raise RuntimeError('Cannot pipeline calls on the result of {}, '
+                           'AsyncBridge does not support promises'
+                           .format(method.name))
+
+    async def call_method(self, method, this, args):
+        future = self.call_method_async(method, this, args)
+        await self.writer.drain()
+        return await future
+
+    async def check_schema(self, fetch_schema=True):
+        future = self.receiver.expect_schema_digest()
+        self.sender.check_schema()
+        await self.writer.drain()
+        remote_digest = await future
+        if remote_digest == self.runtime.sha256_digest:
+            return
+        remote_schema = None
+        if fetch_schema:
+            future = self.receiver.expect_schema()
+            self.sender.request_schema()
+            await self.writer.drain()
+            remote_schema = await future
+        raise SchemaMismatch(self.runtime.sha256_digest, remote_digest,
+                             remote_schema)
+
+    async def call_method_oneway(self, method, this, args):
+        super().call_method_oneway(method, this, args)
+        await self.writer.drain()
@@ -6,3 +6,21 @@ RETURN_FROM_METHOD = b'\x06'
 NOOP = b'\x07'
 DISCONNECT = b'\x08'
 ACKNOWLEDGE_DISCONNECT = b'\x09'
+CALL_METHOD_ONEWAY = b'\x0a'
+CALL_BATCH = b'\x0b'
+RETURN_BATCH = b'\x0c'
+CALL_METHOD_PROMISE = b'\x0d'
+CALL_PIPELINED = b'\x0e'
+RELEASE_PROMISE = b'\x0f'
+RAISE_FROM_METHOD = b'\x10'
+RELEASE_OBJECTS = b'\x11'
+CHECK_SCHEMA = b'\x12'
+SCHEMA_DIGEST = b'\x13'
+
+# Status of each call within RETURN_BATCH, followed by the return value or
+# by error code and message as in RAISE_FROM_METHOD
+BATCH_CALL_RETURNED = b'\x00'
+BATCH_CALL_RAISED = b'\x01'
+
+# Size of the sha256 digest of a serialized schema
+DIGEST_SIZE = 32
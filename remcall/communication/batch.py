@@ -0,0 +1,79 @@
+from logging import log, DEBUG
+
+from .promise import resolve
+
+
+class Batch:
+    '''Method calls collected by Bridge.batch() to be sent in a single
+       CALL_BATCH message; the other side executes them in order and
+       answers with a single RETURN_BATCH message
+    '''
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.calls = []
+        self.futures = []
+        self.sent = False
+
+    def call_method_async(self, method, this, args):
+        assert not self.sent, 'Batch has already been sent'
+        future = self.bridge.receiver.create_future()
+        args = self.bridge._resolve_arguments(method, args)
+        self.calls.append((method, resolve(this), args))
+        self.futures.append(future)
+        return future
+
+    def send(self):
+        '''Sends all collected calls; returns the future for the list of
+           all return values, in which calls that raised are represented
+           by their exception
+        '''
+        assert not self.sent, 'Batch has already been sent'
+        self.sent = True
+        bridge = self.bridge
+        bridge.release_objects()
+        return_types = [method.return_type for method, _, _ in self.calls]
+        request_id, future = bridge.receiver.register_call(return_types)
+        future.add_done_callback(self._resolve)
+        log(DEBUG, 'Sending batch of {} calls with request ID {}'
+                   .format(len(self.calls), request_id))
+        try:
+            bridge.sender.call_batch(request_id, self.calls)
+        except BaseException as ex:
+            bridge.receiver.method_returns.discard(request_id)
+            future.set_exception(ex)
+            raise
+        return future
+
+    def _resolve(self, future):
+        if future.cancelled():
+            for f in self.futures:
+                f.cancel()
+            return
+        ex = future.exception()
+        if ex is not None:
+            for f in self.futures:
+                if not f.done():
+                    f.set_exception(ex)
+            return
+        for f, return_value in zip(self.futures, future.result()):
+            if f.done():
+                continue
+            if isinstance(return_value, BaseException):
+                f.set_exception(return_value)
+            else:
+                f.set_result(return_value)
+
+    def __enter__(self):
+        local = self.bridge._local
+        if not hasattr(local, 'batches'):
+            local.batches = []
+        local.batches.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.bridge._local.batches.pop()
+        if exc_type is not None:
+            for future in self.futures:
+                future.cancel()
+        elif self.calls:
+            self.send()
@@ -1,32 +1,63 @@
-from .receive import Receiver
+from .receive import Receiver, wait_for_return
 from .send import Sender
 from .store import ReferenceStore
 from .proxy import ProxyFactory
+from .batch import Batch
+from .promise import Promise, resolve, resolve_value
+from .runtime import SchemaRuntime
 from ..implementation import EnumRecordImplementation
-from ..schema import Type
-from threading import Thread
-from ..naming import PythonNameConverter
+from ..schema import Type, void
+from ..error import NotOneway, SchemaMismatch, error_code, error_message
+from threading import Thread, local
 
 
 class Bridge:
+    '''Connection between two remcall participants; schema may either be a
+       Schema or a SchemaRuntime shared with other bridges. Incoming method
+       calls are executed by executor, by default a CallExecutor owned by
+       this bridge. Other executors have to run calls in threads of this
+       process (implementation objects and proxies cannot be pickled) and
+       may deadlock on nested callbacks, as only CallExecutor hands the
+       slot of a worker blocked in a call to the other side to another
+       worker (see blocking()). If pipelining is enabled, proxy methods
+       returning an interface return promise proxies instead of waiting for
+       the result.
+       Blocking calls raise CallTimeout if they do not return within
+       call_timeout seconds (wait forever if None). Messages are written by
+       a writer thread which merges the messages sent within cork_interval
+       seconds (if set) into a single write. With generation_bits > 0,
+       object IDs carry that many bits to detect stale references (see
+       ObjectIdAllocator) at the expense of the number of live objects.
+    '''
     def __init__(self, schema, instream, outstream, main,
-                 enum_record_implementation: EnumRecordImplementation):
-        enum_record_implementation = enum_record_implementation \
-                    or EnumRecordImplementation(schema, PythonNameConverter())
-        self.receiver = Receiver(schema, instream, None, self.return_method,
-                                 self.acknowledge_disconnect,
-                                 enum_record_implementation.name_converter)
-        self.sender = Sender(schema, outstream, None)
-        self.proxy_factory = ProxyFactory(schema, self,
-                                          enum_record_implementation
-                                          .name_converter)
+                 enum_record_implementation: EnumRecordImplementation,
+                 cork_interval=None, executor=None, pipelining=False,
+                 call_timeout=None, generation_bits=0):
+        if isinstance(schema, SchemaRuntime):
+            runtime = schema
+        else:
+            runtime = SchemaRuntime.for_schema(schema,
+                                               enum_record_implementation)
+        self.runtime = runtime
+        schema = runtime.schema
+        self.receiver = self.create_receiver(instream, executor)
+        self.sender = self.create_sender(outstream, cork_interval)
+        self.proxy_factory = ProxyFactory(runtime.proxy_classes, self)
         self.main = main
+        self.pipelining = pipelining
+        self.call_timeout = call_timeout
+        self._local = local()
         self.is_client = main is None
-        self.store = ReferenceStore(self.is_client, self.proxy_factory)
-        self.receiver.get_object = self.store.get_object
-        self.receiver.get_enum_implementation = enum_record_implementation
+        self.store = ReferenceStore(self.is_client, self.proxy_factory,
+                                    schema.bytes_object_ref, generation_bits)
+        self.receiver.lookup_object = self.store.get_object
+        self.receiver.release_objects = self.store.release_objects
+        self.store.check_implementation = runtime.dispatch.check
+        self.receiver.send_schema = self.sender.send_schema
+        self.receiver.send_schema_digest = self.sender.send_schema_digest
         self.sender.get_id_for_object = self.store.get_id_for_object
-        main_id = self.sender.get_id_for_object(self.main)
+        self.sender.write_failed = self.write_failed
+        main_id = self.sender.get_id_for_object(self.main, schema.main_type)
         if self.is_client:
             assert main_id == 0, ('ID of main object is {} but should ' +
                                   'be 0 on client as it is None') \
@@ -36,9 +67,41 @@ class Bridge:
                                   'be 1 on server').format(main_id)
         if self.is_client:
             self.server = self.receiver.get_object(1, schema.main_type)
-        self.mainloop = self.receiver.mainloop
+        self.create_mainloop()
+
+    def create_receiver(self, instream, executor):
+        return Receiver(self.runtime.schema, instream, None,
+                        self.return_method, self.acknowledge_disconnect,
+                        self.runtime.name_converter, self.runtime,
+                        executor=executor,
+                        return_batch_result=self.return_batch,
+                        raise_method_error=self.raise_method_error)
+
+    def create_sender(self, outstream, cork_interval):
+        return Sender(self.runtime.schema, outstream, None, self.runtime,
+                      cork_interval, writer_thread=True)
+
+    def create_mainloop(self):
         self.mainloop_thread = Thread(target=self.mainloop)
 
+    def mainloop(self):
+        try:
+            self.receiver.mainloop()
+        finally:
+            self.sender.close()
+
+    @property
+    def executor(self):
+        return self.receiver.executor
+
+    @property
+    def queue_depth(self):
+        return getattr(self.executor, 'queue_depth', None)
+
+    @property
+    def rejected_calls(self):
+        return self.receiver.rejected_calls
+
     def __enter__(self):
         self.mainloop_thread.start()
         return self
@@ -46,14 +109,159 @@ class Bridge:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.disconnect()
 
-    def call_method(self, method, this, args_dict):
-        request_id = self.sender.call_method(method, this, args_dict)
-        return self.receiver.wait_for_method_return(request_id,
-                                                    method.return_type)
+    def call_method_async(self, method, this, args):
+        '''Sends a method call and returns a concurrent.futures.Future for
+           its return value immediately, such that many calls can be in
+           flight on the same connection; done callbacks of the future
+           run on the mainloop thread and must not block. Cancelling the
+           future discards its return value; its request ID stays in use
+           until the other side has answered the call.
+        '''
+        batch = self.current_batch
+        if batch is not None:
+            return batch.call_method_async(method, this, args)
+        return self._send_call(method, this, args)[1]
+
+    def release_objects(self):
+        '''Sends the IDs of all proxies garbage collected so far to the
+           other side such that it can drop the implementation objects;
+           called before sending each method call, return value or error
+        '''
+        released = self.store.take_released()
+        if released:
+            self.sender.release_objects(released)
+
+    def _send_call(self, method, this, args, promise=False):
+        self.release_objects()
+        args = self._resolve_arguments(method, args)
+        request_id, future = self.receiver.register_call(method.return_type)
+        try:
+            target = this._promise
+            if target is not None:
+                with target.lock:
+                    if not target.released:
+                        self.sender.call_pipelined(method, target.request_id,
+                                                   args, request_id, promise)
+                        return request_id, future
+                this = target.result()
+            self.sender.call_method(method, this, args, request_id,
+                                    promise=promise)
+        except BaseException:
+            self.receiver.method_returns.discard(request_id)
+            future.cancel()
+            raise
+        return request_id, future
+
+    def _resolve_arguments(self, method, args):
+        '''Promise proxies passed as arguments (also within arrays and
+           records) are resolved before sending as the other side cannot
+           reference pending results in arguments
+        '''
+        return tuple(resolve_value(arg, typ)
+                     for arg, (typ, name) in zip(args, method.arguments))
+
+    def call_method_promise(self, method, this, args):
+        '''Sends a call of a method returning an interface and returns a
+           proxy for the promised result immediately; calls on that proxy
+           are sent right away and executed by the other side once the
+           result exists, use resolve() to wait for the actual proxy
+        '''
+        if self.current_batch is not None:
+            raise RuntimeError('Cannot pipeline calls on the result of {} '
+                               'within a batch'.format(method.name))
+        request_id, future = self._send_call(method, this, args,
+                                             promise=True)
+        return Promise(self, request_id, future, method.return_type).proxy
+
+    submit = call_method_async
+
+    def call_method_oneway(self, method, this, args):
+        '''Sends a call of a void method without waiting for or expecting
+           its return; oneway calls are executed by the other side in the
+           order they were sent and before two-way calls sent later (see
+           Receiver.submit_call for callbacks of oneway calls)
+        '''
+        if method.return_type is not void:
+            raise NotOneway(method)
+        batch = self.current_batch
+        if batch is not None or this._promise is not None:
+            self.call_method_async(method, this, args)
+            return
+        self.release_objects()
+        self.sender.call_method(method, this, args, oneway=True)
+
+    def batch(self):
+        '''Context manager collecting all method calls made on this bridge
+           by the current thread; the calls are sent in a single message
+           when leaving the context and answered in a single message.
+           Within the context, calls return futures (or None for oneway
+           calls) which are resolved once the batch has returned.
+        '''
+        return Batch(self)
+
+    @property
+    def current_batch(self):
+        batches = getattr(self._local, 'batches', None)
+        return batches[-1] if batches else None
+
+    def call_method(self, method, this, args):
+        if self.current_batch is not None:
+            raise RuntimeError('Cannot wait for the return of {} within a '
+                               'batch, use future() instead'
+                               .format(method.name))
+        future = self.call_method_async(method, this, args)
+        return wait_for_return(future, self.call_timeout)
 
     def return_method(self, request_id: int, return_type: Type, return_value):
+        return_value = resolve_value(return_value, return_type)
+        self.release_objects()
         self.sender.return_method(request_id, return_type, return_value)
 
+    def return_batch(self, request_id: int, return_types, return_values,
+                     errors=None):
+        '''Returns the results of a batch; errors maps the indices of
+           calls which raised to their exceptions
+        '''
+        errors = errors or {}
+        return_values = [None if idx in errors
+                         else resolve_value(return_value, return_type)
+                         for idx, (return_type, return_value)
+                         in enumerate(zip(return_types, return_values))]
+        self.release_objects()
+        self.sender.return_batch(request_id, return_types, return_values,
+                                 {idx: (error_code(ex), error_message(ex))
+                                  for idx, ex in errors.items()})
+
+    def raise_method_error(self, request_id: int, ex: Exception):
+        self.release_objects()
+        self.sender.raise_method(request_id, error_code(ex),
+                                 error_message(ex))
+
+    def check_schema(self, fetch_schema=True):
+        '''Sends the sha256 digest of the schema to the other side and
+           waits for its digest in reply; raises SchemaMismatch if the
+           digests differ. Only then the full schema of the other side is
+           requested (if fetch_schema is set) and attached to the error.
+        '''
+        future = self.receiver.expect_schema_digest()
+        self.sender.check_schema()
+        remote_digest = wait_for_return(future, self.call_timeout)
+        if remote_digest == self.runtime.sha256_digest:
+            return
+        remote_schema = None
+        if fetch_schema:
+            future = self.receiver.expect_schema()
+            self.sender.request_schema()
+            remote_schema = wait_for_return(future, self.call_timeout)
+        raise SchemaMismatch(self.runtime.sha256_digest, remote_digest,
+                             remote_schema)
+
+    def write_failed(self, ex):
+        '''Fails all calls waiting for their return once writing to the
+           connection has failed
+        '''
+        self.receiver.close()
+
     def disconnect(self):
         self.sender.disconnect()
 
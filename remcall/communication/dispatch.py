@@ -0,0 +1,72 @@
+from types import FunctionType, MethodType
+from inspect import getattr_static
+from logging import log, WARN
+
+from ..error import MethodNotAvailable
+
+
+class DispatchTable:
+    '''Implementation methods by implementation class and schema method.
+
+       Python method names are converted once per schema method and plain
+       functions defined on the implementation class are looked up once
+       per class; they are bound to the implementation object on each call
+       and called with the arguments positionally in schema order. Other
+       attributes (e.g. set on the instance or provided by __getattr__)
+       are looked up on the object for every call; instance attributes
+       shadowing a function of the class are ignored. ``functions`` and
+       ``checked`` keep strong references to the implementation classes
+       for as long as the table (i.e. its SchemaRuntime, which is shared
+       by bridges) lives.
+    '''
+    def __init__(self, schema, name_converter):
+        self.method_names = {method: name_converter.method_name(method.name)
+                             for interface in schema.interfaces
+                             for method in interface.methods}
+        self.functions = {}
+        self.checked = set()
+
+    def _function(self, cls, method):
+        name = self.method_names[method]
+        try:
+            attr = getattr_static(cls, name)
+        except AttributeError:
+            attr = None
+        function = attr if isinstance(attr, FunctionType) else None
+        self.functions[cls, method] = function
+        return function
+
+    def lookup(self, this, method):
+        '''Returns the implementation of method bound to this'''
+        try:
+            function = self.functions[type(this), method]
+        except KeyError:
+            function = self._function(type(this), method)
+        if function is not None:
+            return MethodType(function, this)
+        name = self.method_names[method]
+        try:
+            return getattr(this, name)
+        except AttributeError:
+            raise MethodNotAvailable(method, name, this)
+
+    def check(self, obj, interface):
+        '''Resolves all methods of interface for the class of obj and logs
+           a warning for methods obj does not implement (calling them
+           raises MethodNotAvailable); each class is checked only once
+           per interface
+        '''
+        cls = type(obj)
+        if (cls, interface) in self.checked:
+            return
+        self.checked.add((cls, interface))
+        missing = []
+        for method in interface.methods:
+            try:
+                self.lookup(obj, method)
+            except MethodNotAvailable:
+                missing.append(self.method_names[method])
+        if missing:
+            log(WARN, '{} does not implement {} of interface {}'
+                      .format(cls.__name__, ', '.join(missing),
+                              interface.name))
@@ -0,0 +1,154 @@
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from threading import Condition, Thread, local
+from logging import log, DEBUG
+
+from ..error import CallRejected
+
+_worker = local()
+
+
+@contextmanager
+def blocking():
+    '''Marks the current thread as blocked (e.g. waiting for a method
+       return); if the thread is a worker of a CallExecutor, its slot is
+       handed to another worker while blocked such that nested callbacks
+       cannot exhaust the pool and deadlock; other executors get no such
+       handoff
+    '''
+    executor = getattr(_worker, 'executor', None)
+    if executor is None:
+        yield
+        return
+    executor._begin_blocking()
+    try:
+        yield
+    finally:
+        executor._end_blocking()
+
+
+class CallExecutor(Executor):
+    '''Thread pool executing at most max_workers calls at the same time and
+       keeping at most max_queue_size calls waiting (unbounded if None);
+       submitting to a full queue raises CallRejected. Workers blocked
+       within blocking() do not count towards max_workers. Idle workers
+       terminate after idle_timeout seconds.
+    '''
+    def __init__(self, max_workers=16, max_queue_size=None,
+                 idle_timeout=60, thread_name_prefix='remcall-worker'):
+        assert max_workers > 0, \
+            'max_workers has to be positive, got {}'.format(max_workers)
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.idle_timeout = idle_timeout
+        self.thread_name_prefix = thread_name_prefix
+        self._condition = Condition()
+        self._queue = deque()
+        self._shutdown = False
+        self._thread_counter = 0
+        self.active = 0
+        self.blocked = 0
+        self.available = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def metrics(self):
+        with self._condition:
+            return dict(queue_depth=len(self._queue), active=self.active,
+                        blocked=self.blocked, available=self.available,
+                        submitted=self.submitted, completed=self.completed,
+                        rejected=self.rejected)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit calls after shutdown')
+            if self.max_queue_size is not None \
+                    and len(self._queue) >= self.max_queue_size:
+                self.rejected += 1
+                raise CallRejected(len(self._queue))
+            future = Future()
+            self._queue.append((future, fn, args, kwargs))
+            self.submitted += 1
+            self._spawn_if_required()
+            self._condition.notify()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+            self._condition.notify_all()
+
+    def _spawn_if_required(self):
+        if len(self._queue) > self.available \
+                and self.active + self.available < self.max_workers:
+            self.available += 1
+            self._thread_counter += 1
+            name = '{}-{}'.format(self.thread_name_prefix,
+                                  self._thread_counter)
+            Thread(target=self._work, name=name, daemon=True).start()
+
+    def _next_call(self):
+        with self._condition:
+            while not self._queue or self.active >= self.max_workers:
+                if self._shutdown and not self._queue:
+                    self.available -= 1
+                    return None
+                if not self._condition.wait(self.idle_timeout) \
+                        and not self._queue:
+                    self.available -= 1
+                    return None
+            self.available -= 1
+            self.active += 1
+            return self._queue.popleft()
+
+    def _work(self):
+        _worker.executor = self
+        while True:
+            call = self._next_call()
+            if call is None:
+                return
+            future, fn, args, kwargs = call
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as ex:
+                    future.set_exception(ex)
+                else:
+                    future.set_result(result)
+            # drop references to the call (e.g. proxies passed as
+            # arguments) while waiting for the next one
+            call = future = fn = args = kwargs = result = None
+            with self._condition:
+                self.active -= 1
+                self.completed += 1
+                if self.available >= self.max_workers:
+                    return
+                self.available += 1
+                self._condition.notify_all()
+
+    def _begin_blocking(self):
+        with self._condition:
+            self.active -= 1
+            self.blocked += 1
+            log(DEBUG, 'Worker blocked, {} active and {} blocked workers'
+                       .format(self.active, self.blocked))
+            self._spawn_if_required()
+            self._condition.notify_all()
+
+    def _end_blocking(self):
+        with self._condition:
+            while self.active >= self.max_workers:
+                self._condition.wait()
+            self.blocked -= 1
+            self.active += 1
@@ -0,0 +1,111 @@
+from threading import Lock
+from itertools import count
+from logging import log, DEBUG
+from concurrent.futures import InvalidStateError
+
+from ..error import DuplicateRegistrationForMethodReturn, \
+                    MissingMethodReturnValueEvent
+
+REQUEST_ID_LIMIT = 1 << 32
+
+
+class PendingCalls:
+    '''Table of calls waiting for their return, mapping request IDs to
+       (future, return_type) tuples. Calls are registered before they are
+       sent; request IDs are allocated by the table, 0 and IDs still in
+       use are skipped after wraparound. Cancelling a future (e.g. after a
+       timeout) drops the future but keeps the request ID and return type
+       until the return arrives, as the return can only be decoded (and
+       then discarded) using its type; calls the other side never answers
+       remain in the table until the connection is closed.
+    '''
+    def __init__(self, create_future):
+        self.create_future = create_future
+        self._calls = {}
+        self._lock = Lock()
+        self._request_ids = count(1)
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, request_id):
+        return request_id in self._calls
+
+    def __getitem__(self, request_id):
+        '''Returns (future, return_type) for request_id; future is None if
+           the call has been cancelled
+        '''
+        try:
+            return self._calls[request_id]
+        except KeyError:
+            raise MissingMethodReturnValueEvent(request_id)
+
+    def register(self, return_type, request_id=None):
+        '''Registers a call and returns its request ID and future'''
+        future = self.create_future()
+        with self._lock:
+            if request_id is None:
+                request_id = self._next_request_id()
+            elif request_id in self._calls:
+                raise DuplicateRegistrationForMethodReturn(request_id)
+            self._calls[request_id] = (future, return_type)
+        future.add_done_callback(
+            lambda future: future.cancelled() and self.cancel(request_id))
+        log(DEBUG, 'Future registered for request {}'.format(request_id))
+        return request_id, future
+
+    def _next_request_id(self):
+        for i in range(len(self._calls) + 2):
+            request_id = next(self._request_ids) % REQUEST_ID_LIMIT
+            # request ID 0 is used by oneway calls
+            if request_id != 0 and request_id not in self._calls:
+                return request_id
+
+    def cancel(self, request_id):
+        with self._lock:
+            if request_id in self._calls:
+                future, return_type = self._calls[request_id]
+                self._calls[request_id] = (None, return_type)
+        log(DEBUG, 'Call with request ID {} cancelled'.format(request_id))
+
+    def discard(self, request_id):
+        '''Removes request_id from the table without completing its
+           future, e.g. if sending the call failed
+        '''
+        with self._lock:
+            self._calls.pop(request_id, None)
+
+    def resolve(self, request_id, return_value):
+        '''Removes request_id from the table and sets the result of its
+           future unless it has been cancelled
+        '''
+        with self._lock:
+            future, return_type = self._calls.pop(request_id)
+        if future is None or future.done():
+            log(DEBUG, 'Discarding return value for cancelled request {}'
+                       .format(request_id))
+            return
+        try:
+            future.set_result(return_value)
+        except InvalidStateError:
+            pass
+
+    def fail(self, request_id, ex):
+        '''Removes request_id from the table and sets exception ex on its
+           future unless it has been cancelled
+        '''
+        with self._lock:
+            future, return_type = self._calls.pop(request_id, (None, None))
+        if future is None or future.done():
+            return
+        try:
+            future.set_exception(ex)
+        except InvalidStateError:
+            pass
+
+    def fail_all(self, ex):
+        '''Fails all pending calls, e.g. if the connection is closed'''
+        with self._lock:
+            request_ids = list(self._calls)
+        for request_id in request_ids:
+            self.fail(request_id, ex)
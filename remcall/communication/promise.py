@@ -0,0 +1,95 @@
+from threading import Lock
+from logging import log, DEBUG
+
+from .proxy import ProxyType
+from .executor import blocking
+from ..schema import Interface, Array, Record
+
+
+class Promise:
+    '''Pending result of a method call returning an interface; its proxy
+       can be used right away, calls on it are pipelined, i.e. sent
+       referencing the request ID of the promise call and executed by
+       the other side once the result exists. The other side keeps the
+       result until the promise is released, which happens as soon as
+       the result has been received.
+    '''
+    def __init__(self, bridge, request_id, future, typ):
+        self.bridge = bridge
+        self.request_id = request_id
+        self.future = future
+        self.lock = Lock()
+        self.released = False
+        self.proxy = bridge.proxy_factory(typ)
+        self.proxy._promise = self
+        future.add_done_callback(self._release)
+
+    def _release(self, future):
+        with self.lock:
+            self.released = True
+            log(DEBUG, 'Promise for request ID {} resolved'
+                       .format(self.request_id))
+            self.bridge.sender.release_promise(self.request_id)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        if self.future.done():
+            return self.future.result()
+        with blocking():
+            return self.future.result(timeout)
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+def resolve(obj):
+    '''Returns the object the promise proxy obj resolves to (waiting for
+       it if required) and any other object unchanged
+    '''
+    if isinstance(obj, ProxyType) and obj._promise is not None:
+        return obj._promise.result()
+    return obj
+
+
+_contains_interface = {}
+
+
+def contains_interface(typ, seen=()):
+    '''Whether values of typ may contain object references'''
+    if isinstance(typ, Interface):
+        return True
+    result = _contains_interface.get(typ)
+    if result is not None:
+        return result
+    if isinstance(typ, Array):
+        result = contains_interface(typ.typ, seen)
+    elif isinstance(typ, Record):
+        if typ in seen:
+            return False
+        result = any(contains_interface(field_type, seen + (typ,))
+                     for field_type, name in typ.fields)
+    else:
+        result = False
+    if not seen:
+        # results for nested types may be incomplete due to recursion
+        _contains_interface[typ] = result
+    return result
+
+
+def resolve_value(value, typ):
+    '''Returns value of type typ with all promise proxies (also within
+       arrays and records) resolved; values without object references
+       are returned unchanged
+    '''
+    if isinstance(typ, Interface):
+        return resolve(value)
+    if value is None or not contains_interface(typ):
+        return value
+    if isinstance(typ, Array):
+        return [resolve_value(item, typ.typ) for item in value]
+    fields = [resolve_value(field_value, field_type)
+              for field_value, (field_type, name)
+              in zip(value._field_values(), typ.fields)]
+    return type(value)._from_field_values(fields)
@@ -1,52 +1,203 @@
 import types
+from functools import partial
 from inspect import Signature, Parameter
-from ..schema import Type
+from ..schema import Type, Interface
 from ..util import TypeWrapper
 from ..error import UnknownType
 
 
 class ProxyType:
-    pass
+    _promise = None
+    _id = None
+
+    def __init__(self, bridge):
+        self._bridge = bridge
+
+
+VARIANTS = [('future', 'call_method_async'),
+            ('oneway', 'call_method_oneway'),
+            ('promise', 'call_method_promise')]
+
+
+def free_name(name, parameter_names):
+    '''Returns name prefixed with underscores until it differs from all
+       parameter_names
+    '''
+    while name in parameter_names:
+        name = '_' + name
+    return name
+
+
+def method_functions_source(factory_name, parameter_names,
+                            oneway=False, returns_interface=False):
+    '''Source of a factory taking a schema method and returning the
+       functions calling it with a fixed positional signature: the
+       regular call followed by its future, oneway and promise variants;
+       the functions pass the method, the proxy and the arguments as a
+       tuple to the corresponding bridge method. The names of the proxy
+       and method variables are chosen not to collide with parameters;
+       the regular call is defined as ``call`` (method names may be
+       Python keywords) and has to be renamed by the caller.
+    '''
+    this = free_name('self', parameter_names)
+    method = free_name('_method', parameter_names)
+    params = ''.join(', ' + name for name in parameter_names)
+    call = '({}, {}, ({}))'.format(method, this,
+                                  ''.join(name + ', '
+                                          for name in parameter_names))
+    bridge = this + '._bridge'
+    lines = ['def {}({}):'.format(factory_name, method),
+             '    def call({}{}):'.format(this, params)]
+    if oneway:
+        lines.append('        return {}.call_method_oneway{}'.format(bridge,
+                                                                   call))
+    else:
+        if returns_interface:
+            lines += ['        if {}.pipelining:'.format(bridge),
+                      '            return {}.call_method_promise{}'
+                      .format(bridge, call)]
+        lines.append('        return {}.call_method{}'.format(bridge, call))
+    for variant, bridge_method in VARIANTS:
+        lines += ['    def {}({}{}):'.format(variant, this, params),
+                  '        return {}.{}{}'.format(bridge, bridge_method,
+                                                  call)]
+    lines.append('    return call, {}'.format(
+        ', '.join(variant for variant, _ in VARIANTS)))
+    return '\n'.join(lines) + '\n'
+
+
+def _factory_name(interface, method):
+    return '_methods_{}_{}'.format(interface.name, method.name)
+
+
+def _method_functions_source(factory_name, method, name_converter):
+    return method_functions_source(
+        factory_name,
+        [name_converter.parameter_name(name) for tp, name in method.arguments],
+        method.oneway, isinstance(method.return_type, Interface))
+
+
+def proxy_functions_source(schema, name_converter):
+    '''Source of the factories of the method functions of all proxy
+       classes of schema
+    '''
+    return ''.join(_method_functions_source(
+                       _factory_name(interface, method), method,
+                       name_converter)
+                   for interface in schema.interfaces_sorted
+                   for method in interface.methods)
+
+
+def compile_proxy_functions(schema, name_converter, source=None):
+    '''Compiles the factories of the method functions of all proxy
+       classes of schema into a single code object (which may be
+       cached using marshal); source is generated if None
+    '''
+    if source is None:
+        source = proxy_functions_source(schema, name_converter)
+    return compile(source, '<remcall proxies for {}>'.format(schema.label),
+                   'exec')
+
+
+def create_method_functions(method, name_converter):
+    '''Generates the functions calling method, see
+       method_functions_source
+    '''
+    namespace = {}
+    exec(_method_functions_source('factory', method, name_converter),
+         namespace)
+    return namespace['factory'](method)
+
+
+class BoundMethodProxy(partial):
+    '''MethodProxy bound to a proxy, calls go straight to the generated
+       method function
+    '''
+    __slots__ = ()
+
+    @property
+    def future(self):
+        return partial(self.func.future, *self.args)
+
+    @property
+    def oneway(self):
+        return partial(self.func.oneway, *self.args)
+
+    @property
+    def promise(self):
+        return partial(self.func.promise, *self.args)
 
 
 class MethodProxy:
-    def __init__(self, interface, method, bridge, name_converter):
+    '''Proxy class attribute for a method; the functions sending the
+       call are generated once per method and take the arguments
+       positionally in schema order, keyword arguments are supported by
+       their signature
+    '''
+    def __init__(self, interface, method, name_converter, functions=None):
         self.interface = interface
         self.method = method
-        self.bridge = bridge
+        self.returns_interface = isinstance(method.return_type, Interface)
         params = [Parameter(name_converter.parameter_name(name),
                             Parameter.POSITIONAL_OR_KEYWORD,
                             annotation=TypeWrapper(tp, name_converter))
                   for tp, name in method.arguments]
-        params.insert(0, Parameter('self', Parameter.POSITIONAL_ONLY,
+        this = free_name('self', [param.name for param in params])
+        params.insert(0, Parameter(this, Parameter.POSITIONAL_ONLY,
                                    annotation=TypeWrapper(self.interface,
                                                           name_converter)))
         return_type = TypeWrapper(method.return_type, name_converter)
         self.__signature__ = Signature(parameters=params,
                                        return_annotation=return_type)
+        if functions is None:
+            functions = create_method_functions(method, name_converter)
+        function, *variant_functions = functions
+        for (variant, _), variant_function in zip(VARIANTS,
+                                                  variant_functions):
+            variant_function.__signature__ = self.__signature__
+            setattr(function, variant, variant_function)
+        function.__signature__ = self.__signature__
+        function.__name__ = name_converter.method_name(method.name)
+        function.__qualname__ = '{}Proxy.{}'.format(
+            name_converter.type_name(interface), function.__name__)
+        self.function = function
 
     def __call__(self, this, *args, **kwargs):
-        bound_values = self.__signature__.bind(this, *args, **kwargs)
-        return_value = self.bridge.call_method(self.method, this,
-                                               bound_values.arguments)
-        return return_value
+        return self.function(this, *args, **kwargs)
+
+    def oneway(self, this, *args, **kwargs):
+        '''Calls a void method without waiting for its return'''
+        return self.function.oneway(this, *args, **kwargs)
+
+    def promise(self, this, *args, **kwargs):
+        '''Calls a method returning an interface without waiting for its
+           return and returns a proxy for the promised result instead;
+           calls on that proxy are pipelined
+        '''
+        return self.function.promise(this, *args, **kwargs)
+
+    def future(self, this, *args, **kwargs):
+        '''Calls the method without waiting for its return and returns a
+           concurrent.futures.Future for the return value instead
+        '''
+        return self.function.future(this, *args, **kwargs)
 
     def __get__(self, instance, cls):
-        if instance:
-            def bound_method_proxy(*args, **kwargs):
-                return self(instance, *args, **kwargs)
-            bound_method_proxy.__signature__ = self.__signature__
-            return bound_method_proxy
-        else:
+        if instance is None:
             return self
+        return BoundMethodProxy(self.function, instance)
 
 
-def create_proxy_class(interface, bridge, name_converter):
+def create_proxy_class(interface, name_converter, functions=None):
+    '''Creates the proxy class for interface; functions may map methods
+       to their precompiled functions (see compile_proxy_functions)
+    '''
     proxy_class_name = '{}Proxy'.format(name_converter.type_name(interface))
     method_dict = {}
     for method in interface.methods:
         method_dict[name_converter.method_name(method.name)] = \
-            MethodProxy(interface, method, bridge, name_converter)
+            MethodProxy(interface, method, name_converter,
+                        functions and functions[method])
 
     def _add_methods(ns):
         ns.update(method_dict)
@@ -54,25 +205,35 @@ def create_proxy_class(interface, bridge, name_converter):
     return types.new_class(proxy_class_name, (ProxyType,), {}, _add_methods)
 
 
-def create_proxy_classes(schema, bridge):
+def create_proxy_classes(schema, name_converter, code=None):
+    '''Creates the proxy classes for all interfaces of schema from the
+       code object returned by compile_proxy_functions (compiled if None)
+    '''
+    if code is None:
+        code = compile_proxy_functions(schema, name_converter)
+    namespace = {}
+    exec(code, namespace)
     for interface in schema.interfaces:
-        yield create_proxy_class(interface, bridge)
+        functions = {method:
+                     namespace[_factory_name(interface, method)](method)
+                     for method in interface.methods}
+        yield create_proxy_class(interface, name_converter, functions)
 
 
-def create_proxy_classes_dict(schema, bridge, name_converter):
+def create_proxy_classes_dict(schema, name_converter):
     return {cls.__name__: cls
-            for cls in create_proxy_classes(schema, bridge, name_converter)}
+            for cls in create_proxy_classes(schema, name_converter)}
 
 
 class ProxyFactory:
-    def __init__(self, schema, bridge, name_converter):
-        self.proxy_classes = {}
-        for interface in schema.interfaces:
-            self.proxy_classes[interface] = create_proxy_class(interface,
-                                                               bridge,
-                                                               name_converter)
+    '''Creates proxy objects bound to a bridge from proxy classes
+       shared by all bridges using the same schema runtime
+    '''
+    def __init__(self, proxy_classes, bridge):
+        self.proxy_classes = proxy_classes
+        self.bridge = bridge
 
     def __call__(self, typ: Type):
         if typ not in self.proxy_classes:
             raise UnknownType(typ)
-        return self.proxy_classes[typ]()
+        return self.proxy_classes[typ](self.bridge)
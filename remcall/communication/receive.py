@@ -1,52 +1,99 @@
-from threading import Thread, Event, Lock
-from logging import log, DEBUG, INFO, WARN, ERROR, CRITICAL
+from threading import Thread, Event, Lock, get_ident
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from logging import getLogger, log, DEBUG, INFO, WARN, ERROR, CRITICAL
 from binascii import hexlify
 
 from .base import *
 from ..schema import *
-from ..codec.read import ReaderBase
-from ..codec.write import SchemaWriter, schema_to_bytes
+from ..codec.read import ReaderBase, StreamBuffer, SchemaReader
+from ..codec.compile import BATCH_HEADER
+from .runtime import SchemaRuntime
+from .pending import PendingCalls
+from .executor import CallExecutor, blocking
 from ..util import view_hex
-from ..error import WrongNumberOfBytesRead, UnknownCommand, MethodNotAvailable, DuplicateRegistrationForMethodReturn, DuplicateMethodReturnValue, MissingMethodReturnValueEvent
+from ..error import WrongNumberOfBytesRead, CallRejected, UnknownCommand, MethodNotAvailable, DuplicateRegistrationForMethodReturn, DuplicateMethodReturnValue, MissingMethodReturnValueEvent, UnknownPromise, CallTimeout, RemcallError, ConnectionClosed, UnknownImplementationObjectReference, UnknownMethodReference, remote_error
+
+
+class SkippedMessage(Exception):
+    '''Raised after a message has been read completely but could not be
+       decoded, e.g. due to a stale object reference; the stream is still
+       in sync and processing can continue with the next message
+    '''
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
 
 class Receiver(ReaderBase):
-    def __init__(self, schema, instream, get_object, return_method_result, acknowledge_disconnect, name_converter):
+    # errors signalling that a message has not been received completely
+    # yet, these are not reported as failures of the call being decoded
+    incomplete_errors = ()
+
+    def __init__(self, schema, instream, get_object, return_method_result, acknowledge_disconnect, name_converter, runtime=None, buffer_size=1 << 16, executor=None, return_batch_result=None, raise_method_error=None):
         super().__init__(instream)
-        self.schema = schema
-        self.method_lookup = self.schema.method_lookup
-        self.method_to_interface = self.schema.method_to_interface
-        self.serialized_schema = schema_to_bytes(schema)
-        self.get_object = get_object
-        self.method_return_events = {}
-        self.method_return_values = {}
+        self.executor = executor or self.create_executor()
+        self.rejected_calls = 0
+        self._oneway_calls = deque()
+        self._oneway_calls_lock = Lock()
+        self._oneway_thread = None
+        self._oneway_calling_out = False
+        self._input = self.create_input(instream, buffer_size)
+        self.runtime = runtime or SchemaRuntime.for_schema(schema)
+        self.schema = self.runtime.schema
+        self.compiled = self.runtime.compiled
+        self.serialized_schema = self.runtime.serialized_schema
+        self.get_enum_implementation = self.runtime.enum_record_implementation
+        self.lookup_object = get_object
+        self._decode_errors = None
+        self.release_objects = None
+        self.send_schema = None
+        self.send_schema_digest = None
+        self.remote_schema_digest = None
+        self.remote_schema = None
+        self._schema_digest_replies = deque()
+        self._schema_replies = deque()
+        self.method_returns = PendingCalls(self.create_future)
+        self.promised_results = {}
         self.return_method_result = return_method_result
+        self.return_batch_result = return_batch_result
+        self.raise_method_error = raise_method_error
         self.acknowledge_disconnect = acknowledge_disconnect
         self.name_converter = name_converter
 
-        self._read_value_functions = {
-            int8: self.read_int8,
-            int16: self.read_int16,
-            int32: self.read_int32,
-            int64: self.read_int64,
-            uint8: self.read_uint8,
-            uint16: self.read_uint16,
-            uint32: self.read_uint32,
-            uint64: self.read_uint64,
-            float32: self.read_float32,
-            float64: self.read_float64,
-            string: self.read_string,
-            void: lambda *args: None
-        }
+    def create_executor(self):
+        return CallExecutor()
+
+    def create_input(self, instream, buffer_size):
+        return StreamBuffer(instream, buffer_size)
 
     def read_from_stream(self, bytes_count: int):
-        b = self._instream.read(bytes_count)
-        log(DEBUG, 'Read data of length {} from stream: {}'.format(len(b), hexlify(b)))
-        if len(b) != bytes_count:
-            ex = WrongNumberOfBytesRead(bytes_count, len(b), None)
+        try:
+            b = self._input.read(bytes_count)
+        except WrongNumberOfBytesRead as ex:
             log(ERROR, str(ex))
-            raise ex
+            raise
+        if getLogger().isEnabledFor(DEBUG):
+            log(DEBUG, 'Read data of length {} from stream: {}'.format(len(b), hexlify(b)))
         return b
 
+    def read_command(self):
+        '''Reads the next command, None at the end of the stream'''
+        try:
+            return self._input.read(1)
+        except WrongNumberOfBytesRead as ex:
+            if ex.bytes_read:
+                log(ERROR, str(ex))
+                raise
+            return None
+
+    def read_struct(self, s):
+        try:
+            return self._input.unpack(s)
+        except WrongNumberOfBytesRead as ex:
+            log(ERROR, str(ex))
+            raise
+
     def read_request_id(self):
         return self.read_uint32()
 
@@ -64,27 +111,61 @@ class Receiver(ReaderBase):
         log(DEBUG, 'Found object {}'.format(obj))
         return obj
 
+    def get_object(self, key, typ: Type):
+        '''Returns the object for key using lookup_object; within decode(),
+           unknown and stale references are replaced by None and raised
+           once the message has been read completely
+        '''
+        try:
+            return self.lookup_object(key, typ)
+        except UnknownImplementationObjectReference as ex:
+            if self._decode_errors is None:
+                raise
+            self._decode_errors.append(ex)
+            return None
+
+    def decode(self, codec):
+        '''Decodes values using codec; raises SkippedMessage if an object
+           reference cannot be resolved
+        '''
+        self._decode_errors = []
+        try:
+            values = codec.decode(self)
+        finally:
+            errors, self._decode_errors = self._decode_errors, None
+        if errors:
+            raise SkippedMessage(errors[0])
+        return values
+
     def read_enum_value(self, typ: Type):
         enum_value = self.read_uint8()
         return self.get_enum_implementation(typ)(enum_value) # todo: better api
 
     def read_value(self, typ: Type):
-        if isinstance(typ, Interface):
-            return self.read_object(typ)
-        elif isinstance(typ, Enum):
-            return self.read_enum_value(typ)
-        else:
-            return self._read_value_functions[typ]()
+        return self.decode(self.compiled.value_codec(typ))[0]
 
     def mainloop(self):
         self.exit_mainloop = False
-        while not self.exit_mainloop:
-            self.process_next()
+        try:
+            while not self.exit_mainloop:
+                self.process_next()
+        finally:
+            self.close()
+
+    def close(self):
+        '''Fails all calls still waiting for their return'''
+        self.method_returns.fail_all(ConnectionClosed())
+        for replies in (self._schema_digest_replies, self._schema_replies):
+            while replies:
+                replies.popleft().set_exception(ConnectionClosed())
 
     def process_next(self):
         log(DEBUG, 'Processing next command on stream {}'.format(self._instream))
-        cmd = self.read_from_stream(1)
-        if cmd == NOOP:
+        cmd = self.read_command()
+        if cmd is None:
+            log(INFO, 'End of stream {}, exiting mainloop'.format(self._instream))
+            self.exit_mainloop = True
+        elif cmd == NOOP:
             log(DEBUG, 'Received NOOP command, doing nothing')
         elif cmd == DISCONNECT:
             log(DEBUG, 'Received DISCONNECT command, exiting mainloop')
@@ -97,62 +178,439 @@ class Receiver(ReaderBase):
             self.send_schema()
         elif cmd == SEND_SCHEMA:
             self.receive_and_check_schema()
+        elif cmd == CHECK_SCHEMA:
+            self.process_check_schema()
+        elif cmd == SCHEMA_DIGEST:
+            self.process_schema_digest()
         elif cmd == CALL_METHOD:
             self.process_method_call()
+        elif cmd == CALL_METHOD_ONEWAY:
+            self.process_method_call(oneway=True)
         elif cmd == RETURN_FROM_METHOD:
             self.process_method_return()
+        elif cmd == RAISE_FROM_METHOD:
+            self.process_method_raise()
+        elif cmd == CALL_METHOD_PROMISE:
+            self.process_method_call(promise=True)
+        elif cmd == CALL_PIPELINED:
+            self.process_pipelined_call()
+        elif cmd == RELEASE_PROMISE:
+            self.process_release_promise()
+        elif cmd == RELEASE_OBJECTS:
+            self.process_release_objects()
+        elif cmd == CALL_BATCH:
+            self.process_batch_call()
+        elif cmd == RETURN_BATCH:
+            self.process_batch_return()
         else:
             raise UnknownCommand(cmd)
 
-    def process_method_call(self):
+    def process_method_call(self, oneway=False, promise=False):
+        try:
+            request_id, method, this, args = self.read_method_call(oneway)
+        except SkippedMessage:
+            return
+        if promise:
+            self.promised_results[request_id] = self.create_future()
+        try:
+            method_impl = self.get_method_implementation(this, method)
+        except MethodNotAvailable as ex:
+            log(ERROR, str(ex))
+            self.fail_method_call(request_id, ex, not oneway)
+            return
+        self.execute_method_call(request_id, method, method_impl, args, oneway)
+
+    def process_pipelined_call(self):
+        request_id, target_request_id, flags, method_ref = self.read_struct(self.compiled.pipelined_call_header)
+        log(INFO, 'Received pipelined method call with request ID {} on result of request {} and method reference {}'.format(request_id, target_request_id, method_ref))
+        codec = self.method_codec(request_id, method_ref)
+        method = codec.method
+        try:
+            args = self.decode(codec.arguments_decoder)
+        except SkippedMessage as skipped:
+            log(ERROR, 'Decoding pipelined method call with request ID {} failed: {}'.format(request_id, skipped))
+            self.fail_method_call(request_id, skipped.error)
+            return
+        if flags & 1:
+            self.promised_results[request_id] = self.create_future()
+        if target_request_id not in self.promised_results:
+            ex = UnknownPromise(target_request_id)
+            log(ERROR, str(ex))
+            self.fail_method_call(request_id, ex)
+            return
+        target = self.promised_results[target_request_id]
+        def call_on_result(target):
+            if target.cancelled():
+                return
+            ex = target.exception()
+            if ex is None:
+                try:
+                    method_impl = self.get_method_implementation(target.result(), method)
+                except MethodNotAvailable as not_available:
+                    ex = not_available
+                else:
+                    self.execute_method_call(request_id, method, method_impl, args)
+                    return
+            log(ERROR, 'Pipelined method call with request ID {} failed: {!r}'.format(request_id, ex))
+            self.fail_method_call(request_id, ex)
+        target.add_done_callback(call_on_result)
+
+    def process_release_promise(self):
         request_id = self.read_request_id()
-        method_ref = self.read_method_ref()
-        log(INFO, 'Received method call with request ID {} and method reference {}'.format(request_id, method_ref))
-        assert method_ref in self.method_lookup, 'Received method call with request ID {} and unknown method reference {}'.format(request_id, method_ref)
-        method = self.method_lookup[method_ref]
+        log(DEBUG, 'Releasing promised result of request {}'.format(request_id))
+        self.promised_results.pop(request_id, None)
+
+    def process_release_objects(self):
+        count = self.read_uint32()
+        released = [self.read_struct(self.compiled.release_entry) for i in range(count)]
+        log(DEBUG, 'Other side released objects {}'.format(released))
+        self.release_objects(released)
+
+    def get_method_implementation(self, this, method):
+        return self.runtime.dispatch.lookup(this, method)
+
+    def complete_method_call(self, request_id, method, return_value):
+        '''Resolves the promised result of request_id (if any) and returns
+           return_value to the caller
+        '''
+        promised_result = self.promised_results.get(request_id)
+        if promised_result is not None:
+            promised_result.set_result(return_value)
+        try:
+            self.return_method_result(request_id, method.return_type, return_value)
+        except Exception as ex:
+            log(ERROR, 'Returning result for request ID {} failed: {!r}'.format(request_id, ex), exc_info=ex)
+            self.fail_method_call(request_id, ex)
+
+    def fail_method_call(self, request_id, ex, report=True):
+        '''Fails the promised result of request_id (if any) and reports ex
+           to the caller unless report is False (e.g. for oneway calls)
+        '''
+        promised_result = self.promised_results.get(request_id)
+        if promised_result is not None:
+            promised_result.set_exception(ex)
+        if report and self.raise_method_error is not None:
+            self.raise_method_error(request_id, ex)
+
+    def method_codec(self, request_id, method_ref, report=True):
+        '''Returns the codec for method_ref; an unknown reference is
+           reported to the caller (unless report is False) and raised as
+           the call cannot be decoded and the stream is out of sync
+        '''
+        try:
+            return self.compiled.by_ref[method_ref]
+        except KeyError:
+            ex = UnknownMethodReference(request_id, method_ref)
+            log(ERROR, str(ex))
+            self.fail_method_call(request_id, ex, report)
+            raise ex from None
+
+    def read_method_call(self, oneway=False, report=True):
+        '''Reads a method call; decoding errors are reported to the caller
+           (unless oneway or report is False) and raised, SkippedMessage
+           if processing can continue with the next message
+        '''
+        request_id, method_ref = self.read_struct(self.compiled.call_header)
+        log(INFO, 'Received {}method call with request ID {} and method reference {}'.format('oneway ' if oneway else '', request_id, method_ref))
+        codec = self.method_codec(request_id, method_ref, report and not oneway)
+        method = codec.method
         log(DEBUG, 'Found method {}'.format(method))
-        this = self.read_object(self.method_to_interface[method_ref])
-        impl_method_name = self.name_converter.method_name(method.name)
-        try:
-            method_impl = getattr(this, impl_method_name)
-        except AttributeError:
-            raise MethodNotAvailable(method, impl_method_name, this)
-        args = {}
-        for typ, name in method.arguments:
-            args[name] = self.read_value(typ)
-        def method_call_thread():
-            log(DEBUG, 'Calling method implementation {} with arguments {}'.format(method_impl, args))
-            return_value = method_impl(**args)
+        try:
+            this, *values = self.decode(codec.call_decoder)
+        except self.incomplete_errors:
+            raise
+        except Exception as ex:
+            log(ERROR, 'Decoding method call with request ID {} failed: {!r}'.format(request_id, ex))
+            if report and not oneway:
+                self.fail_method_call(request_id, getattr(ex, 'error', ex))
+            raise
+        return request_id, method, this, values
+
+    def execute_method_call(self, request_id, method, method_impl, args, oneway=False):
+        '''Executes the call on the executor; oneway calls are executed one
+           after another in the order they were received, other calls are
+           started once the oneway calls received before have finished
+           (unless the running oneway call is calling the other side, see
+           submit_call)
+        '''
+        if oneway:
+            self.execute_oneway_call(request_id, method_impl, args)
+            return
+        log(DEBUG, 'Submitting call of method implementation {} with arguments {}'.format(method_impl, args))
+        try:
+            future = self.submit_call(method_impl, *args)
+        except CallRejected as ex:
+            self.rejected_calls += 1
+            log(ERROR, 'Method call with request ID {} rejected: {}'.format(request_id, ex))
+            self.fail_method_call(request_id, ex)
+            return
+        def return_method_result(future):
+            ex = future.exception()
+            if ex is not None:
+                log(ERROR, 'Method implementation {} for request ID {} raised {!r}'.format(method_impl, request_id, ex), exc_info=ex)
+                self.fail_method_call(request_id, ex)
+                return
+            return_value = future.result()
             log(DEBUG, 'Return value of method implementation call is {}'.format(return_value))
-            self.return_method_result(request_id, method.return_type, return_value)
-        Thread(target=method_call_thread).start()
+            self.complete_method_call(request_id, method, return_value)
+        future.add_done_callback(return_method_result)
+
+    def submit_call(self, fn, *args):
+        '''Submits fn(*args) to the executor and returns its future; while
+           oneway calls are pending, the submission is queued behind them
+           and a rejection by the executor fails the returned future. Once
+           the running oneway call calls the other side, queued and new
+           submissions are not held back anymore until it has finished,
+           as they might be callbacks it is waiting for.
+        '''
+        with self._oneway_calls_lock:
+            if not self._oneway_calls or self._oneway_calling_out:
+                return self.executor.submit(fn, *args)
+            future = Future()
+            self._oneway_calls.append((None, self._submit_queued_call,
+                                       (future, fn, args)))
+            return future
+
+    def _submit_queued_call(self, future, fn, args):
+        try:
+            submitted = self.executor.submit(fn, *args)
+        except CallRejected as ex:
+            self.rejected_calls += 1
+            future.set_exception(ex)
+            return
+        def copy_result(submitted):
+            ex = submitted.exception()
+            if ex is not None:
+                future.set_exception(ex)
+            else:
+                future.set_result(submitted.result())
+        submitted.add_done_callback(copy_result)
+
+    def execute_oneway_call(self, request_id, method_impl, args):
+        with self._oneway_calls_lock:
+            self._oneway_calls.append((request_id, method_impl, args))
+            if len(self._oneway_calls) > 1:
+                return
+            try:
+                self.executor.submit(self.execute_oneway_calls)
+            except CallRejected as ex:
+                self.rejected_calls += len(self._oneway_calls)
+                log(ERROR, 'Oneway method calls with request IDs {} rejected: {}'.format([call[0] for call in self._oneway_calls], ex))
+                self._oneway_calls.clear()
+
+    def execute_oneway_calls(self):
+        while True:
+            with self._oneway_calls_lock:
+                if not self._oneway_calls:
+                    self._oneway_thread = None
+                    return
+                self._oneway_thread = get_ident()
+                request_id, method_impl, args = self._oneway_calls[0]
+            log(DEBUG, 'Calling oneway method implementation {} with arguments {}'.format(method_impl, args))
+            try:
+                method_impl(*args)
+            except Exception as ex:
+                log(ERROR, 'Method implementation {} for request ID {} raised {!r}'.format(method_impl, request_id, ex), exc_info=ex)
+            with self._oneway_calls_lock:
+                self._oneway_calls.popleft()
+                self._oneway_calling_out = False
+
+    def _release_queued_calls(self):
+        '''Submits all calls queued behind the running oneway call, which
+           is about to call the other side
+        '''
+        with self._oneway_calls_lock:
+            self._oneway_calling_out = True
+            queued = [call for call in self._oneway_calls
+                      if call[1] == self._submit_queued_call]
+            for call in queued:
+                self._oneway_calls.remove(call)
+        for request_id, submit_queued_call, args in queued:
+            submit_queued_call(*args)
+
+    def process_batch_call(self):
+        request_id, count = self.read_struct(BATCH_HEADER)
+        log(INFO, 'Received batch of {} method calls with request ID {}'.format(count, request_id))
+        calls = []
+        skipped = None
+        try:
+            for idx in range(count):
+                cmd = self.read_from_stream(1)
+                if cmd != CALL_METHOD:
+                    raise UnknownCommand(cmd)
+                try:
+                    calls.append(self.read_method_call(report=False))
+                except SkippedMessage as ex:
+                    skipped = skipped or ex
+        except self.incomplete_errors:
+            raise
+        except Exception as ex:
+            self.fail_method_call(request_id, ex)
+            raise
+        if skipped is not None:
+            self.fail_method_call(request_id, skipped.error)
+            return
+        self.execute_batch_call(request_id, calls)
+
+    def execute_batch_call(self, request_id, calls):
+        '''Executes all calls of a batch one after another in a single task
+           of the executor and returns all results at once; a call raising
+           does not stop the remaining calls, its error is returned instead
+        '''
+        def execute_batch():
+            return_values = []
+            errors = {}
+            for idx, (_, method, this, args) in enumerate(calls):
+                try:
+                    method_impl = self.get_method_implementation(this, method)
+                    return_values.append(method_impl(*args))
+                except Exception as ex:
+                    log(ERROR, 'Call {} of batch with request ID {} raised {!r}'.format(idx, request_id, ex), exc_info=ex)
+                    return_values.append(None)
+                    errors[idx] = ex
+            return return_values, errors
+        try:
+            future = self.submit_call(execute_batch)
+        except CallRejected as ex:
+            self.rejected_calls += 1
+            log(ERROR, 'Batch call with request ID {} rejected: {}'.format(request_id, ex))
+            self.fail_method_call(request_id, ex)
+            return
+        def return_batch_result(future):
+            ex = future.exception()
+            if ex is not None:
+                log(ERROR, 'Batch call with request ID {} raised {!r}'.format(request_id, ex), exc_info=ex)
+                self.fail_method_call(request_id, ex)
+                return
+            return_types = [method.return_type for idx, method, this, args in calls]
+            self.complete_batch_call(request_id, return_types, *future.result())
+        future.add_done_callback(return_batch_result)
+
+    def complete_batch_call(self, request_id, return_types, return_values, errors=None):
+        try:
+            self.return_batch_result(request_id, return_types, return_values, errors)
+        except Exception as ex:
+            log(ERROR, 'Returning results for batch with request ID {} failed: {!r}'.format(request_id, ex), exc_info=ex)
+            self.fail_method_call(request_id, ex)
+
+    def process_batch_return(self):
+        '''Resolves the batch call with the list of its return values;
+           calls which raised (or whose return value cannot be decoded)
+           are represented by their exception within the list
+        '''
+        request_id, count = self.read_struct(BATCH_HEADER)
+        log(DEBUG, 'Received return from batch call with request ID {}'.format(request_id))
+        future, return_types = self.method_returns[request_id]
+        assert len(return_types) == count, 'Batch call with request ID {} returned {} values for {} calls'.format(request_id, count, len(return_types))
+        return_values = []
+        for idx, return_type in enumerate(return_types):
+            status = self.read_from_stream(1)
+            if status == BATCH_CALL_RAISED:
+                code, message = self.compiled.error_decoder.decode(self)
+                return_values.append(remote_error(code, message))
+            elif status != BATCH_CALL_RETURNED:
+                raise UnknownCommand(status)
+            else:
+                try:
+                    return_values.append(self.read_value(return_type))
+                except SkippedMessage as skipped:
+                    log(ERROR, 'Decoding return of call {} of batch with request ID {} failed: {}'.format(idx, request_id, skipped))
+                    return_values.append(skipped.error)
+        self.method_returns.resolve(request_id, return_values)
+
+    def process_method_raise(self):
+        request_id = self.read_request_id()
+        code, message = self.compiled.error_decoder.decode(self)
+        log(DEBUG, 'Received error {} with message {!r} for request ID {}'.format(code, message, request_id))
+        self.method_returns.fail(request_id, remote_error(code, message))
 
     def process_method_return(self):
         request_id = self.read_request_id()
         log(DEBUG, 'Received return from method call with request ID {}'.format(request_id))
-        if request_id in self.method_return_values:
-            raise DuplicateMethodReturnValue(request_id)
-        if request_id in self.method_return_events:
-            event, return_type = self.method_return_events.pop(request_id)
+        future, return_type = self.method_returns[request_id]
+        try:
             return_value = self.read_value(return_type)
-            log(DEBUG, 'Return value for method call with request ID {} is {} of type {}'.format(request_id, return_value, return_type))
-            self.method_return_values[request_id] = return_value
-            event.set()
-        else:
-            raise MissingMethodReturnValueEvent(request_id)
-            # ToDo: Wait and retry?
+        except SkippedMessage as skipped:
+            log(ERROR, 'Decoding return of method call with request ID {} failed: {}'.format(request_id, skipped))
+            self.method_returns.fail(request_id, skipped.error)
+            return
+        log(DEBUG, 'Return value for method call with request ID {} is {} of type {}'.format(request_id, return_value, return_type))
+        self.method_returns.resolve(request_id, return_value)
+
+
+    def process_check_schema(self):
+        digest = self.read_from_stream(DIGEST_SIZE)
+        self.remote_schema_digest = digest
+        if digest != self.runtime.sha256_digest:
+            log(WARN, 'Schema of other side has digest {}, expected {}'.format(view_hex(digest), view_hex(self.runtime.sha256_digest)))
+        self.send_schema_digest()
 
+    def process_schema_digest(self):
+        digest = self.read_from_stream(DIGEST_SIZE)
+        log(DEBUG, 'Received schema digest {}'.format(view_hex(digest)))
+        self.remote_schema_digest = digest
+        if self._schema_digest_replies:
+            self._schema_digest_replies.popleft().set_result(digest)
 
     def receive_and_check_schema(self):
-        received_schema = SchemaReader(self._instream).read_schema()
-        assert SchemaWriter(received_schema).to_bytes() == self.serialized_schema
+        '''Reads the full schema sent by the other side; the schema reader
+           verifies the digest appended to the schema
+        '''
+        received_schema = SchemaReader(self._input).read_schema()
+        self.remote_schema = received_schema
+        self.remote_schema_digest = received_schema.sha256_digest
+        if received_schema.sha256_digest != self.runtime.sha256_digest:
+            log(WARN, 'Received schema {} differs from schema {}'.format(received_schema.label, self.schema.label))
+        if self._schema_replies:
+            self._schema_replies.popleft().set_result(received_schema)
 
-    def wait_for_method_return(self, request_id, return_type):
+    def expect_schema_digest(self):
+        '''Returns a future for the digest sent in reply to CHECK_SCHEMA;
+           call before sending the request
+        '''
+        future = self.create_future()
+        self._schema_digest_replies.append(future)
+        return future
+
+    def expect_schema(self):
+        '''Returns a future for the schema sent in reply to REQUEST_SCHEMA;
+           call before sending the request
+        '''
+        future = self.create_future()
+        self._schema_replies.append(future)
+        return future
+
+    def register_call(self, return_type):
+        '''Allocates a request ID and registers a future for its return
+           value; register before sending the request to not miss fast
+           replies
+        '''
+        if self._oneway_thread == get_ident():
+            self._release_queued_calls()
+        return self.method_returns.register(return_type)
+
+    def expect_method_return(self, request_id, return_type):
+        '''Registers a future for the return value of a request ID
+           allocated elsewhere
+        '''
+        return self.method_returns.register(return_type, request_id)[1]
+
+    def create_future(self):
+        return Future()
+
+    def wait_for_method_return(self, request_id, return_type, timeout=None):
         log(DEBUG, 'Waiting for method return corresponding to request {} with return type {} on stream {}'.format(request_id, return_type, self._instream))
-        if request_id in self.method_return_events or request_id in self.method_return_values:
-            raise DuplicateRegistrationForMethodReturn(request_id)
-        wait_for_method_return_event = Event()
-        self.method_return_events[request_id] = (wait_for_method_return_event, return_type)
-        log(DEBUG, 'Waiting event registered for request {}'.format(request_id))
-        wait_for_method_return_event.wait()
-        return self.method_return_values.pop(request_id)
+        future = self.expect_method_return(request_id, return_type)
+        return wait_for_return(future, timeout)
+
+
+def wait_for_return(future, timeout=None):
+    '''Waits for the return value of a call; the call is cancelled if
+       it does not return within timeout seconds
+    '''
+    with blocking():
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise CallTimeout(timeout)
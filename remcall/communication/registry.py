@@ -0,0 +1,183 @@
+from logging import log, INFO, WARN
+
+from .base import CHECK_SCHEMA, SCHEMA_DIGEST, REQUEST_SCHEMA, SEND_SCHEMA, \
+                  DISCONNECT, ACKNOWLEDGE_DISCONNECT, DIGEST_SIZE
+from .bridge import Bridge
+from .runtime import SchemaRuntime
+from ..util import view_hex
+from ..error import UnknownCommand, UnknownSchema, WrongNumberOfBytesRead, \
+                    ConnectionClosed
+
+
+class SchemaRegistry:
+    '''Schema runtimes and the main objects serving them, indexed by the
+       sha256 digest of the schema; main objects are shared by all
+       connections using their schema. The default schema (the first
+       registered schema unless another one is registered as default) is
+       offered to clients with unknown schemas, see Listener.
+    '''
+    def __init__(self):
+        self.entries = {}
+        self.default_digest = None
+
+    def register(self, schema, main, enum_record_implementation=None,
+                 default=False):
+        '''Registers schema (or a SchemaRuntime) served by main and returns
+           its runtime
+        '''
+        if isinstance(schema, SchemaRuntime):
+            runtime = schema
+        else:
+            runtime = SchemaRuntime.for_schema(schema,
+                                               enum_record_implementation)
+        self.entries[runtime.sha256_digest] = (runtime, main)
+        if default or self.default_digest is None:
+            self.default_digest = runtime.sha256_digest
+        return runtime
+
+    def __contains__(self, digest):
+        return digest in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, digest):
+        '''Returns runtime and main object for digest, raises UnknownSchema
+           if there is none
+        '''
+        try:
+            return self.entries[digest]
+        except KeyError:
+            raise UnknownSchema(digest)
+
+    @property
+    def default(self):
+        '''Runtime of the default schema or None'''
+        if self.default_digest is None:
+            return None
+        return self.entries[self.default_digest][0]
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise WrongNumberOfBytesRead(size, len(data), None)
+        data += chunk
+    return data
+
+
+def _close(stream):
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        close()
+
+
+class Handshake:
+    '''Schema negotiation at the start of a connection, independent of
+       how data is read and written: step() processes a command (with the
+       digest for CHECK_SCHEMA) and returns the data to reply. Once the
+       client has sent the digest of a registered schema, ``entry`` holds
+       its runtime and main object. Until then only CHECK_SCHEMA,
+       REQUEST_SCHEMA (answered with the default schema) and DISCONNECT
+       are accepted; other commands and unknown schemas without a default
+       schema raise, the connection has to be closed then (as after
+       DISCONNECT, which sets ``disconnected``).
+    '''
+    def __init__(self, registry):
+        self.registry = registry
+        self.entry = None
+        self.digest = None
+        self.disconnected = False
+
+    def step(self, cmd, digest=None):
+        if cmd == CHECK_SCHEMA:
+            self.digest = digest
+            if digest in self.registry:
+                self.entry = self.registry.lookup(digest)
+                return SCHEMA_DIGEST + digest
+            default = self.registry.default
+            if default is None:
+                raise UnknownSchema(digest)
+            log(WARN, 'Unknown schema digest {}, offering default schema {}'
+                      .format(view_hex(digest), default.schema.label))
+            return SCHEMA_DIGEST + default.sha256_digest
+        elif cmd == REQUEST_SCHEMA and self.digest is not None:
+            return SEND_SCHEMA + self.registry.default.serialized_schema
+        elif cmd == DISCONNECT:
+            self.disconnected = True
+            return ACKNOWLEDGE_DISCONNECT
+        raise UnknownCommand(cmd)
+
+
+class Listener:
+    '''Creates server bridges for incoming connections of a registry.
+
+       Each connection has to start with the CHECK_SCHEMA handshake (see
+       Bridge.check_schema); the digest sent by the client selects the
+       runtime and main object of the bridge, which answers the handshake
+       with the digest of the selected schema. Clients with unknown
+       schemas are sent the digest (and on request the schema) of the
+       default schema but are not served until they send the digest of a
+       registered schema. Connections are closed if the handshake fails.
+       Additional keyword arguments are passed to every bridge created.
+    '''
+    def __init__(self, registry, **bridge_kwargs):
+        self.registry = registry
+        self.bridge_kwargs = bridge_kwargs
+
+    def accept(self, instream, outstream):
+        '''Performs the handshake on a new connection and returns its
+           bridge with its mainloop running
+        '''
+        handshake = Handshake(self.registry)
+        try:
+            while handshake.entry is None:
+                cmd = _read_exactly(instream, 1)
+                digest = _read_exactly(instream, DIGEST_SIZE) \
+                    if cmd == CHECK_SCHEMA else None
+                outstream.write(handshake.step(cmd, digest))
+                outstream.flush()
+                if handshake.disconnected:
+                    raise ConnectionClosed()
+        except Exception:
+            _close(outstream)
+            _close(instream)
+            raise
+        runtime, main = handshake.entry
+        log(INFO, 'Accepting connection for schema {}'
+                  .format(runtime.schema.label))
+        bridge = Bridge(runtime, instream, outstream, main, None,
+                        **self.bridge_kwargs)
+        bridge.receiver.remote_schema_digest = handshake.digest
+        bridge.mainloop_thread.start()
+        return bridge
+
+    async def accept_async(self, reader, writer):
+        '''Performs the handshake on a new asyncio connection and returns
+           its AsyncBridge with its mainloop task started; can be used as
+           callback of asyncio.start_server
+        '''
+        from .asyncio_bridge import AsyncBridge
+        handshake = Handshake(self.registry)
+        try:
+            while handshake.entry is None:
+                cmd = await reader.readexactly(1)
+                digest = await reader.readexactly(DIGEST_SIZE) \
+                    if cmd == CHECK_SCHEMA else None
+                writer.write(handshake.step(cmd, digest))
+                await writer.drain()
+                if handshake.disconnected:
+                    raise ConnectionClosed()
+        except Exception:
+            writer.close()
+            raise
+        runtime, main = handshake.entry
+        log(INFO, 'Accepting connection for schema {}'
+                  .format(runtime.schema.label))
+        bridge = AsyncBridge(runtime, reader, writer, main,
+                             **self.bridge_kwargs)
+        bridge.receiver.remote_schema_digest = handshake.digest
+        bridge.start()
+        return bridge
@@ -0,0 +1,77 @@
+from threading import Lock
+from hashlib import sha256
+
+from .proxy import create_proxy_classes, compile_proxy_functions, \
+                   proxy_functions_source
+from .dispatch import DispatchTable
+from ..codec.write import schema_to_bytes
+from ..codec.compile import CompiledSchema
+from ..implementation import EnumRecordImplementation
+from ..naming import PythonNameConverter
+
+
+class SchemaRuntime:
+    '''Everything derived from a schema that does not depend on a
+       connection: serialized schema, method tables, proxy classes,
+       dispatch table, enum and record classes as well as compiled codecs.
+       A runtime is built once and shared by all bridges using its schema.
+
+       If a SchemaCache is given, the compiled proxy code is loaded from
+       and stored in the cache, keyed by the hash of its source (which
+       depends on the schema and the names chosen by the name converter).
+    '''
+    _lock = Lock()
+    _runtimes_by_schema = {}
+    _runtimes_by_digest = {}
+
+    def __init__(self, schema, enum_record_implementation=None, cache=None):
+        self.schema = schema.freeze()
+        self.serialized_schema = schema_to_bytes(schema)
+        self.sha256_digest = self.serialized_schema[-32:]
+        self.compiled = CompiledSchema(schema)
+        self.enum_record_implementation = enum_record_implementation \
+            or EnumRecordImplementation(schema, PythonNameConverter())
+        self.name_converter = self.enum_record_implementation.name_converter
+        self.proxy_classes = dict(zip(
+            schema.interfaces,
+            create_proxy_classes(schema, self.name_converter,
+                                 self._proxy_code(cache))))
+        self.dispatch = DispatchTable(schema, self.name_converter)
+
+    def _proxy_code(self, cache):
+        if cache is None:
+            return None
+        source = proxy_functions_source(self.schema, self.name_converter)
+        name = 'proxies-{}'.format(sha256(source.encode()).hexdigest())
+        code = cache.get_code(self.sha256_digest, name)
+        if code is None:
+            code = compile_proxy_functions(self.schema, self.name_converter,
+                                           source)
+            cache.put_code(self.sha256_digest, name, code)
+        return code
+
+    @classmethod
+    def for_schema(cls, schema, enum_record_implementation=None, cache=None):
+        '''Returns the shared runtime for schema (or any other schema
+           with the same sha256 digest and oneway methods) and
+           enum_record_implementation (compared by identity). Shared
+           runtimes, the schemas and enum_record_implementations they were
+           requested for are kept for the whole lifetime of the process.
+        '''
+        with cls._lock:
+            runtime = cls._runtimes_by_schema.get(
+                (schema, enum_record_implementation))
+            if runtime is None:
+                key = (schema.sha256_digest or schema_to_bytes(schema)[-32:],
+                       schema.oneway_methods, enum_record_implementation)
+                runtime = cls._runtimes_by_digest.get(key)
+                if runtime is None:
+                    runtime = cls(schema, enum_record_implementation, cache)
+                    cls._runtimes_by_digest[key] = runtime
+                cls._runtimes_by_schema[
+                    schema, enum_record_implementation] = runtime
+            return runtime
+
+    def __repr__(self):
+        return '{}(schema={!r})'.format(self.__class__.__name__,
+                                        self.schema.label)
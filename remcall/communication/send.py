@@ -1,56 +1,208 @@
-from threading import Thread, Event, Lock
-from logging import log, DEBUG, INFO, WARN, ERROR, CRITICAL
+from threading import Thread, Event, Lock, Timer, Condition
+from collections import deque
+from time import monotonic
+from logging import getLogger, log, DEBUG, INFO, WARN, ERROR, CRITICAL
 from binascii import hexlify
 
 from .base import *
 from ..schema import *
 from ..codec.write import WriterBase, SchemaWriter, schema_to_bytes
+from ..codec.compile import BATCH_HEADER, UINT32
+from .runtime import SchemaRuntime
 from ..util import view_hex
+from ..error import ConnectionClosed, error_code, error_message
 
 class Sender(WriterBase):
-    def __init__(self, schema, outstream, get_id_for_object):
-        super().__init__(schema, outstream)
-        self.method_table = self.schema.method_table
-        self.serialized_schema = schema_to_bytes(schema)
+    '''Writes each message to the output stream using a single write and
+       flush; if ``cork_interval`` (in seconds) is set, messages queued
+       within that interval are merged into one write as long as they do
+       not exceed ``cork_size`` bytes.
+
+       If ``writer_thread`` is set, callers only encode their messages and
+       enqueue them; a dedicated thread writes all messages queued so far
+       using a single write and flush, waiting up to ``cork_interval`` for
+       more messages if set. If writing fails, the writer thread stops,
+       ``write_failed(ex)`` is called (if set) and later messages raise
+       ConnectionClosed. Sending is thread-safe in both modes.
+    '''
+    def __init__(self, schema, outstream, get_id_for_object, runtime=None,
+                 cork_interval=None, cork_size=1 << 16, writer_thread=False):
+        self.runtime = runtime or SchemaRuntime.for_schema(schema)
+        self.compiled = self.runtime.compiled
+        super().__init__(self.runtime.schema, outstream)
+        self.serialized_schema = self.runtime.serialized_schema
         self.get_id_for_object = get_id_for_object
-        self.request_id = 0
-
-        self._write_value_functions = {
-            int8: self.write_int8,
-            int16: self.write_int16,
-            int32: self.write_int32,
-            int64: self.write_int64,
-            uint8: self.write_uint8,
-            uint16: self.write_uint16,
-            uint32: self.write_uint32,
-            uint64: self.write_uint64,
-            float32: self.write_float32,
-            float64: self.write_float64,
-            string: self.write_string,
-            void: lambda *args: None
-        }
-        for interface in self.schema.interfaces:
-            self._write_value_functions[interface] = self.write_object_ref
-        for enum in self.schema.enums:
-            self._write_value_functions[enum] = self.write_enum_value
-
-    def write_to_stream(self, data: bytes):
-        log(DEBUG, 'Writing data of length {} to stream: {}'.format(len(data), hexlify(data)))
-        self._outstream.write(data)
-        self._outstream.flush()
-
-    def write_request_id(self, request_id=None):
-        if request_id is None:
-            self.request_id = (self.request_id + 1) % (1 << 32)
-            request_id = self.request_id
+        self.cork_interval = cork_interval
+        self.cork_size = cork_size
+        self._lock = Lock()
+        self._buffer = bytearray()
+        self._corked = bytearray()
+        self._cork_timer = None
+        self._send_queue = deque()
+        self._send_condition = Condition()
+        self._queued_size = 0
+        self._flush_requested = False
+        self._writing = False
+        self._closed = False
+        self.use_writer_thread = writer_thread
+        self.writer_thread = None
+        self.error = None
+        self.write_failed = None
+
+    def write_to_stream(self, data: bytes, flush=False):
+        if self.use_writer_thread:
+            self._enqueue(bytes(data), flush)
+            return
+        with self._lock:
+            self._write_message(data, flush)
+
+    def send_message(self, encoder, values, flush=False):
+        self._send(lambda out: encoder.encode(self, values, out), flush)
+
+    def _send(self, encode, flush=False):
+        '''Sends the message appended to a buffer by encode(buffer)'''
+        if self.use_writer_thread:
+            buffer = bytearray()
+            encode(buffer)
+            self._enqueue(buffer, flush)
+            return
+        with self._lock:
+            buffer = self._buffer
+            del buffer[:]
+            encode(buffer)
+            self._write_message(buffer, flush)
+
+    def _enqueue(self, data, flush=False):
+        with self._send_condition:
+            if self.error is not None:
+                raise ConnectionClosed() from self.error
+            if self._closed:
+                with self._lock:
+                    self._write_message(data, True)
+                return
+            self._send_queue.append(data)
+            self._queued_size += len(data)
+            if flush:
+                self._flush_requested = True
+            if self.writer_thread is None:
+                self.writer_thread = Thread(target=self._write_queued,
+                                            daemon=True, name='remcall-writer')
+                self.writer_thread.start()
+            self._send_condition.notify_all()
+
+    def _next_queued(self):
+        '''Waits for queued messages and takes them from the queue; with a
+           cork_interval, waits that long for more messages unless a flush
+           is requested or cork_size is reached
+        '''
+        with self._send_condition:
+            while not self._send_queue and not self._closed:
+                self._send_condition.wait()
+            if self.cork_interval is not None:
+                deadline = monotonic() + self.cork_interval
+                while not (self._flush_requested or self._closed
+                           or self._queued_size >= self.cork_size):
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._send_condition.wait(remaining)
+            messages = list(self._send_queue)
+            self._send_queue.clear()
+            self._queued_size = 0
+            self._flush_requested = False
+            self._writing = bool(messages)
+            return messages
+
+    def _write_queued(self):
+        while True:
+            messages = self._next_queued()
+            if not messages:
+                return
+            try:
+                with self._lock:
+                    self._write_message(b''.join(messages), True)
+            except Exception as ex:
+                log(ERROR, 'Writing {} queued messages failed: {!r}'.format(len(messages), ex))
+                self._fail(ex)
+                return
+            finally:
+                with self._send_condition:
+                    self._writing = False
+                    self._send_condition.notify_all()
+
+    def _fail(self, ex):
+        with self._send_condition:
+            self.error = ex
+            self._send_queue.clear()
+            self._send_condition.notify_all()
+        if self.write_failed is not None:
+            self.write_failed(ex)
+
+    def close(self):
+        '''Stops the writer thread once all queued messages are written;
+           later messages are written directly by the sending thread
+        '''
+        with self._send_condition:
+            self._closed = True
+            self._send_condition.notify_all()
+
+    def _write_message(self, data, flush):
+        if getLogger().isEnabledFor(DEBUG):
+            log(DEBUG, 'Writing data of length {} to stream: {}'.format(len(data), hexlify(data)))
+        if self.cork_interval is None or self.use_writer_thread:
+            self._outstream.write(data)
+            self._outstream.flush()
+            return
+        self._corked += data
+        if flush or len(self._corked) >= self.cork_size:
+            self._flush_corked()
+        elif self._cork_timer is None:
+            self._cork_timer = Timer(self.cork_interval, self.flush)
+            self._cork_timer.daemon = True
+            self._cork_timer.start()
+
+    def _flush_corked(self):
+        if self._cork_timer is not None:
+            self._cork_timer.cancel()
+            self._cork_timer = None
+        if self._corked:
+            log(DEBUG, 'Flushing {} corked bytes to stream'.format(len(self._corked)))
+            self._outstream.write(self._corked)
+            self._outstream.flush()
+            del self._corked[:]
+
+    def flush(self):
+        '''Writes all corked messages or waits until the writer thread has
+           written all queued messages
+        '''
+        if self.use_writer_thread:
+            with self._send_condition:
+                self._flush_requested = True
+                self._send_condition.notify_all()
+                while (self._send_queue or self._writing) \
+                        and self.writer_thread.is_alive():
+                    self._send_condition.wait()
+            return
+        with self._lock:
+            self._flush_corked()
+
+    def write_request_id(self, request_id):
         self.write_uint32(request_id)
 
     def request_schema(self):
-        self.write_to_stream(REQUEST_SCHEMA)
+        self.write_to_stream(REQUEST_SCHEMA, flush=True)
 
     def send_schema(self):
-        self.write_to_stream(SEND_SCHEMA)
-        self.write_to_stream(self.serialized_schema)
+        self.write_to_stream(SEND_SCHEMA + self.serialized_schema, flush=True)
+
+    def check_schema(self):
+        '''Asks the other side to compare its schema digest with ours and
+           reply with its digest
+        '''
+        self.write_to_stream(CHECK_SCHEMA + self.runtime.sha256_digest, flush=True)
+
+    def send_schema_digest(self):
+        self.write_to_stream(SCHEMA_DIGEST + self.runtime.sha256_digest, flush=True)
 
     def write_object_ref(self, obj):
         oid = self.get_id_for_object(obj)
@@ -59,37 +211,118 @@ class Sender(WriterBase):
     def write_enum_value(self, enum_value):
         self.write_uint8(enum_value.value)
 
-    def write_record_value(self, val):
-        raise NotImplementedError('Writing records')
-
     def write_value(self, typ, value):
-        self._write_value_functions[typ](value)
-
-    def call_method(self, method, this, args_dict):
-        log(INFO, 'Preparing to request method call for method {} on object {} with arguments {}'.format(method.name, this, args_dict))
-        method_idx = self.method_table[method]
-        self.write_to_stream(CALL_METHOD)
-        self.write_request_id()
-        self.write_method_ref(method_idx)
-        self.write_object_ref(this)
-        for typ, name in method.arguments:
-            self.write_value(typ, args_dict[name])
-        log(DEBUG, 'Requested method call with request ID {} on stream {}'.format(self.request_id, self._outstream))
-        return self.request_id
+        self.send_message(self.compiled.value_codec(typ), [value])
+
+    def call_method(self, method, this, args, request_id=0, oneway=False, promise=False):
+        '''Sends a method call with the argument values args in schema order; oneway calls are not answered by the
+           other side, the results of promise calls are kept by the other
+           side as target of pipelined calls until released. Request IDs
+           are allocated by the caller (see PendingCalls), oneway calls
+           use request ID 0.
+        '''
+        log(INFO, 'Preparing to request method call for method {} on object {} with arguments {}'.format(method.name, this, args))
+        codec = self.compiled.by_method[method]
+        if oneway:
+            command = CALL_METHOD_ONEWAY
+        elif promise:
+            command = CALL_METHOD_PROMISE
+        else:
+            command = CALL_METHOD
+        values = [command, request_id, codec.method_ref, this]
+        values.extend(args)
+        self.send_message(codec.call_encoder, values)
+        log(DEBUG, 'Requested method call with request ID {} on stream {}'.format(request_id, self._outstream))
+        return request_id
+
+    def call_pipelined(self, method, target_request_id, args, request_id, promise=False):
+        '''Sends a call of method on the (future) result of the promise
+           call with target_request_id
+        '''
+        log(INFO, 'Preparing to request pipelined call for method {} on result of request {} with arguments {}'.format(method.name, target_request_id, args))
+        codec = self.compiled.by_method[method]
+        values = [CALL_PIPELINED, request_id, target_request_id, int(promise), codec.method_ref]
+        values.extend(args)
+        self.send_message(codec.pipelined_call_encoder, values)
+        return request_id
+
+    def release_promise(self, request_id):
+        log(DEBUG, 'Releasing promised result of request {}'.format(request_id))
+        self.write_to_stream(RELEASE_PROMISE + UINT32.pack(request_id))
+
+    def release_objects(self, released):
+        '''Tells the other side that proxies for its objects have been
+           garbage collected; released contains (object ID, count) pairs
+           where count is the number of times the ID has been received
+        '''
+        log(DEBUG, 'Releasing objects {}'.format(released))
+        def encode(buffer):
+            buffer += RELEASE_OBJECTS
+            buffer += UINT32.pack(len(released))
+            for key, count in released:
+                buffer += self.compiled.release_entry.pack(key, count)
+        self._send(encode)
+
+    def call_batch(self, request_id, calls):
+        '''Sends all calls, given as (method, this, args) tuples, in a
+           single CALL_BATCH message; each call is encoded like a
+           CALL_METHOD message using its index within the batch as
+           request ID
+        '''
+        log(INFO, 'Preparing to request batch of {} method calls with request ID {}'.format(len(calls), request_id))
+        def encode(buffer):
+            buffer += CALL_BATCH
+            buffer += BATCH_HEADER.pack(request_id, len(calls))
+            for idx, (method, this, args) in enumerate(calls):
+                codec = self.compiled.by_method[method]
+                values = [CALL_METHOD, idx, codec.method_ref, this]
+                values.extend(args)
+                codec.call_encoder.encode(self, values, buffer)
+        self._send(encode)
+        return request_id
+
+    def return_batch(self, request_id, return_types, return_values, errors=None):
+        '''Sends the results of a batch; errors maps the indices of calls
+           which raised to (error code, message), their return values are
+           ignored. Return values which cannot be encoded are sent as
+           errors of their calls.
+        '''
+        log(DEBUG, 'Returning results of batch {} with values {} and errors {}'.format(request_id, return_values, errors))
+        errors = errors or {}
+        def encode(buffer):
+            buffer += RETURN_BATCH
+            buffer += BATCH_HEADER.pack(request_id, len(return_values))
+            for idx, (return_type, return_value) in enumerate(zip(return_types, return_values)):
+                if idx in errors:
+                    code, message = errors[idx]
+                    self.compiled.batch_error_encoder.encode(self, [BATCH_CALL_RAISED, code, message], buffer)
+                    continue
+                value = bytearray(BATCH_CALL_RETURNED)
+                try:
+                    self.compiled.value_codec(return_type).encode(self, [return_value], value)
+                except Exception as ex:
+                    log(ERROR, 'Encoding return value of call {} of batch {} failed: {!r}'.format(idx, request_id, ex))
+                    self.compiled.batch_error_encoder.encode(self, [BATCH_CALL_RAISED, error_code(ex), error_message(ex)], buffer)
+                else:
+                    buffer += value
+        self._send(encode)
 
     def return_method(self, request_id, return_type, return_value):
         log(DEBUG, 'Returning method call result for request {} with value {} of type {}'.format(request_id, return_value, return_type))
-        self.write_to_stream(RETURN_FROM_METHOD)
-        self.write_request_id(request_id)
-        self.write_value(return_type, return_value)
+        encoder = self.compiled.return_encoder(return_type)
+        self.send_message(encoder, [RETURN_FROM_METHOD, request_id, return_value])
+
+    def raise_method(self, request_id, code, message):
+        log(DEBUG, 'Raising error {} with message {!r} for request {}'.format(code, message, request_id))
+        self.send_message(self.compiled.error_encoder, [RAISE_FROM_METHOD, request_id, code, message])
 
     def noop(self):
         self.write_to_stream(NOOP)
 
     def disconnect(self):
         log(INFO, 'Disconnecting')
-        self.write_to_stream(DISCONNECT)
+        self.write_to_stream(DISCONNECT, flush=True)
 
     def acknowledge_disconnect(self):
         log(INFO, 'Acknowledging disconnect')
-        self.write_to_stream(ACKNOWLEDGE_DISCONNECT)
+        self.write_to_stream(ACKNOWLEDGE_DISCONNECT, flush=True)
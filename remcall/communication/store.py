@@ -1,76 +1,259 @@
 from logging import log, DEBUG
+from sys import getsizeof
+from array import array
+from threading import RLock
+from collections import deque
+from weakref import WeakValueDictionary, finalize
 from ..schema import Type
 from .proxy import ProxyType
-from ..error import UnknownProxyObject, UnknownImplementationObjectReference
+from ..error import UnknownProxyObject, UnknownImplementationObjectReference, \
+                    StaleObjectReference, ObjectIdsExhausted, UnresolvedPromise
 
 
 class IdStore:
-    def __init__(self):
-        self.id_to_obj = {}
+    '''Objects by ID based on object identity, objects need not be
+       hashable. Objects and their IDs are kept in a list and an array
+       indexed by the slot of the ID (as returned by slot_of, IDs need
+       to be dense for the store to be compact); the reverse mapping is
+       keyed by id(obj). ID 0 is not supported.
+    '''
+    def __init__(self, slot_of=abs):
+        self.slot_of = slot_of
+        self.objects = []
+        self.keys = array('q')
         self.obj_to_id = {}
 
+    def _find_slot(self, key: int):
+        slot = self.slot_of(key)
+        if key == 0 or slot >= len(self.keys) or self.keys[slot] != key:
+            raise KeyError(key)
+        return slot
+
     def __getitem__(self, key: int):
-        return self.id_to_obj[key]
+        return self.objects[self._find_slot(key)]
 
     def __setitem__(self, key: int, obj):
-        self.id_to_obj[key] = obj
-        self.obj_to_id[obj] = key
+        slot = self.slot_of(key)
+        if slot >= len(self.keys):
+            missing = slot + 1 - len(self.keys)
+            self.objects.extend([None] * missing)
+            self.keys.extend([0] * missing)
+        elif self.keys[slot] != 0:
+            del self[self.keys[slot]]
+        self.objects[slot] = obj
+        self.keys[slot] = key
+        self.obj_to_id[id(obj)] = key
 
     def __delitem__(self, key):
-        value = self.id_to_obj[key]
-        del self.id_to_obj[key]
-        del self.obj_to_id[value]
+        slot = self._find_slot(key)
+        del self.obj_to_id[id(self.objects[slot])]
+        self.objects[slot] = None
+        self.keys[slot] = 0
 
     def __contains__(self, key):
-        return key in self.id_to_obj
+        try:
+            self._find_slot(key)
+        except KeyError:
+            return False
+        return True
 
     def get_id_for_object(self, obj):
-        return self.obj_to_id[obj]
+        return self.obj_to_id[id(obj)]
 
     def delete_object(self, obj):
-        key = self.obj_to_id[obj]
-        del self.obj_to_id[obj]
-        del self.id_to_obj[key]
+        del self[self.obj_to_id[id(obj)]]
 
     def contains_object(self, obj):
-        return obj in self.obj_to_id
+        return id(obj) in self.obj_to_id
+
+    def __len__(self):
+        return len(self.obj_to_id)
+
+    def memory_usage(self):
+        '''Bytes used by the containers of the store, excluding the
+           stored objects and the int objects of the reverse mapping
+        '''
+        return getsizeof(self.objects) + getsizeof(self.keys) \
+            + getsizeof(self.obj_to_id)
+
+
+class ObjectIdAllocator:
+    '''Allocates object IDs fitting into bytes_object_ref bytes and reuses
+       released IDs. The magnitude of an ID combines a slot (lower bits)
+       and the generation of that slot (upper generation_bits bits); the
+       generation is incremented whenever the slot is released such that
+       references to released IDs can be detected as stale (until the
+       generation wraps around). Generation bits reduce the number of
+       live IDs, hence there are none by default and reused IDs cannot be
+       told apart from stale ones. Released slots are reused in the order
+       they were released.
+    '''
+    def __init__(self, sign, bytes_object_ref=4, generation_bits=0):
+        self.sign = sign
+        self.generation_bits = generation_bits
+        self.slot_bits = bytes_object_ref * 8 - 1 - generation_bits
+        assert self.slot_bits > 0, \
+            'No bits left for object IDs using {} generation bits' \
+            .format(generation_bits)
+        self.max_slot = (1 << self.slot_bits) - 1
+        self._slot_mask = self.max_slot
+        self._generation_mask = (1 << generation_bits) - 1
+        self.generations = array('H', [0])
+        self.free_slots = deque()
+
+    def allocate(self):
+        if self.free_slots:
+            slot = self.free_slots.popleft()
+        else:
+            slot = len(self.generations)
+            if slot > self.max_slot:
+                raise ObjectIdsExhausted(self.max_slot)
+            self.generations.append(0)
+        return self.sign * (slot | (self.generations[slot] << self.slot_bits))
+
+    def slot(self, key):
+        return abs(key) & self._slot_mask
+
+    def split(self, key):
+        '''Returns slot and generation of key'''
+        magnitude = abs(key)
+        return magnitude & self._slot_mask, magnitude >> self.slot_bits
+
+    def release(self, key):
+        slot, generation = self.split(key)
+        self.generations[slot] = (generation + 1) & self._generation_mask
+        self.free_slots.append(slot)
+
+    def is_stale(self, key):
+        '''Whether key references a slot that has been released since'''
+        slot, generation = self.split(key)
+        return 0 < slot < len(self.generations) \
+            and self.generations[slot] != generation
 
 
 class ReferenceStore:
-    def __init__(self, is_client, proxy_factory):
+    '''Implementation objects referenced by the other side and proxies
+       for objects of the other side.
+
+       Implementation objects are kept together with the number of times
+       their ID has been sent; they are dropped once the other side has
+       released as many references. Proxies are only referenced weakly
+       and count how often their ID has been received; if a proxy is
+       garbage collected, its ID and count are queued in ``released``
+       to be sent to the other side.
+    '''
+    def __init__(self, is_client, proxy_factory, bytes_object_ref=4,
+                 generation_bits=0):
         self.is_client = is_client
         self.proxy_factory = proxy_factory
-        self.proxy_objects = IdStore()
-        self.implementation_objects = IdStore()
-        self._next_object_id = 0
+        self.proxy_objects = WeakValueDictionary()
+        self.import_counts = {}
+        self.object_ids = ObjectIdAllocator(self.object_id_sign,
+                                            bytes_object_ref, generation_bits)
+        self.implementation_objects = IdStore(self.object_ids.slot)
+        self.export_counts = {}
+        self.released = deque()
+        self.check_implementation = None
+        self._lock = RLock()
 
     @property
     def object_id_sign(self):
         return -1 if self.is_client else 1
 
+    def memory_usage(self):
+        '''Bytes used for bookkeeping of implementation objects and
+           proxies, excluding the objects and proxies themselves
+        '''
+        with self._lock:
+            return self.implementation_objects.memory_usage() \
+                + getsizeof(self.export_counts) \
+                + getsizeof(self.import_counts) \
+                + getsizeof(self.object_ids.generations) \
+                + getsizeof(self.object_ids.free_slots)
+
     def next_object_id(self):
-        self._next_object_id += self.object_id_sign
-        return self._next_object_id
+        return self.object_ids.allocate()
 
     def get_proxy_object(self, key: int, typ: Type):
-        if key not in self.proxy_objects:
-            self.proxy_objects[key] = self.proxy_factory(typ)
-        return self.proxy_objects[key]
+        with self._lock:
+            proxy = self.proxy_objects.get(key)
+            if proxy is None:
+                proxy = self.proxy_factory(typ)
+                proxy._id = key
+                self.proxy_objects[key] = proxy
+                token = object()
+                self.import_counts[key] = [token, 0]
+                finalize(proxy, self._proxy_released, key, token)
+            self.import_counts[key][1] += 1
+            return proxy
+
+    def _proxy_released(self, key, token):
+        with self._lock:
+            entry = self.import_counts.get(key)
+            if entry is None or entry[0] is not token:
+                return
+            del self.import_counts[key]
+            if entry[1] > 0:
+                self.released.append((key, entry[1]))
+
+    def uncount_import(self, proxy):
+        '''Reverts counting one receipt of the ID of proxy, e.g. if the
+           message containing it has to be decoded again
+        '''
+        with self._lock:
+            entry = self.import_counts.get(proxy._id)
+            if entry is not None:
+                entry[1] -= 1
+
+    def take_released(self):
+        '''Returns and forgets the (ID, count) pairs of all proxies
+           garbage collected so far
+        '''
+        released = []
+        while self.released:
+            released.append(self.released.popleft())
+        return released
+
+    def release_objects(self, released):
+        '''Drops implementation objects the other side does not reference
+           anymore; released contains (ID, count) pairs
+        '''
+        with self._lock:
+            for key, count in released:
+                if key not in self.export_counts:
+                    continue
+                self.export_counts[key] -= count
+                if self.export_counts[key] <= 0:
+                    log(DEBUG, 'Releasing implementation object {}'
+                               .format(key))
+                    del self.export_counts[key]
+                    del self.implementation_objects[key]
+                    self.object_ids.release(key)
 
     def get_implementation_object(self, key: int):
         if key not in self.implementation_objects:
+            if self.object_ids.is_stale(key):
+                raise StaleObjectReference(key)
             raise UnknownImplementationObjectReference(key)
         return self.implementation_objects[key]
 
     def get_id_for_proxy_object(self, obj):
-        if not self.proxy_objects.contains_object(obj):
+        key = obj._id
+        if key is None or self.proxy_objects.get(key) is not obj:
             raise UnknownProxyObject(obj)
-        return self.proxy_objects.get_id_for_object(obj)
+        return key
 
-    def get_id_for_implementation_object(self, obj):
-        if not self.implementation_objects.contains_object(obj):
-            self.implementation_objects[self.next_object_id()] = obj
-        return self.implementation_objects.get_id_for_object(obj)
+    def get_id_for_implementation_object(self, obj, typ=None):
+        if typ is not None and self.check_implementation is not None:
+            self.check_implementation(obj, typ)
+        with self._lock:
+            if not self.implementation_objects.contains_object(obj):
+                key = self.next_object_id()
+                self.implementation_objects[key] = obj
+                self.export_counts[key] = 0
+            key = self.implementation_objects.get_id_for_object(obj)
+            self.export_counts[key] += 1
+            return key
 
     def get_object(self, key: int, typ: Type):
         log(DEBUG, '{} store is getting object for ID {}'
@@ -86,10 +269,19 @@ class ReferenceStore:
             if is_proxy_obj \
             else self.get_implementation_object(key)
 
-    def get_id_for_object(self, obj):
+    def get_id_for_object(self, obj, typ=None):
+        '''Returns the ID for obj; implementation objects exported as
+           interface typ are checked by check_implementation(obj, typ)
+           if set. Promise proxies have to be resolved before encoding,
+           encoding does not wait for pending promises.
+        '''
         if obj is None:
             return 0
         is_proxy_obj = isinstance(obj, ProxyType)
+        if is_proxy_obj and obj._promise is not None:
+            if not obj._promise.done():
+                raise UnresolvedPromise(obj._promise.request_id)
+            return self.get_id_for_object(obj._promise.result(), typ)
         return self.get_id_for_proxy_object(obj) \
             if is_proxy_obj \
-            else self.get_id_for_implementation_object(obj)
+            else self.get_id_for_implementation_object(obj, typ)
@@ -43,6 +43,28 @@ class UnknownImplementationObjectReference(RemcallError):
         self.object_id = key
 
 
+class StaleObjectReference(UnknownImplementationObjectReference):
+    def __init__(self, key):
+        RemcallError.__init__(self, 'Object reference {} has been released '
+                                    'and its ID may have been reused'
+                                    .format(key))
+        self.object_id = key
+
+
+class UnknownMethodReference(RemcallError):
+    def __init__(self, request_id, method_ref):
+        super().__init__('Method call with request ID {} has unknown method '
+                         'reference {}'.format(request_id, method_ref))
+        self.request_id = request_id
+        self.method_ref = method_ref
+
+
+class ObjectIdsExhausted(RemcallError):
+    def __init__(self, max_objects):
+        super().__init__('All {} object IDs are in use'.format(max_objects))
+        self.max_objects = max_objects
+
+
 class MethodNotAvailable(RemcallError):
     def __init__(self, method, impl_method_name, this):
         msg = ('Method {} with expected implementation name {}' +
@@ -75,3 +97,120 @@ class MissingMethodReturnValueEvent(RemcallError):
         super().__init__('No method return event exists for request ID {}'
                          .format(request_id))
         self.request_id = request_id
+
+
+class CallRejected(RemcallError):
+    def __init__(self, queue_depth):
+        super().__init__('Method call rejected, {} calls are already queued'
+                         .format(queue_depth))
+        self.queue_depth = queue_depth
+
+
+class NotOneway(RemcallError):
+    def __init__(self, method):
+        super().__init__('Method {} returns {} and cannot be called oneway'
+                         .format(method.name, method.return_type))
+        self.method = method
+
+
+class UnknownPromise(RemcallError):
+    def __init__(self, request_id):
+        super().__init__('No promised result exists for request ID {}'
+                         .format(request_id))
+        self.request_id = request_id
+
+
+class UnresolvedPromise(RemcallError):
+    def __init__(self, request_id):
+        super().__init__('Promise for request ID {} has to be resolved '
+                         'before it can be sent'.format(request_id))
+        self.request_id = request_id
+
+
+class CallTimeout(RemcallError, TimeoutError):
+    def __init__(self, timeout):
+        super().__init__('Method call did not return within {} seconds'
+                         .format(timeout))
+        self.timeout = timeout
+
+
+class ConnectionClosed(RemcallError):
+    def __init__(self):
+        super().__init__('Connection closed before method call returned')
+
+
+class SchemaMismatch(RemcallError):
+    def __init__(self, digest, remote_digest, remote_schema=None):
+        super().__init__('Schema of other side has sha256 digest {}, '
+                         'expected {}'.format(view_hex(remote_digest),
+                                              view_hex(digest)))
+        self.digest = digest
+        self.remote_digest = remote_digest
+        self.remote_schema = remote_schema
+
+
+class UnknownSchema(RemcallError):
+    def __init__(self, digest):
+        super().__init__('No schema with sha256 digest {} is registered'
+                         .format(view_hex(digest)))
+        self.digest = digest
+
+
+class RemoteError(RemcallError):
+    '''Error reported by the other side for a method call; subclasses
+       correspond to the error codes of RAISE_FROM_METHOD
+    '''
+    code = 0
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class RemoteMethodError(RemoteError):
+    code = 1
+
+
+class RemoteMethodNotAvailable(RemoteError):
+    code = 2
+
+
+class RemoteDecodingError(RemoteError):
+    code = 3
+
+
+class RemoteCallRejected(RemoteError):
+    code = 4
+
+
+REMOTE_ERRORS = {cls.code: cls for cls in (RemoteError, RemoteMethodError,
+                                           RemoteMethodNotAvailable,
+                                           RemoteDecodingError,
+                                           RemoteCallRejected)}
+
+
+def remote_error(code, message):
+    '''Creates the RemoteError for an error code received from the other
+       side, unknown codes result in a plain RemoteError
+    '''
+    return REMOTE_ERRORS.get(code, RemoteError)(message)
+
+
+def error_message(ex):
+    '''Message to report exception ex to the other side'''
+    return '{}: {}'.format(type(ex).__name__, ex)
+
+
+def error_code(ex):
+    '''Error code to report exception ex to the other side'''
+    if isinstance(ex, RemoteError):
+        return ex.code
+    elif isinstance(ex, MethodNotAvailable):
+        return RemoteMethodNotAvailable.code
+    elif isinstance(ex, CallRejected):
+        return RemoteCallRejected.code
+    elif isinstance(ex, (WrongNumberOfBytesRead, UnknownType, UnknownPromise,
+                         UnknownImplementationObjectReference,
+                         UnknownMethodReference)):
+        return RemoteDecodingError.code
+    return RemoteMethodError.code
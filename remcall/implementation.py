@@ -1,4 +1,5 @@
 from enum import Enum
+from operator import attrgetter, itemgetter
 from types import ModuleType, new_class
 from inspect import Signature, Parameter
 from .error import UnknownType
@@ -6,7 +7,29 @@ from .util import TypeWrapper
 
 
 class RecordType:
-    pass
+    __slots__ = ()
+    _fields = ()
+
+    def _field_values(self):
+        return ()
+
+    @classmethod
+    def _from_field_values(cls, values):
+        return cls(*values)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return tuple(self._field_values()) == tuple(other._field_values())
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, value)
+            for name, value in zip(self._fields, self._field_values())))
 
 
 def create_enum_implementation(enum, name_converter):
@@ -16,7 +39,20 @@ def create_enum_implementation(enum, name_converter):
     return Enum(name, enum_dict)  # Note: python stdlib Enum!
 
 
-def create_record_implementation(record, name_converter):
+def _generate_function(name, fields, body):
+    '''Generates a function taking self and fields positionally'''
+    params = ''.join(', ' + field for field in fields)
+    source = 'def {}(self{}):\n{}'.format(name, params, '\n'.join(
+        '    ' + line for line in body))
+    namespace = {'_tuple_new': tuple.__new__}
+    exec(source, namespace)
+    return namespace[name]
+
+
+def create_record_implementation(record, name_converter, immutable=False):
+    '''Creates a slotted class for record; immutable records are tuple
+       subclasses with read-only properties for their fields
+    '''
     name = name_converter.record_name(record.name)
     params = [Parameter(name_converter.parameter_name(name),
                         Parameter.POSITIONAL_OR_KEYWORD,
@@ -25,26 +61,53 @@ def create_record_implementation(record, name_converter):
     params.insert(0, Parameter('self', Parameter.POSITIONAL_ONLY,
                                annotation=TypeWrapper(record, name_converter)))
     __signature__ = Signature(parameters=params)
-
-    def __init__(self, *args, **kwargs):
-        bound_values = __signature__.bind(self, *args, **kwargs)
-        for key, val in bound_values.arguments.items():
-            setattr(self, key, val)
-
+    fields = tuple(param.name for param in params[1:])
+    if immutable:
+        return _create_immutable_record(name, fields, __signature__)
+    __init__ = _generate_function('__init__', fields,
+                                  ['self.{0} = {0}'.format(field)
+                                   for field in fields] or ['pass'])
     __init__.__signature__ = __signature__
+    namespace = dict(__init__=__init__, __slots__=fields, _fields=fields,
+                     __hash__=None)
+    if len(fields) == 1:
+        get_field = attrgetter(fields[0])
+        namespace['_field_values'] = lambda self: (get_field(self),)
+    elif fields:
+        get_fields = attrgetter(*fields)
+        namespace['_field_values'] = lambda self: get_fields(self)
     return new_class(name, (RecordType,), {},
-                     lambda ns: ns.update(dict(__init__=__init__)))
+                     lambda ns: ns.update(namespace))
+
+
+def _create_immutable_record(name, fields, signature):
+    values = ''.join(field + ', ' for field in fields)
+    __new__ = _generate_function('__new__', fields,
+                                 ['return _tuple_new(self, ({}))'
+                                  .format(values)])
+    __new__.__signature__ = signature
+    namespace = dict(__new__=__new__, __slots__=(), _fields=fields,
+                     __hash__=tuple.__hash__,
+                     _field_values=lambda self: self,
+                     _from_field_values=classmethod(tuple.__new__))
+    for idx, field in enumerate(fields):
+        namespace[field] = property(itemgetter(idx))
+    return new_class(name, (RecordType, tuple), {},
+                     lambda ns: ns.update(namespace))
 
 
 class EnumRecordImplementation:
-    def __init__(self, schema, name_converter):
+    '''Python classes for the enums and records of a schema; records are
+       tuple-backed and immutable if immutable_records is set
+    '''
+    def __init__(self, schema, name_converter, immutable_records=False):
         self.name_converter = name_converter
         self.types = {}
         for enum in schema.enums:
             self.types[enum] = create_enum_implementation(enum, name_converter)
         for record in schema.records:
-            self.types[record] = create_record_implementation(record,
-                                                              name_converter)
+            self.types[record] = create_record_implementation(
+                record, name_converter, immutable_records)
         self.impl = ModuleType('enum_record_implementation')
         for typ, impl in self.types.items():
             setattr(self.impl, impl.__name__, impl)
@@ -1,3 +1,4 @@
+from functools import wraps
 from typing import Iterable, Tuple, Mapping, Union
 
 from .base import assert_name
@@ -147,10 +148,16 @@ class Record(Type):
 
 
 class Method:
+    '''Method of an interface; calls to oneway methods are not answered
+       and return nothing, hence oneway methods require return type void.
+       The oneway flag is a property of the caller and not part of the
+       binary schema representation.
+    '''
     def __init__(self,
                  name: str,
                  arguments: Iterable[Tuple[TypeOrRef, str]],
-                 return_type: Type) -> None:
+                 return_type: Type,
+                 oneway: bool = False) -> None:
         assert_name(name)
         self.name = name
         self.arguments = list(arguments)
@@ -159,11 +166,16 @@ class Method:
             assert_type_or_ref(typ)
             assert typ is not void, 'Arguments cannot be of type void'
         self.return_type = return_type
+        self.oneway = oneway
+        assert not oneway or return_type is void, \
+            'Oneway method {} requires return type void, got {}' \
+            .format(name, return_type)
 
     def __str__(self) -> str:
         args = ', '.join('{!s} {}'.format(typ, name)
                          for typ, name in self.arguments)
-        return '{!s} {}({});'.format(self.return_type, self.name, args)
+        return '{}{!s} {}({});'.format('oneway ' if self.oneway else '',
+                                       self.return_type, self.name, args)
 
     def __repr__(self) -> str:
         return '{}(name="{}", arguments={}, return_type="{}")' \
@@ -208,10 +220,28 @@ class Interface(Type):
                                                     self.name, self.methods)
 
 
+def frozen_property(fn):
+    '''Property of a schema which is recomputed on every access until
+       the schema is frozen and computed only once afterwards
+    '''
+    name = fn.__name__
+
+    @wraps(fn)
+    def get(self):
+        cache = self._frozen_cache
+        if cache is None:
+            return fn(self)
+        if name not in cache:
+            cache[name] = fn(self)
+        return cache[name]
+    return property(get)
+
+
 class Schema:
     def __init__(self, label, types,
                  bytes_method_ref=2, bytes_object_ref=4,
                  sha256_digest=None):
+        self._frozen_cache = None
         self.label = label
         self.types = set(typ for typ in types if typ.is_declared)
         assert bytes_method_ref in (1, 2, 4, 8), \
@@ -237,25 +267,42 @@ class Schema:
                    ('Every interface requires at least one method, ' +
                     '"{}" has none').format(ifc.name)
 
+    def freeze(self):
+        '''Computes all type and method tables once and reuses them from
+           then on; neither the schema nor its types may be modified
+           after freezing
+        '''
+        if self._frozen_cache is None:
+            self._frozen_cache = {}
+            for name in ('declared_types', 'enums', 'records', 'interfaces',
+                         'type_table', 'type_schemas', 'method_lookup',
+                         'method_table', 'method_to_interface'):
+                getattr(self, name)
+        return self
+
+    @property
+    def is_frozen(self):
+        return self._frozen_cache is not None
+
     @property
     def iter_declared_types(self):
         for typ in self.types:
             if typ.is_declared:
                 yield typ
 
-    @property
+    @frozen_property
     def declared_types(self):
         return sorted(self.iter_declared_types, key=lambda tp: tp.sort_key)
 
-    @property
+    @frozen_property
     def enums(self):
         return [typ for typ in self.types if isinstance(typ, Enum)]
 
-    @property
+    @frozen_property
     def records(self):
         return [typ for typ in self.types if isinstance(typ, Record)]
 
-    @property
+    @frozen_property
     def interfaces(self):
         return [typ for typ in self.types if isinstance(typ, Interface)]
 
@@ -277,7 +324,7 @@ class Schema:
             if isinstance(typ, Interface):
                 yield typ
 
-    @property
+    @frozen_property
     def type_table(self):
         assert primitive_types[0].name == 'void', \
                'First type with index 0 has to be void, got {}' \
@@ -288,7 +335,7 @@ class Schema:
             table[Array(typ)] = -idx
         return table
 
-    @property
+    @frozen_property
     def type_schemas(self):
         class _:
             pass
@@ -297,24 +344,43 @@ class Schema:
             setattr(tps, typ.name, typ)
         return tps
 
-    @property
+    @frozen_property
     def method_table(self):
         return {v: k for k, v in self.method_lookup.items()}
 
-    @property
+    @frozen_property
     def method_lookup(self):
-        methods = sum((iface.methods_sorted
-                       for iface in self.interfaces_sorted), [])
+        methods = (method for iface in self.interfaces_sorted
+                   for method in iface.methods_sorted)
         return {idx: method for idx, method in enumerate(methods)}
 
-    @property
+    @frozen_property
     def method_to_interface(self):
         mi = {}
+        idx = 0
         for iface in self.interfaces_sorted:
             for method in iface.methods_sorted:
-                mi[self.method_table[method]] = iface
+                mi[idx] = iface
+                idx += 1
         return mi
 
+    @property
+    def oneway_methods(self):
+        '''(interface name, method name) of all oneway methods; oneway
+           flags are not part of the binary schema and its digest
+        '''
+        return frozenset((iface.name, method.name)
+                         for iface in self.interfaces
+                         for method in iface.methods if method.oneway)
+
+    def set_oneway_methods(self, oneway_methods):
+        '''Sets the oneway flags of all methods as in oneway_methods,
+           e.g. after reading the binary schema
+        '''
+        for iface in self.interfaces:
+            for method in iface.methods:
+                method.oneway = (iface.name, method.name) in oneway_methods
+
     def pretty_print(self):
         return '\n\n'.join(typ.pretty_print() for typ in self.declared_types)
 
@@ -1,4 +1,4 @@
-from queue import Queue
+from queue import Queue, Empty
 from binascii import hexlify
 
 
@@ -23,13 +23,52 @@ class QueueStream:
             self.queue.put(byt)
         return len(data)
 
+    def _get(self, block=True):
+        byt = self.queue.get(block)
+        if byt is None:
+            # keep end of stream for subsequent reads
+            self.queue.put(None)
+        return byt
+
     def read(self, size: int):
-        return b''.join(self.queue.get().to_bytes(1, 'little')
-                        for i in range(size))
+        data = bytearray()
+        while len(data) < size:
+            byt = self._get()
+            if byt is None:
+                break
+            data.append(byt)
+        return bytes(data)
+
+    def readinto(self, b):
+        '''Blocks until at least one byte is available, then reads
+           as many bytes as are currently available (up to len(b));
+           returns 0 at the end of the stream
+        '''
+        if len(b) == 0:
+            return 0
+        byt = self._get()
+        if byt is None:
+            return 0
+        b[0] = byt
+        count = 1
+        try:
+            while count < len(b):
+                byt = self._get(False)
+                if byt is None:
+                    break
+                b[count] = byt
+                count += 1
+        except Empty:
+            pass
+        return count
 
     def flush(self):
         pass
 
+    def close(self):
+        '''Ends the stream, reads return the remaining data only'''
+        self.queue.put(None)
+
 
 class TypeWrapper:
     '''Wraps a core.Type and provides a nice annotation
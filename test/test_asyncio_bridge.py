@@ -0,0 +1,267 @@
+import unittest
+import asyncio
+import socket
+from remcall.communication.asyncio_bridge import AsyncBridge, FrameBuffer, \
+                                                 IncompleteFrame
+from remcall.communication.registry import SchemaRegistry, Listener
+from remcall.error import RemoteMethodError
+from test.test_communication import SCHEMA, Status, Address, \
+                                    enum_record_implementation
+
+
+class AsyncUserImpl:
+    def __init__(self, name, age):
+        self.name = name
+        self.age = age
+        self.friends = {}
+
+    async def get_age(self):
+        await asyncio.sleep(0)
+        return self.age
+
+    def get_status(self):
+        return Status.LOCKED
+
+    def get_address(self):
+        return Address(street='Async Avenue', number=1)
+
+    async def add_friend(self, user, degree):
+        self.friends[user] = (degree, await user.get_age())
+
+    def set_name(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class SlowAsyncUserImpl(AsyncUserImpl):
+    async def set_name(self, name):
+        await asyncio.sleep(0.1)
+        self.name = name
+
+
+class FailingAsyncUserImpl(AsyncUserImpl):
+    def set_name(self, name):
+        raise ValueError('boom')
+
+    async def add_friend(self, user, degree):
+        raise ValueError('boom')
+
+
+class AsyncMainImpl:
+    def __init__(self):
+        self.first_user = AsyncUserImpl('First User', 42)
+
+    async def get_first_user(self):
+        return self.first_user
+
+
+class ClientUserImpl:
+    async def get_age(self):
+        return 7
+
+
+class CallbackUserImpl:
+    def __init__(self, server_user):
+        self.server_user = server_user
+
+    async def get_age(self):
+        return await self.server_user.get_age() - 1
+
+
+class TestAsyncBridge(unittest.TestCase):
+
+    def test_frame_buffer(self):
+        import struct
+        buffer = FrameBuffer()
+        buffer.feed(b'\x00\x00')
+        with self.assertRaises(IncompleteFrame) as cm:
+            buffer.unpack(struct.Struct('!I'))
+        self.assertEqual(4, cm.exception.required)
+        buffer.feed(b'\x00\x05ab')
+        buffer.rewind()
+        self.assertEqual((5,), buffer.unpack(struct.Struct('!I')))
+        buffer.consume()
+        self.assertEqual(b'ab', buffer.read(2))
+
+    def test_communication(self):
+        asyncio.run(self.communicate())
+
+    def test_partial_frames(self):
+        asyncio.run(self.communicate(chunk_size=1))
+
+    async def communicate(self, chunk_size=None):
+        server_sock, client_sock = socket.socketpair()
+        server_reader, server_writer = \
+            await asyncio.open_connection(sock=server_sock)
+        client_reader, client_writer = \
+            await asyncio.open_connection(sock=client_sock)
+        drained = []
+        drain = server_writer.drain
+
+        async def count_drain():
+            drained.append(None)
+            await drain()
+        server_writer.drain = count_drain
+        main = AsyncMainImpl()
+        server_bridge = AsyncBridge(SCHEMA, server_reader, server_writer,
+                                    main, enum_record_implementation)
+        self.assertIsNone(server_bridge.executor)
+        if chunk_size is not None:
+            server_bridge.receiver.chunk_size = chunk_size
+        server_task = server_bridge.start()
+        async with AsyncBridge(SCHEMA, client_reader, client_writer, None,
+                               enum_record_implementation) as client_bridge:
+            await client_bridge.check_schema()
+            first_user = await client_bridge.server.get_first_user()
+            self.assertEqual(42, await first_user.get_age())
+            self.assertEqual(Status.LOCKED, await first_user.get_status())
+            address = await first_user.get_address()
+            self.assertEqual('Async Avenue', address.street)
+            ages = await asyncio.gather(*[first_user.get_age()
+                                          for i in range(20)])
+            self.assertEqual([42] * 20, ages)
+            await first_user.add_friend(ClientUserImpl(), 0.5)
+            self.assertEqual([(0.5, 7)],
+                             list(main.first_user.friends.values()))
+            await first_user.set_name.oneway('Async User')
+            self.assertEqual(42, await first_user.get_age())
+            self.assertEqual('Async User', main.first_user.name)
+            with client_bridge.batch():
+                age = first_user.get_age.future()
+                status = first_user.get_status.future()
+            self.assertEqual(42, await age)
+            self.assertEqual(Status.LOCKED, await status)
+        await server_task
+        self.assertTrue(drained)
+        server_writer.close()
+        client_writer.close()
+
+    def test_import_counts(self):
+        asyncio.run(self.count_imports())
+
+    async def count_imports(self):
+        server_sock, client_sock = socket.socketpair()
+        server_reader, server_writer = \
+            await asyncio.open_connection(sock=server_sock)
+        client_reader, client_writer = \
+            await asyncio.open_connection(sock=client_sock)
+        main = AsyncMainImpl()
+        server_bridge = AsyncBridge(SCHEMA, server_reader, server_writer,
+                                    main, enum_record_implementation)
+        server_bridge.receiver.chunk_size = 1
+        server_task = server_bridge.start()
+        async with AsyncBridge(SCHEMA, client_reader, client_writer, None,
+                               enum_record_implementation) as client_bridge:
+            first_user = await client_bridge.server.get_first_user()
+            with client_bridge.batch():
+                added = first_user.add_friend.future(ClientUserImpl(), 0.5)
+                first_user.set_name.future('Batch User')
+            await added
+            friend, = main.first_user.friends
+            self.assertEqual(1, server_bridge.store.import_counts[friend._id][1])
+        await server_task
+        server_writer.close()
+        client_writer.close()
+
+    def test_oneway_before_two_way(self):
+        asyncio.run(self.call_oneway_before_two_way())
+
+    async def call_oneway_before_two_way(self):
+        server_sock, client_sock = socket.socketpair()
+        server_reader, server_writer = \
+            await asyncio.open_connection(sock=server_sock)
+        client_reader, client_writer = \
+            await asyncio.open_connection(sock=client_sock)
+        main = AsyncMainImpl()
+        main.first_user = SlowAsyncUserImpl('First User', 42)
+        server_bridge = AsyncBridge(SCHEMA, server_reader, server_writer,
+                                    main, enum_record_implementation)
+        server_task = server_bridge.start()
+        async with AsyncBridge(SCHEMA, client_reader, client_writer, None,
+                               enum_record_implementation) as client_bridge:
+            first_user = await client_bridge.server.get_first_user()
+            await first_user.set_name.oneway('New Name')
+            self.assertEqual('New Name', await first_user.get_name())
+            await first_user.set_name.oneway('Newer Name')
+            with client_bridge.batch():
+                name = first_user.get_name.future()
+            self.assertEqual('Newer Name', await name)
+            await first_user.add_friend.oneway(CallbackUserImpl(first_user),
+                                               0.5)
+            self.assertEqual('Newer Name', await asyncio.wait_for(
+                first_user.get_name(), 5))
+            while not main.first_user.friends:
+                await asyncio.sleep(0.01)
+            self.assertEqual([(0.5, 41)],
+                             list(main.first_user.friends.values()))
+        await server_task
+        server_writer.close()
+        client_writer.close()
+
+    def test_failing_oneway_calls(self):
+        asyncio.run(self.fail_oneway_calls())
+
+    async def fail_oneway_calls(self):
+        server_sock, client_sock = socket.socketpair()
+        server_reader, server_writer = \
+            await asyncio.open_connection(sock=server_sock)
+        client_reader, client_writer = \
+            await asyncio.open_connection(sock=client_sock)
+        main = AsyncMainImpl()
+        main.first_user = FailingAsyncUserImpl('First User', 42)
+        server_bridge = AsyncBridge(SCHEMA, server_reader, server_writer,
+                                    main, enum_record_implementation)
+        raised = []
+        server_bridge.receiver.raise_method_error = \
+            lambda request_id, ex: raised.append(request_id)
+        server_task = server_bridge.start()
+        async with AsyncBridge(SCHEMA, client_reader, client_writer, None,
+                               enum_record_implementation) as client_bridge:
+            first_user = await client_bridge.server.get_first_user()
+            with self.assertLogs(level='ERROR'):
+                await first_user.set_name.oneway('New Name')
+                await first_user.add_friend.oneway(ClientUserImpl(), 0.5)
+                self.assertEqual(42, await first_user.get_age())
+                with client_bridge.batch():
+                    renamed = first_user.set_name.future('New Name')
+                    age = first_user.get_age.future()
+                with self.assertRaises(RemoteMethodError):
+                    await renamed
+                self.assertEqual(42, await age)
+            self.assertEqual([], raised)
+        await server_task
+        server_writer.close()
+        client_writer.close()
+
+    def test_listener(self):
+        asyncio.run(self.listen())
+
+    async def listen(self):
+        main = AsyncMainImpl()
+        registry = SchemaRegistry()
+        registry.register(SCHEMA, main, enum_record_implementation)
+        listener = Listener(registry)
+        server_sock, client_sock = socket.socketpair()
+        server_reader, server_writer = \
+            await asyncio.open_connection(sock=server_sock)
+        client_reader, client_writer = \
+            await asyncio.open_connection(sock=client_sock)
+        async with AsyncBridge(SCHEMA, client_reader, client_writer, None,
+                               enum_record_implementation) as client_bridge:
+            server_bridge, _ = await asyncio.gather(
+                listener.accept_async(server_reader, server_writer),
+                client_bridge.check_schema())
+            self.assertIs(main, server_bridge.main)
+            with self.assertRaises(RuntimeError):
+                client_bridge.server.get_first_user.promise()
+            first_user = await client_bridge.server.get_first_user()
+            self.assertEqual(42, await first_user.get_age())
+        await server_bridge.mainloop_task
+        server_writer.close()
+        client_writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
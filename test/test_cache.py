@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+from remcall import SchemaCache, SchemaRuntime, schema_to_bytes, read_schema
+from remcall.implementation import EnumRecordImplementation
+from remcall.naming import PythonNameConverter
+from remcall.schema import void
+from test.test_fs_schema import FS_SCHEMA
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = SchemaCache(os.path.join(self.tmp.name, 'cache'))
+        self.fname = os.path.join(self.tmp.name, 'fs.rmc')
+        with open(self.fname, 'wb') as f:
+            f.write(schema_to_bytes(FS_SCHEMA))
+        self.loads = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, fname):
+        self.loads += 1
+        with open(fname, 'rb') as f:
+            return read_schema(f)
+
+    def test_load_schema(self):
+        schema = self.cache.load_schema(self.fname, self.load)
+        self.assertEqual(1, self.loads)
+        cached = self.cache.load_schema(self.fname, self.load)
+        self.assertEqual(1, self.loads)
+        self.assertEqual(schema.sha256_digest, cached.sha256_digest)
+        self.assertEqual(schema_to_bytes(schema), schema_to_bytes(cached))
+
+    def test_oneway_methods(self):
+        def load(fname):
+            schema = self.load(fname)
+            schema.set_oneway_methods(oneway)
+            return schema
+        schema = self.load(self.fname)
+        oneway = {[(iface.name, method.name)
+                   for iface in schema.interfaces_sorted
+                   for method in iface.methods_sorted
+                   if method.return_type is void][0]}
+        loaded = self.cache.load_schema(self.fname, load)
+        self.assertEqual(oneway, loaded.oneway_methods)
+        cached = self.cache.load_schema(self.fname, load)
+        self.assertEqual(2, self.loads)
+        self.assertEqual(oneway, cached.oneway_methods)
+        runtime = SchemaRuntime.for_schema(cached)
+        self.assertIsNot(runtime,
+                         SchemaRuntime.for_schema(self.load(self.fname)))
+        self.assertIs(runtime, SchemaRuntime.for_schema(
+            self.cache.load_schema(self.fname, load)))
+
+    def test_invalidation(self):
+        self.cache.load_schema(self.fname, self.load)
+        stat = os.stat(self.fname)
+        os.utime(self.fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.cache.load_schema(self.fname, self.load)
+        self.assertEqual(1, self.loads)
+        with open(self.fname, 'ab') as f:
+            f.write(b'\x00')
+        self.cache.load_schema(self.fname, self.load)
+        self.assertEqual(2, self.loads)
+
+    def test_corrupt_schema(self):
+        digest = self.cache.put_schema(FS_SCHEMA)
+        path = self.cache._path('schemas', digest.hex())
+        with open(path, 'r+b') as f:
+            f.seek(40)
+            f.write(b'\xff\xff')
+        self.assertIsNone(self.cache.get_schema(digest))
+
+    def test_corrupt_index(self):
+        self.cache.load_schema(self.fname, self.load)
+        index_dir = os.path.join(self.tmp.name, 'cache', 'sources')
+        index_path = os.path.join(index_dir, os.listdir(index_dir)[0])
+        for garbage in [b'{"mtime_ns": 1', b'{"size": 1}', b'[1, 2]', b'\xff']:
+            with open(index_path, 'wb') as f:
+                f.write(garbage)
+            with self.assertLogs(level='WARN'):
+                schema = self.cache.load_schema(self.fname, self.load)
+            self.assertEqual('FileSystemSchema', schema.label)
+        self.assertEqual(5, self.loads)
+
+    def test_corrupt_schema_name(self):
+        digest = self.cache.put_schema(FS_SCHEMA)
+        path = self.cache._path('schemas', digest.hex())
+        with open(path, 'r+b') as f:
+            f.seek(17)
+            f.write(b'\xff')
+        self.assertIsNone(self.cache.get_schema(digest))
+
+    def test_proxy_code(self):
+        runtime = SchemaRuntime(FS_SCHEMA, cache=self.cache)
+        self.assertEqual(1, len(os.listdir(os.path.join(self.tmp.name, 'cache', 'code'))))
+        cached_runtime = SchemaRuntime(FS_SCHEMA, cache=self.cache)
+        Main = FS_SCHEMA.type_schemas.Main
+        self.assertEqual(['get_root'],
+                         [name for name in vars(cached_runtime.proxy_classes[Main])
+                          if not name.startswith('_')])
+
+    def test_proxy_code_per_converter(self):
+        def converter(suffix):
+            class Converter(PythonNameConverter):
+                def method_name(self, name):
+                    return super().method_name(name) + suffix
+            return Converter()
+
+        for suffix in ['_a', '_b', '_a']:
+            implementation = EnumRecordImplementation(FS_SCHEMA, converter(suffix))
+            runtime = SchemaRuntime(FS_SCHEMA, implementation, cache=self.cache)
+            Main = FS_SCHEMA.type_schemas.Main
+            self.assertTrue(hasattr(runtime.proxy_classes[Main], 'get_root' + suffix))
+        self.assertEqual(2, len(os.listdir(os.path.join(self.tmp.name, 'cache', 'code'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,24 @@
 import unittest
-from remcall import schema_from_bytes, Bridge, Receiver
+from remcall import schema_from_bytes, Bridge, Receiver, Sender, SchemaRuntime, \
+    SchemaRegistry, Listener
+from remcall.communication.base import NOOP, DISCONNECT, ACKNOWLEDGE_DISCONNECT
+from remcall.schema import string, void, int32, Schema, Interface, Method, Record, Array
 from remcall.communication.proxy import create_proxy_classes_dict
 from remcall.util import QueueStream
-from remcall.error import UnknownCommand
+from remcall.communication.executor import CallExecutor
+from remcall.communication.promise import resolve, resolve_value, contains_interface
+from remcall.communication.store import ReferenceStore
+from remcall.error import UnknownCommand, NotOneway, CallTimeout, ConnectionClosed, \
+    RemoteMethodError, RemoteMethodNotAvailable, RemoteCallRejected, SchemaMismatch, \
+    UnknownSchema, UnresolvedPromise, RemoteDecodingError, UnknownMethodReference, \
+    WrongNumberOfBytesRead
 from remcall.implementation import EnumRecordImplementation
 from remcall.naming import PythonNameConverter
 
 #import logging
 #logging.basicConfig(level=logging.DEBUG)
 
-import base64, io
+import base64, io, threading, gc, inspect, time
 serialized_schema = base64.decodebytes(b'''
 UkVNQ0FMTFNDSEVNQQAAAAhNeVNjaGVtYQAAAAIAAAAEAAAAAQAAAAEAAAADAgAAABAAAAAGU3Rh
 dHVzAAAAAwAAAApSZWdpc3RlcmVkAAAACUFjdGl2YXRlZAAAAAZMb2NrZWQDAAAAEQAAAAdBZGRy
@@ -33,6 +42,8 @@ class UserImpl:
         self.age = age
         self.friends = {}
         self.address = Address(street='Home Drive', number=123)
+        self.names = []
+        self.names_set = threading.Event()
 
     def get_age(self):
         return self.age
@@ -40,6 +51,21 @@ class UserImpl:
     def get_status(self):
         return Status.ACTIVATED
 
+    def get_name(self):
+        return self.name
+
+    def get_friends(self):
+        raise ValueError('Friends are private')
+
+    def set_name(self, name):
+        self.name = name
+        self.names.append(name)
+        if name == 'last':
+            self.names_set.set()
+
+    def get_address(self):
+        return self.address
+
     def add_friend(self, user, degree):
         #print('Adding {} as a friend of degree {}'.format(user, degree))
         #print('Age of {} is {}'.format(user, user.GetAge()))
@@ -53,10 +79,39 @@ class MainImpl:
     def get_first_user(self):
         return self.first_user
 
+class SlowMainImpl(MainImpl):
+    def __init__(self):
+        super().__init__()
+        self.proceed = threading.Event()
+
+    def get_first_user(self):
+        self.proceed.wait(5)
+        return self.first_user
+
 class ClientUserImpl:
     def get_age(self):
         return 666
 
+class CallbackUserImpl:
+    '''Calls back into the server while being called by the server'''
+    def __init__(self, server_user):
+        self.server_user = server_user
+
+    def get_age(self):
+        return self.server_user.get_age() - 1
+
+class RecordingStream:
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        self.flushes += 1
+
 class TestCommunication(unittest.TestCase):
 
     def setUp(self):
@@ -89,6 +144,600 @@ class TestCommunication(unittest.TestCase):
             first_user = client_bridge.server.get_first_user()
             self.assertEqual(main.first_user.age, first_user.get_age())
             self.assertEqual(first_user.get_status(), Status.ACTIVATED)
+            address = first_user.get_address()
+            self.assertIsInstance(address, Address)
+            self.assertEqual('Home Drive', address.street)
+            self.assertEqual(123, address.number)
+
+    def test_many_calls_in_flight(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            futures = [first_user.get_age.future() for i in range(50)]
+            self.assertEqual([main.first_user.age] * 50,
+                             [future.result(5) for future in futures])
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+
+    def test_nested_callbacks_with_single_worker(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None,
+                               executor=CallExecutor(max_workers=1))
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None,
+                    executor=CallExecutor(max_workers=1)) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            first_user.add_friend(CallbackUserImpl(first_user), 0.5)
+            degree, age = main.first_user.friends.popitem()[1]
+            self.assertEqual(main.first_user.age - 1, age)
+            self.assertEqual(0, client_bridge.rejected_calls)
+            self.assertEqual(0, server_bridge.queue_depth)
+
+    def test_oneway_calls(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            names = [str(i) for i in range(100)] + ['last']
+            for name in names:
+                self.assertIsNone(first_user.set_name.oneway(name))
+            self.assertTrue(main.first_user.names_set.wait(5))
+            self.assertEqual(names, main.first_user.names)
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+            with self.assertRaises(NotOneway):
+                first_user.get_age.oneway()
+
+    def test_oneway_before_two_way(self):
+        class SlowUserImpl(UserImpl):
+            def set_name(self, name):
+                time.sleep(0.2)
+                super().set_name(name)
+        main = MainImpl()
+        main.first_user = SlowUserImpl('First User', 42)
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            first_user.set_name.oneway('New Name')
+            self.assertEqual('New Name', first_user.get_name())
+            first_user.set_name.oneway('Newer Name')
+            with client_bridge.batch():
+                name = first_user.get_name.future()
+            self.assertEqual('Newer Name', name.result(5))
+            # callbacks of a oneway call are not held back behind it
+            first_user.add_friend.oneway(CallbackUserImpl(first_user), 0.5)
+            self.assertEqual('Newer Name', first_user.get_name())
+            for i in range(50):
+                if main.first_user.friends:
+                    break
+                time.sleep(0.1)
+            degree, age = main.first_user.friends.popitem()[1]
+            self.assertEqual(41, age)
+
+    def test_batch(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, enum_record_implementation)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, enum_record_implementation) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            with client_bridge.batch() as batch:
+                name = first_user.get_name.future()
+                age = first_user.get_age.future()
+                status = first_user.get_status.future()
+                self.assertIsNone(first_user.set_name.oneway('Batched User'))
+                new_name = first_user.get_name.future()
+                with self.assertRaises(RuntimeError):
+                    first_user.get_age()
+            self.assertEqual(5, len(batch.calls))
+            self.assertEqual('First User', name.result(5))
+            self.assertEqual(main.first_user.age, age.result(5))
+            self.assertEqual(Status.ACTIVATED, status.result(5))
+            self.assertEqual('Batched User', new_name.result(5))
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+            self.assertEqual(main.first_user.age, first_user.get_age())
+
+    def test_promise_pipelining(self):
+        main = SlowMainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user.promise()
+            self.assertIsNotNone(first_user._promise)
+            age = first_user.get_age.future()
+            first_user.set_name.oneway('Pipelined User')
+            self.assertFalse(age.done())
+            main.proceed.set()
+            self.assertEqual(main.first_user.age, age.result(5))
+            first_user.add_friend(first_user, 0.5)
+            self.assertEqual((0.5, main.first_user.age), main.first_user.friends[main.first_user])
+            self.assertEqual('Pipelined User', main.first_user.name)
+            resolved = resolve(first_user)
+            self.assertIsNone(resolved._promise)
+            self.assertIs(resolved, client_bridge.store.get_object(1 + 1, self.schema.type_schemas.User))
+        server_bridge.mainloop_thread.join(5)
+        self.assertEqual({}, server_bridge.receiver.promised_results)
+
+    def test_resolve_nested_promises(self):
+        User = Interface('User', [Method('GetAge', [], int32)])
+        Group = Record('Group', [(Array(User), 'members'), (int32, 'size')])
+        schema = Schema('Nested', [User, Group, Interface('Main', [Method('Ping', [], void)])])
+        Group, = [typ for typ in schema.types if typ.name == 'Group']
+        GroupImpl = EnumRecordImplementation(schema, PythonNameConverter()).impl.Group
+        UserProxy = create_proxy_classes_dict(schema, PythonNameConverter())['UserProxy']
+        resolved = UserProxy(None)
+
+        class ResolvedPromise:
+            request_id = 7
+            done = lambda self: True
+            result = lambda self: resolved
+
+        promised = UserProxy(None)
+        promised._promise = ResolvedPromise()
+        group = GroupImpl(members=[promised, resolved], size=2)
+        self.assertTrue(contains_interface(Group))
+        self.assertFalse(contains_interface(Array(int32)))
+        resolved_group = resolve_value(group, Group)
+        self.assertEqual([resolved, resolved], resolved_group.members)
+        self.assertEqual([promised, resolved], group.members)
+        self.assertIs(resolved, resolve_value(promised, User))
+        self.assertEqual([1, 2], resolve_value([1, 2], Array(int32)))
+        ResolvedPromise.done = lambda self: False
+        with self.assertRaises(UnresolvedPromise):
+            ReferenceStore(True, None).get_id_for_object(promised)
+
+    def test_call_timeout(self):
+        main = SlowMainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None, call_timeout=0.1) as client_bridge:
+            with self.assertRaises(CallTimeout):
+                client_bridge.server.get_first_user()
+            main.proceed.set()
+            first_user = client_bridge.server.get_first_user()
+            self.assertEqual(main.first_user.age, first_user.get_age())
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+
+    def test_remote_errors(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            with self.assertRaises(RemoteMethodError) as cm:
+                first_user.get_friends()
+            self.assertIn('Friends are private', str(cm.exception))
+            with self.assertRaises(RemoteMethodNotAvailable):
+                first_user.get_birthdate()
+            with client_bridge.batch():
+                age = first_user.get_age.future()
+                birthdate = first_user.get_birthdate.future()
+                friends = first_user.get_friends.future()
+                first_user.set_name.oneway('Batched User')
+                name = first_user.get_name.future()
+            self.assertEqual(main.first_user.age, age.result(5))
+            with self.assertRaises(RemoteMethodNotAvailable):
+                birthdate.result(5)
+            with self.assertRaises(RemoteMethodError):
+                friends.result(5)
+            self.assertEqual('Batched User', name.result(5))
+            self.assertEqual(main.first_user.age, first_user.get_age())
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+
+    def test_wrong_return_type(self):
+        main = MainImpl()
+        main.first_user.age = None
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None,
+                    call_timeout=5) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            with self.assertRaises(RemoteMethodError):
+                first_user.get_age()
+            with client_bridge.batch():
+                age = first_user.get_age.future()
+                name = first_user.get_name.future()
+            with self.assertRaises(RemoteMethodError):
+                age.result(5)
+            self.assertEqual('First User', name.result(5))
+            main.first_user.age = 42
+            self.assertEqual(42, first_user.get_age())
+
+    def test_failed_send(self):
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, MainImpl(), None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            with self.assertRaises(AttributeError):
+                first_user.set_name(42)
+            with self.assertRaises(AttributeError):
+                with client_bridge.batch():
+                    name = first_user.get_name.future()
+                    first_user.set_name.future(42)
+            with self.assertRaises(AttributeError):
+                name.result(0)
+            self.assertEqual(0, len(client_bridge.receiver.method_returns))
+            self.assertEqual('First User', first_user.get_name())
+
+    def test_rejected_call_error(self):
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, MainImpl(), None,
+                               executor=CallExecutor(max_queue_size=0))
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            with self.assertRaises(RemoteCallRejected):
+                client_bridge.server.get_first_user()
+
+    def test_connection_closed(self):
+        main = SlowMainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user.future()
+        with self.assertRaises(ConnectionClosed):
+            first_user.result(5)
+        main.proceed.set()
+
+    def test_release_objects(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None,
+                               generation_bits=8)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            self.assertIs(first_user, client_bridge.server.get_first_user())
+            key = first_user._id
+            self.assertEqual(2, server_bridge.store.export_counts[key])
+            del first_user
+            gc.collect()
+            self.assertEqual([(key, 2)], list(client_bridge.store.released))
+            first_user = client_bridge.server.get_first_user()
+            self.assertEqual(0, len(client_bridge.store.released))
+            self.assertNotIn(key, server_bridge.store.implementation_objects)
+            self.assertNotEqual(key, first_user._id)
+            self.assertEqual(2, len(server_bridge.store.implementation_objects))
+            self.assertEqual(main.first_user.age, first_user.get_age())
+
+    def test_main_is_checked(self):
+        class EmptyMainImpl:
+            pass
+        with self.assertLogs(level='WARN') as cm:
+            Bridge(self.schema, self.stream2, self.stream1, EmptyMainImpl(), None)
+        self.assertIn('EmptyMainImpl does not implement', cm.output[0])
+
+    def test_stale_object_reference(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None,
+                               generation_bits=8)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            key = first_user._id
+            User, = [typ for typ in self.schema.types if typ.name == 'User']
+            del first_user
+            gc.collect()
+            client_bridge.server.get_first_user()
+            self.assertNotIn(key, server_bridge.store.implementation_objects)
+            stale = client_bridge.store.get_proxy_object(key, User)
+            with self.assertRaises(RemoteDecodingError):
+                stale.get_age()
+            with client_bridge.batch():
+                user = client_bridge.server.get_first_user.future()
+                age = stale.get_age.future()
+            with self.assertRaises(RemoteDecodingError):
+                user.result(5)
+            with self.assertRaises(RemoteDecodingError):
+                age.result(5)
+            self.assertTrue(server_bridge.mainloop_thread.is_alive())
+            self.assertEqual(main.first_user.age,
+                             client_bridge.server.get_first_user().get_age())
+
+    def test_release_objects_on_return(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            friend = ClientUserImpl()
+            first_user.add_friend(friend, 0.5)
+            key = client_bridge.store.implementation_objects.get_id_for_object(friend)
+            main.first_user.friends.clear()
+            gc.collect()
+            self.assertEqual([(key, 1)], list(server_bridge.store.released))
+            self.assertEqual(main.first_user.age, first_user.get_age())
+            self.assertNotIn(key, client_bridge.store.implementation_objects)
+
+    def test_check_schema(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            client_bridge.check_schema()
+            self.assertEqual(server_bridge.runtime.sha256_digest,
+                             client_bridge.receiver.remote_schema_digest)
+            self.assertIsNone(client_bridge.receiver.remote_schema)
+            self.assertEqual(main.first_user.age,
+                             client_bridge.server.get_first_user().get_age())
+
+    def test_schema_mismatch(self):
+        other_schema = Schema('OtherSchema', [Interface('Main', [Method('Ping', [], void)])])
+        server_bridge = Bridge(other_schema, self.stream2, self.stream1, object(), None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            with self.assertRaises(SchemaMismatch) as cm:
+                client_bridge.check_schema()
+            self.assertEqual('OtherSchema', cm.exception.remote_schema.label)
+            self.assertEqual(server_bridge.runtime.sha256_digest,
+                             cm.exception.remote_digest)
+            with self.assertRaises(SchemaMismatch) as cm:
+                client_bridge.check_schema(fetch_schema=False)
+            self.assertIsNone(cm.exception.remote_schema)
+        self.assertEqual(client_bridge.runtime.sha256_digest,
+                         server_bridge.receiver.remote_schema_digest)
+
+    def test_listener(self):
+        main, other_main = MainImpl(), object()
+        other_schema = Schema('OtherSchema', [Interface('Main', [Method('Ping', [], void)])])
+        registry = SchemaRegistry()
+        runtime = registry.register(self.schema, main)
+        other_runtime = registry.register(other_schema, other_main)
+        self.assertIs(runtime, SchemaRuntime.for_schema(self.schema))
+        self.assertIn(other_runtime.sha256_digest, registry)
+        self.assertEqual(2, len(registry))
+        listener = Listener(registry)
+        for schema, expected_main in ((self.schema, main), (other_schema, other_main)):
+            stream1, stream2 = QueueStream(), QueueStream()
+            with Bridge(schema, stream1, stream2, None, None) as client_bridge:
+                handshake = threading.Thread(target=client_bridge.check_schema)
+                handshake.start()
+                server_bridge = listener.accept(stream2, stream1)
+                handshake.join()
+                self.assertIs(expected_main, server_bridge.main)
+                self.assertEqual(client_bridge.runtime.sha256_digest,
+                                 server_bridge.runtime.sha256_digest)
+                if schema is self.schema:
+                    self.assertEqual(main.first_user.age,
+                                     client_bridge.server.get_first_user().get_age())
+            server_bridge.mainloop_thread.join()
+
+    def test_listener_unknown_schema(self):
+        other_schema = Schema('OtherSchema', [Interface('Main', [Method('Ping', [], void)])])
+        registry = SchemaRegistry()
+        listener = Listener(registry)
+        with Bridge(other_schema, self.stream1, self.stream2, None, None) as client_bridge:
+            errors = []
+            def check_schema():
+                try:
+                    client_bridge.check_schema()
+                except Exception as ex:
+                    errors.append(ex)
+            handshake = threading.Thread(target=check_schema)
+            handshake.start()
+            with self.assertRaises(UnknownSchema):
+                listener.accept(self.stream2, self.stream1)
+            handshake.join(5)
+            self.assertIsInstance(errors[0], ConnectionClosed)
+
+    def test_listener_default_schema(self):
+        other_schema = Schema('OtherSchema', [Interface('Main', [Method('Ping', [], void)])])
+        registry = SchemaRegistry()
+        registry.register(self.schema, MainImpl())
+        listener = Listener(registry)
+        errors = []
+        def accept():
+            try:
+                listener.accept(self.stream2, self.stream1)
+            except Exception as ex:
+                errors.append(ex)
+        server = threading.Thread(target=accept)
+        server.start()
+        with Bridge(other_schema, self.stream1, self.stream2, None, None) as client_bridge:
+            with self.assertRaises(SchemaMismatch) as cm:
+                client_bridge.check_schema()
+            self.assertEqual('MySchema', cm.exception.remote_schema.label)
+            with self.assertRaises(SchemaMismatch):
+                client_bridge.check_schema(fetch_schema=False)
+        server.join(5)
+        self.assertIsInstance(errors[0], ConnectionClosed)
+        client_bridge.mainloop_thread.join(5)
+        self.assertFalse(client_bridge.mainloop_thread.is_alive())
+
+    def test_pipelining_bridge(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None, pipelining=True) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            self.assertIsNotNone(first_user._promise)
+            self.assertEqual(main.first_user.age, first_user.get_age())
+
+    def test_shared_runtime(self):
+        runtime = SchemaRuntime.for_schema(self.schema)
+        self.assertIs(runtime, SchemaRuntime.for_schema(self.schema))
+        self.assertIs(runtime, SchemaRuntime.for_schema(schema_from_bytes(serialized_schema)))
+        self.assertEqual(serialized_schema, runtime.serialized_schema)
+        bridge1 = Bridge(runtime, QueueStream(), QueueStream(), None, None)
+        bridge2 = Bridge(self.schema, QueueStream(), QueueStream(), None, None)
+        self.assertIs(bridge1.runtime, bridge2.runtime)
+        self.assertIs(type(bridge1.server), type(bridge2.server))
+        self.assertIs(bridge1, bridge1.server._bridge)
+        self.assertIs(bridge2, bridge2.server._bridge)
+        bridge3 = Bridge(self.schema, QueueStream(), QueueStream(), None,
+                         enum_record_implementation)
+        bridge4 = Bridge(self.schema, QueueStream(), QueueStream(), None,
+                         enum_record_implementation)
+        self.assertIs(bridge3.runtime, bridge4.runtime)
+        self.assertIsNot(runtime, bridge3.runtime)
+        self.assertIs(enum_record_implementation,
+                      bridge3.runtime.enum_record_implementation)
+
+    def test_proxy_methods(self):
+        calls = []
+
+        class RecordingBridge:
+            pipelining = False
+
+            def call_method(self, method, this, args):
+                calls.append((method.name, this, args))
+
+        proxy_classes = create_proxy_classes_dict(self.schema, PythonNameConverter())
+        user = proxy_classes['UserProxy'](RecordingBridge())
+        friend = proxy_classes['UserProxy'](RecordingBridge())
+        user.add_friend(friend, 1.5)
+        user.add_friend(degree=2.5, user=friend)
+        user.get_age()
+        self.assertEqual([('AddFriend', user, (friend, 1.5)),
+                          ('AddFriend', user, (friend, 2.5)),
+                          ('GetAge', user, ())], calls)
+        self.assertEqual(['user', 'degree'], list(inspect.signature(user.add_friend).parameters))
+        self.assertEqual(['self', 'user', 'degree'],
+                         list(inspect.signature(type(user).add_friend).parameters))
+        with self.assertRaises(TypeError):
+            user.add_friend(friend)
+
+    def test_proxy_parameter_names(self):
+        calls = []
+
+        class RecordingBridge:
+            pipelining = False
+
+            def call_method(self, method, this, args):
+                calls.append((method.name, this, args))
+
+            call_method_async = call_method
+
+        schema = Schema('ReservedNames', [
+            Interface('Main', [Method('Connect', [(string, 'bridge'), (string, 'self')], void)])])
+        proxy = create_proxy_classes_dict(schema, PythonNameConverter())['MainProxy'](RecordingBridge())
+        proxy.connect('hello', 'this')
+        proxy.connect(self='this', bridge='hello')
+        proxy.connect.future('hello', 'this')
+        self.assertEqual([('Connect', proxy, ('hello', 'this'))] * 3, calls)
+        self.assertEqual(['_self', 'bridge', 'self'],
+                         list(inspect.signature(type(proxy).connect).parameters))
+
+    def test_proxy_keyword_method_names(self):
+        calls = []
+
+        class RecordingBridge:
+            pipelining = False
+
+            def call_method(self, method, this, args):
+                calls.append((method.name, args))
+
+        names = ['Import', 'Return', 'Raise', 'Pass', 'Global', 'Call']
+        schema = Schema('KeywordNames', [
+            Interface('Main', [Method(name, [(string, 'call')], void)
+                               for name in names])])
+        runtime = SchemaRuntime(schema)
+        proxy = runtime.proxy_classes[schema.main_type](RecordingBridge())
+        for name in names:
+            method = getattr(type(proxy), name.lower()).function
+            self.assertEqual(name.lower(), method.__name__)
+            self.assertEqual('MainProxy.' + name.lower(), method.__qualname__)
+            getattr(proxy, name.lower())('x')
+        self.assertEqual([(name, ('x',)) for name in names], calls)
+
+    def test_corked_writer_thread(self):
+        stream = RecordingStream()
+        sender = Sender(self.schema, stream, lambda obj, typ=None: 1,
+                        cork_interval=60, writer_thread=True)
+        sender.noop()
+        sender.noop()
+        time.sleep(0.05)
+        self.assertEqual([], stream.writes)
+        sender.disconnect()
+        sender.flush()
+        self.assertEqual([NOOP + NOOP + DISCONNECT], stream.writes)
+        sender.noop()
+        sender.flush()
+        self.assertEqual([NOOP + NOOP + DISCONNECT, NOOP], stream.writes)
+        sender.close()
+
+    def test_failed_write(self):
+        class FailingStream(RecordingStream):
+            def write(self, data):
+                raise OSError('Broken pipe')
+
+        failures = []
+        sender = Sender(self.schema, FailingStream(), lambda obj, typ=None: 1,
+                        writer_thread=True)
+        sender.write_failed = failures.append
+        sender.noop()
+        sender.writer_thread.join(5)
+        self.assertIsInstance(failures[0], OSError)
+        with self.assertRaises(ConnectionClosed):
+            sender.noop()
+        client_bridge = Bridge(self.schema, self.stream1, FailingStream(), None, None)
+        client_bridge.mainloop_thread.start()
+        with self.assertRaises(ConnectionClosed):
+            client_bridge.server.get_first_user()
+        with self.assertRaises(ConnectionClosed):
+            client_bridge.server.get_first_user()
+        self.assertEqual(0, len(client_bridge.receiver.method_returns))
+        self.stream1.write(ACKNOWLEDGE_DISCONNECT)
+        client_bridge.mainloop_thread.join(5)
+
+    def test_single_write_per_message(self):
+        stream = RecordingStream()
+        sender = Sender(self.schema, stream, lambda obj, typ=None: 1)
+        add_friend = [m for m in self.schema.type_schemas.User.methods if m.name == 'AddFriend'][0]
+        sender.call_method(add_friend, object(), (object(), 1.5))
+        sender.return_method(1, string, 'Brian')
+        sender.disconnect()
+        self.assertEqual(3, len(stream.writes))
+        self.assertEqual(3, stream.flushes)
+
+    def test_corked_sender(self):
+        stream = RecordingStream()
+        sender = Sender(self.schema, stream, lambda obj, typ=None: 1, cork_interval=60)
+        sender.noop()
+        sender.noop()
+        self.assertEqual(0, len(stream.writes))
+        sender.flush()
+        self.assertEqual([NOOP + NOOP], stream.writes)
+        sender.noop()
+        sender.disconnect()
+        self.assertEqual([NOOP + NOOP, NOOP + DISCONNECT], stream.writes)
+
+    def test_writer_thread(self):
+        stream = RecordingStream()
+        sender = Sender(self.schema, stream, lambda obj, typ=None: 1, writer_thread=True)
+        for i in range(100):
+            sender.noop()
+        sender.flush()
+        self.assertEqual(NOOP * 100, b''.join(stream.writes))
+        self.assertLessEqual(len(stream.writes), 100)
+        sender.close()
+        sender.writer_thread.join(5)
+        self.assertFalse(sender.writer_thread.is_alive())
+        sender.disconnect()
+        self.assertEqual(DISCONNECT, stream.writes[-1])
+
+    def test_concurrent_callers(self):
+        main = MainImpl()
+        server_bridge = Bridge(self.schema, self.stream2, self.stream1, main, None)
+        server_bridge.mainloop_thread.start()
+        with Bridge(self.schema, self.stream1, self.stream2, None, None) as client_bridge:
+            first_user = client_bridge.server.get_first_user()
+            results = []
+            def call_repeatedly():
+                results.extend(first_user.get_age() for i in range(50))
+            threads = [threading.Thread(target=call_repeatedly) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+            self.assertEqual([main.first_user.age] * 400, results)
+            request_ids = set()
+            def allocate_request_ids():
+                request_ids.update(client_bridge.receiver.register_call(void)[0] for i in range(1000))
+            threads = [threading.Thread(target=allocate_request_ids) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+            self.assertEqual(8000, len(request_ids))
 
     def test_unknown_command(self):
         from io import BytesIO
@@ -96,6 +745,31 @@ class TestCommunication(unittest.TestCase):
         with self.assertRaises(UnknownCommand):
             receiver.mainloop()
 
+    def test_end_of_stream(self):
+        from io import BytesIO
+        receiver = Receiver(self.schema, BytesIO(NOOP), None, None, None, None)
+        _, pending = receiver.method_returns.register(None)
+        receiver.mainloop()
+        self.assertIsInstance(pending.exception(), ConnectionClosed)
+        receiver = Receiver(self.schema, BytesIO(NOOP + b'\x05\x00'), None, None, None, None)
+        with self.assertRaises(WrongNumberOfBytesRead), self.assertLogs(level='ERROR'):
+            receiver.mainloop()
+
+    def test_unknown_method_reference(self):
+        from io import BytesIO
+        from remcall.communication.base import CALL_METHOD
+        runtime = SchemaRuntime.for_schema(self.schema)
+        data = CALL_METHOD + runtime.compiled.call_header.pack(7, 999)
+        raised = []
+        receiver = Receiver(self.schema, BytesIO(data), None, None, None, None,
+                            raise_method_error=lambda *args: raised.append(args))
+        with self.assertLogs(level='ERROR'):
+            with self.assertRaises(UnknownMethodReference):
+                receiver.process_next()
+        (request_id, ex), = raised
+        self.assertEqual(7, request_id)
+        self.assertIsInstance(ex, UnknownMethodReference)
+
 
 if __name__ == '__main__':
     unittest.main()
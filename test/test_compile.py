@@ -0,0 +1,204 @@
+import unittest
+import io
+from array import array
+from remcall.schema import Schema, Enum, Record, Interface, Method, Array, \
+                           string, \
+                           int8, uint8, int16, uint16, uint32, int64, \
+                           float64, void
+from remcall.codec.compile import CompiledSchema, FixedWidthRun, \
+                                  StringValue, BytesArrayValue, \
+                                  FixedWidthArrayValue, ArrayValue, \
+                                  RecordValue
+from remcall.implementation import EnumRecordImplementation
+from remcall.naming import PythonNameConverter
+from remcall.communication.base import CALL_METHOD
+
+Color = Enum('Color', ['Red', 'Green', 'Blue'])
+Point = Record('Point', [(int16, 'X'), (int16, 'Y'), (Color, 'Color')])
+Shape = Record('Shape', [(string, 'Name'), (Point, 'Center'),
+                         (Array(Point), 'Corners')])
+Main = Interface('Main', [
+    Method('Paint', [(Color, 'color'), (uint16, 'x'), (uint16, 'y')], void),
+    Method('Label', [(int8, 'size'), (string, 'text'), (float64, 'angle')],
+           uint32)
+])
+SCHEMA = Schema('CompileSchema', [Main, Color, Point, Shape])
+IMPLEMENTATION = EnumRecordImplementation(SCHEMA, PythonNameConverter())
+
+
+class Context:
+    def __init__(self, data=b''):
+        self.stream = io.BytesIO(data)
+        self.reads = 0
+
+    def get_id_for_object(self, obj, typ=None):
+        return 1
+
+    def get_object(self, oid, typ):
+        return (oid, typ)
+
+    def get_enum_implementation(self, typ):
+        if isinstance(typ, Record):
+            return IMPLEMENTATION(typ)
+        return lambda value: typ.values[value]
+
+    def read_from_stream(self, bytes_count):
+        self.reads += 1
+        return self.stream.read(bytes_count)
+
+    def read_struct(self, s):
+        return s.unpack(self.read_from_stream(s.size))
+
+
+class ColorValue:
+    def __init__(self, value):
+        self.value = value
+
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        self.compiled = CompiledSchema(SCHEMA)
+
+    def codec(self, name):
+        for codec in self.compiled.by_method.values():
+            if codec.method.name == name:
+                return codec
+
+    def test_fixed_width_method_uses_single_run(self):
+        codec = self.codec('Paint')
+        self.assertEqual(1, len(codec.call_encoder.steps))
+        self.assertEqual(1, len(codec.call_decoder.steps))
+        self.assertIsInstance(codec.call_decoder.steps[0], FixedWidthRun)
+        values = [CALL_METHOD, 7, codec.method_ref, object(),
+                  ColorValue(2), 3, 4]
+        encoded = codec.call_encoder.encode(Context(), values, bytearray())
+        self.assertEqual(1 + 4 + 2 + 4 + 1 + 2 + 2, len(encoded))
+        context = Context(bytes(encoded[7:]))
+        decoded = codec.call_decoder.decode(context)
+        self.assertEqual([(1, Main), 'Blue', 3, 4], decoded)
+        self.assertEqual(1, context.reads)
+
+    def test_variable_width_method(self):
+        codec = self.codec('Label')
+        self.assertEqual([FixedWidthRun, StringValue, FixedWidthRun],
+                         [type(step) for step in codec.call_decoder.steps])
+        values = [CALL_METHOD, 8, codec.method_ref, object(),
+                  -3, 'Hällo', 1.5]
+        encoded = codec.call_encoder.encode(Context(), values, bytearray())
+        decoded = codec.call_decoder.decode(Context(bytes(encoded[7:])))
+        self.assertEqual([(1, Main), -3, 'Hällo', 1.5], decoded)
+
+    def roundtrip(self, typ, value):
+        codec = self.compiled.value_codec(typ)
+        encoded = codec.encode(Context(), [value], bytearray())
+        return encoded, codec.decode(Context(bytes(encoded)))[0]
+
+    def test_bytes_array(self):
+        self.assertIsInstance(self.compiled.value_codec(Array(uint8)).steps[0],
+                              BytesArrayValue)
+        data = bytes(range(256)) * 4
+        encoded, decoded = self.roundtrip(Array(uint8), memoryview(data))
+        self.assertEqual(b'\x00\x00\x04\x00' + data, encoded)
+        self.assertEqual(data, decoded)
+
+    def test_numeric_array(self):
+        self.assertIsInstance(self.compiled.value_codec(Array(int16)).steps[0],
+                              FixedWidthArrayValue)
+        encoded, decoded = self.roundtrip(Array(int16), [1, -2, 3])
+        self.assertEqual(b'\x00\x00\x00\x03\x00\x01\xff\xfe\x00\x03',
+                         encoded)
+        self.assertEqual([1, -2, 3], list(decoded))
+        values = array('d', [0.5, -1.25, 1e300])
+        encoded, decoded = self.roundtrip(Array(float64), values)
+        self.assertEqual(values, decoded)
+        encoded, decoded = self.roundtrip(Array(int64), [-2**63, 2**63-1])
+        self.assertEqual([-2**63, 2**63-1], list(decoded))
+
+    def test_enum_and_object_arrays(self):
+        encoded, decoded = self.roundtrip(Array(Color),
+                                          [ColorValue(2), ColorValue(0)])
+        self.assertEqual(['Blue', 'Red'], decoded)
+        encoded, decoded = self.roundtrip(Array(Main), [object(), object()])
+        self.assertEqual([(1, Main), (1, Main)], decoded)
+
+    def test_string_array(self):
+        self.assertIsInstance(self.compiled.value_codec(Array(string)).steps[0],
+                              ArrayValue)
+        encoded, decoded = self.roundtrip(Array(string), ['a', '', 'bc'])
+        self.assertEqual(['a', '', 'bc'], decoded)
+
+    def test_fixed_width_record(self):
+        step = self.compiled.value_codec(Point).steps[0]
+        self.assertIsInstance(step, RecordValue)
+        self.assertTrue(step.is_fixed_width)
+        PointImpl = IMPLEMENTATION(Point)
+        encoded, decoded = self.roundtrip(Point, PointImpl(-1, 2, ColorValue(1)))
+        self.assertEqual(b'\xff\xff\x00\x02\x01', encoded)
+        self.assertIsInstance(decoded, PointImpl)
+        self.assertEqual((-1, 2, 'Green'), decoded._field_values())
+
+    def test_nested_record(self):
+        self.assertFalse(self.compiled.value_codec(Shape).steps[0]
+                         .is_fixed_width)
+        PointImpl = IMPLEMENTATION(Point)
+        ShapeImpl = IMPLEMENTATION(Shape)
+        shape = ShapeImpl(name='Square',
+                          center=PointImpl(0, 0, ColorValue(0)),
+                          corners=[PointImpl(x, y, ColorValue(2))
+                                   for x, y in ((1, 1), (1, -1))])
+        encoded, decoded = self.roundtrip(Shape, shape)
+        self.assertEqual('Square', decoded.name)
+        self.assertEqual((0, 0, 'Red'), decoded.center._field_values())
+        self.assertEqual([(1, 1, 'Blue'), (1, -1, 'Blue')],
+                         [p._field_values() for p in decoded.corners])
+
+    def test_record_classes(self):
+        PointImpl = IMPLEMENTATION(Point)
+        point = PointImpl(1, y=2, color='Red')
+        self.assertFalse(hasattr(point, '__dict__'))
+        self.assertEqual(('x', 'y', 'color'), PointImpl._fields)
+        self.assertEqual(PointImpl(1, 2, 'Red'), point)
+        self.assertNotEqual(PointImpl(1, 3, 'Red'), point)
+        self.assertEqual("Point(x=1, y=2, color='Red')", repr(point))
+        self.assertEqual(point, PointImpl._from_field_values((1, 2, 'Red')))
+        point.x = 5
+        self.assertEqual((5, 2, 'Red'), point._field_values())
+        with self.assertRaises(TypeError):
+            PointImpl(1, 2)
+
+    def test_immutable_records(self):
+        implementation = EnumRecordImplementation(SCHEMA, PythonNameConverter(),
+                                                  immutable_records=True)
+        PointImpl = implementation(Point)
+        point = PointImpl(-1, 2, ColorValue(1))
+        self.assertEqual(-1, point.x)
+        with self.assertRaises(AttributeError):
+            point.x = 5
+        self.assertEqual(hash(PointImpl(1, 2, 'Red')),
+                         hash(PointImpl(1, 2, 'Red')))
+        codec = self.compiled.value_codec(Point)
+        encoded = codec.encode(Context(), [point], bytearray())
+        self.assertEqual(b'\xff\xff\x00\x02\x01', encoded)
+        context = Context(bytes(encoded))
+        context.get_enum_implementation = lambda typ: implementation(typ) \
+            if isinstance(typ, Record) else typ.values.__getitem__
+        decoded = codec.decode(context)[0]
+        self.assertEqual(PointImpl(-1, 2, 'Green'), decoded)
+        self.assertEqual("Point(x=-1, y=2, color='Green')", repr(decoded))
+
+    def test_return_encoder(self):
+        encoder = self.compiled.return_encoder(uint32)
+        encoded = encoder.encode(Context(), [b'\x06', 9, 2**32-1],
+                                 bytearray())
+        self.assertEqual(b'\x06\x00\x00\x00\x09\xff\xff\xff\xff', encoded)
+        void_encoder = self.compiled.return_encoder(void)
+        encoded = void_encoder.encode(Context(), [b'\x06', 9, None],
+                                      bytearray())
+        self.assertEqual(b'\x06\x00\x00\x00\x09', encoded)
+        self.assertEqual([None], self.compiled.value_codec(void)
+                                     .decode(Context()))
+
+
+if __name__ == '__main__':
+    unittest.main()
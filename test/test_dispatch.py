@@ -0,0 +1,51 @@
+import unittest
+from remcall.communication.dispatch import DispatchTable
+from remcall.error import MethodNotAvailable
+from remcall.naming import PythonNameConverter
+from test.test_communication import SCHEMA, UserImpl, ClientUserImpl
+
+
+class DynamicUserImpl:
+    def __getattr__(self, name):
+        if name == 'get_age':
+            return lambda: 99
+        raise AttributeError(name)
+
+
+class TestDispatchTable(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatch = DispatchTable(SCHEMA, PythonNameConverter())
+        self.User = SCHEMA.type_schemas.User
+        self.methods = {method.name: method for method in self.User.methods}
+
+    def test_lookup(self):
+        user = UserImpl('Brian', 29)
+        get_age = self.dispatch.lookup(user, self.methods['GetAge'])
+        self.assertEqual(29, get_age())
+        self.assertIs(UserImpl.get_age,
+                      self.dispatch.functions[UserImpl, self.methods['GetAge']])
+        self.dispatch.lookup(user, self.methods['SetName'])('Bob')
+        self.assertEqual('Bob', user.name)
+        with self.assertRaises(MethodNotAvailable):
+            self.dispatch.lookup(ClientUserImpl(), self.methods['GetName'])
+
+    def test_dynamic_lookup(self):
+        user = DynamicUserImpl()
+        self.assertEqual(99, self.dispatch.lookup(user, self.methods['GetAge'])())
+        with self.assertRaises(MethodNotAvailable):
+            self.dispatch.lookup(user, self.methods['GetName'])
+
+    def test_check(self):
+        with self.assertLogs(level='WARN') as cm:
+            self.dispatch.check(ClientUserImpl(), self.User)
+            self.dispatch.check(ClientUserImpl(), self.User)
+        self.assertEqual(1, len(cm.output))
+        self.assertIn('get_name', cm.output[0])
+        self.assertNotIn('get_age', cm.output[0])
+        self.dispatch.check(UserImpl('Brian', 29), self.User)
+        self.assertIn((UserImpl, self.User), self.dispatch.checked)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from threading import Event
+from remcall.communication.executor import CallExecutor, blocking
+from remcall.error import CallRejected
+
+
+class TestCallExecutor(unittest.TestCase):
+
+    def test_results_and_metrics(self):
+        executor = CallExecutor(max_workers=2)
+        futures = [executor.submit(pow, 2, i) for i in range(10)]
+        self.assertEqual([2**i for i in range(10)],
+                         [future.result(5) for future in futures])
+        self.assertEqual(10, executor.submitted)
+        self.assertEqual(0, executor.queue_depth)
+        executor.shutdown()
+
+    def test_exception(self):
+        executor = CallExecutor()
+        future = executor.submit(int, 'not a number')
+        self.assertIsInstance(future.exception(5), ValueError)
+        executor.shutdown()
+
+    def test_rejection(self):
+        executor = CallExecutor(max_workers=1, max_queue_size=1)
+        release = Event()
+        started = Event()
+
+        def wait():
+            started.set()
+            release.wait(5)
+        running = executor.submit(wait)
+        self.assertTrue(started.wait(5))
+        queued = executor.submit(pow, 2, 3)
+        self.assertEqual(1, executor.queue_depth)
+        with self.assertRaises(CallRejected):
+            executor.submit(pow, 2, 4)
+        self.assertEqual(1, executor.rejected)
+        release.set()
+        running.result(5)
+        self.assertEqual(8, queued.result(5))
+        executor.shutdown()
+
+    def test_blocked_worker_frees_slot(self):
+        executor = CallExecutor(max_workers=1)
+
+        def outer():
+            inner = executor.submit(pow, 3, 2)
+            with blocking():
+                return inner.result(5)
+        self.assertEqual(9, executor.submit(outer).result(5))
+        self.assertEqual(0, executor.blocked)
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from concurrent.futures import Future
+from itertools import count
+from remcall.communication.pending import PendingCalls, REQUEST_ID_LIMIT
+from remcall.error import DuplicateRegistrationForMethodReturn, \
+                          MissingMethodReturnValueEvent
+from remcall.schema import uint32, string
+
+
+class TestPendingCalls(unittest.TestCase):
+
+    def setUp(self):
+        self.pending = PendingCalls(Future)
+
+    def test_register_and_resolve(self):
+        request_id, future = self.pending.register(uint32)
+        self.assertIn(request_id, self.pending)
+        self.assertEqual((future, uint32), self.pending[request_id])
+        self.pending.resolve(request_id, 42)
+        self.assertEqual(42, future.result(0))
+        self.assertEqual(0, len(self.pending))
+        with self.assertRaises(MissingMethodReturnValueEvent):
+            self.pending[request_id]
+
+    def test_duplicate_registration(self):
+        request_id, future = self.pending.register(uint32)
+        with self.assertRaises(DuplicateRegistrationForMethodReturn):
+            self.pending.register(uint32, request_id)
+
+    def test_cancel(self):
+        request_id, future = self.pending.register(string)
+        self.assertTrue(future.cancel())
+        self.assertEqual((None, string), self.pending[request_id])
+        self.pending.resolve(request_id, 'late')
+        self.assertEqual(0, len(self.pending))
+
+    def test_wraparound_skips_pending_ids(self):
+        self.pending._request_ids = count(REQUEST_ID_LIMIT - 1)
+        first, _ = self.pending.register(uint32)
+        self.assertEqual(REQUEST_ID_LIMIT - 1, first)
+        self.pending.register(uint32, 0)
+        self.pending.register(uint32, 1)
+        second, _ = self.pending.register(uint32)
+        self.assertEqual(2, second)
+
+    def test_wraparound_skips_zero(self):
+        self.pending._request_ids = count(REQUEST_ID_LIMIT - 1)
+        self.pending.register(uint32)
+        request_id, _ = self.pending.register(uint32)
+        self.assertEqual(1, request_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,6 +61,12 @@ class TestSchema(unittest.TestCase):
         with self.assertRaises(AssertionError):
             Record('r', [(void, 'field')])
 
+    def test_oneway_method(self):
+        method = Method('Notify', [(string, 'message')], void, oneway=True)
+        self.assertEqual('oneway void Notify(string message);', str(method))
+        with self.assertRaises(AssertionError):
+            Method('m', [], string, oneway=True)
+
     def test_too_many_enum_values(self):
         Enum('e', ['value{}'.format(i) for i in range(256)])
         with self.assertRaises(AssertionError):
@@ -110,6 +116,21 @@ class TestSchema(unittest.TestCase):
         with self.assertRaises(AssertionError):
             writer.write_name('123') # bad first char '1'
 
+    def test_freeze(self):
+        schema = Schema('MySchema', USER_SCHEMA.types)
+        self.assertFalse(schema.is_frozen)
+        self.assertIsNot(schema.type_table, schema.type_table)
+        method_lookup = schema.method_lookup
+        self.assertIs(schema, schema.freeze())
+        self.assertTrue(schema.is_frozen)
+        self.assertIs(schema.type_table, schema.type_table)
+        self.assertIs(schema.method_lookup, schema.method_lookup)
+        self.assertEqual(method_lookup, schema.method_lookup)
+        for method_ref, method in schema.method_lookup.items():
+            self.assertEqual(method_ref, schema.method_table[method])
+            self.assertIn(method, schema.method_to_interface[method_ref].methods)
+        self.assertEqual(schema_to_bytes(USER_SCHEMA), schema_to_bytes(schema))
+
     def test_int_type_writing(self):
         import struct
         stream = io.BytesIO()
@@ -0,0 +1,127 @@
+import unittest
+from remcall.communication.store import ObjectIdAllocator, ReferenceStore, \
+                                      IdStore
+from remcall.error import StaleObjectReference, ObjectIdsExhausted, \
+                          UnknownImplementationObjectReference
+
+
+class Impl:
+    pass
+
+
+class Equal:
+    def __eq__(self, other):
+        return isinstance(other, Equal)
+
+    __hash__ = None
+
+
+class TestIdStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = IdStore()
+
+    def test_identity(self):
+        first, second = Equal(), Equal()
+        self.store[1] = first
+        self.store[-2] = second
+        self.assertEqual(2, len(self.store))
+        self.assertEqual(1, self.store.get_id_for_object(first))
+        self.assertEqual(-2, self.store.get_id_for_object(second))
+        self.assertIs(second, self.store[-2])
+        self.assertNotIn(2, self.store)
+        self.store.delete_object(first)
+        self.assertFalse(self.store.contains_object(first))
+        self.assertNotIn(1, self.store)
+        with self.assertRaises(KeyError):
+            self.store[1]
+        self.assertEqual(1, len(self.store))
+
+    def test_replace_slot(self):
+        first, second = Impl(), Impl()
+        self.store[3] = first
+        self.store[-3] = second
+        self.assertNotIn(3, self.store)
+        self.assertFalse(self.store.contains_object(first))
+        self.assertIs(second, self.store[-3])
+
+    def test_memory_usage(self):
+        empty = self.store.memory_usage()
+        objects = [Impl() for _ in range(1000)]
+        for key, obj in enumerate(objects, 1):
+            self.store[key] = obj
+        self.assertGreater(self.store.memory_usage(), empty)
+        self.assertLess(self.store.memory_usage(), 200 * len(objects))
+
+
+class TestObjectIdAllocator(unittest.TestCase):
+
+    def test_ids_fit_into_bytes_object_ref(self):
+        allocator = ObjectIdAllocator(1, 1)
+        ids = [allocator.allocate() for _ in range(allocator.max_slot)]
+        self.assertEqual(list(range(1, 128)), ids)
+        with self.assertRaises(ObjectIdsExhausted):
+            allocator.allocate()
+        allocator = ObjectIdAllocator(1, 1, generation_bits=2)
+        self.assertEqual(31, allocator.max_slot)
+        allocator = ObjectIdAllocator(-1, 1)
+        ids = [allocator.allocate() for _ in range(allocator.max_slot)]
+        self.assertTrue(all(-128 <= i < 0 for i in ids))
+
+    def test_released_ids_are_reused_with_new_generation(self):
+        allocator = ObjectIdAllocator(1, 2, generation_bits=4)
+        first, second = allocator.allocate(), allocator.allocate()
+        allocator.release(first)
+        self.assertTrue(allocator.is_stale(first))
+        self.assertFalse(allocator.is_stale(second))
+        reused = allocator.allocate()
+        self.assertNotEqual(first, reused)
+        self.assertEqual(allocator.split(first)[0], allocator.split(reused)[0])
+        self.assertLess(reused, 1 << 15)
+        self.assertTrue(allocator.is_stale(first))
+        self.assertFalse(allocator.is_stale(reused))
+
+    def test_generation_wraps_around(self):
+        allocator = ObjectIdAllocator(1, 1, generation_bits=1)
+        key = allocator.allocate()
+        allocator.release(key)
+        allocator.release(allocator.allocate())
+        self.assertEqual(key, allocator.allocate())
+
+
+class TestReferenceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ReferenceStore(False, None, bytes_object_ref=1,
+                                    generation_bits=2)
+
+    def test_release_and_reuse(self):
+        impl = Impl()
+        key = self.store.get_id_for_object(impl)
+        self.assertIs(impl, self.store.get_implementation_object(key))
+        self.store.release_objects([(key, 1)])
+        with self.assertRaises(StaleObjectReference):
+            self.store.get_implementation_object(key)
+        other = Impl()
+        other_key = self.store.get_id_for_object(other)
+        self.assertNotEqual(key, other_key)
+        with self.assertRaises(StaleObjectReference):
+            self.store.get_implementation_object(key)
+        self.assertIs(other, self.store.get_implementation_object(other_key))
+
+    def test_unknown_reference(self):
+        with self.assertRaises(UnknownImplementationObjectReference) as cm:
+            self.store.get_implementation_object(5)
+        self.assertNotIsInstance(cm.exception, StaleObjectReference)
+
+    def test_exhaustion(self):
+        impls = [Impl() for _ in range(self.store.object_ids.max_slot)]
+        keys = [self.store.get_id_for_object(impl) for impl in impls]
+        with self.assertRaises(ObjectIdsExhausted):
+            self.store.get_id_for_object(Impl())
+        self.store.release_objects([(keys[0], 1)])
+        self.store.get_id_for_object(Impl())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import io
+import struct
+from remcall.codec.read import StreamBuffer
+from remcall.error import WrongNumberOfBytesRead
+from remcall.util import QueueStream
+
+
+class TrickleStream(io.RawIOBase):
+    '''Returns at most two bytes per read like a slow socket would'''
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(2, len(b), len(self.data) - self.pos)
+        b[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+class ReadOnlyStream:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size):
+        return self.stream.read(size)
+
+
+class TestStreamBuffer(unittest.TestCase):
+
+    def test_partial_reads(self):
+        data = struct.pack('!IqH', 7, -3, 5) + b'abc'
+        buffer = StreamBuffer(TrickleStream(data), 8)
+        self.assertEqual((7, -3, 5), buffer.unpack(struct.Struct('!IqH')))
+        self.assertEqual(b'abc', buffer.read(3))
+
+    def test_large_read(self):
+        data = bytes(range(256)) * 10
+        buffer = StreamBuffer(TrickleStream(b'\x01' + data), 16)
+        self.assertEqual(b'\x01', buffer.read(1))
+        self.assertEqual(data, buffer.read(len(data)))
+
+    def test_stream_without_readinto(self):
+        buffer = StreamBuffer(ReadOnlyStream(b'\x00\x00\x00\x02xy'))
+        self.assertEqual((2,), buffer.unpack(struct.Struct('!I')))
+        self.assertEqual(b'xy', buffer.read(2))
+
+    def test_queue_stream(self):
+        stream = QueueStream()
+        stream.write(b'\x00\x01remcall')
+        buffer = StreamBuffer(stream)
+        self.assertEqual((1,), buffer.unpack(struct.Struct('!H')))
+        self.assertEqual(b'remcall', buffer.read(7))
+
+    def test_exhausted_stream(self):
+        buffer = StreamBuffer(io.BytesIO(b'123'))
+        with self.assertRaises(WrongNumberOfBytesRead):
+            buffer.read(4)
+
+
+if __name__ == '__main__':
+    unittest.main()